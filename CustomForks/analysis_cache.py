@@ -0,0 +1,404 @@
+# analysis_cache.py
+#
+# 代码分析结果的磁盘缓存 (configure_analysis_cache 打开)。
+#
+# FusionPlanCache 只在进程内缓存，每次运行 benchmark.py 都要把所有合约重新分析一遍。
+# 这里把计划表 (融合规则的匹配结果、预解码的立即数、常量折叠/函数分派器/静态跳转/溢出检查/mapping 访问的 operand)、
+# JUMPDEST 位图和基本块表按 code hash 写进缓存目录，下次运行直接读出来。
+#
+# 分析结果取决于启用的规则、predecode_push、fork 的静态 gas，以及做分析的这些模块本身的代码，
+# 这些信息合起来算出一个指纹，不同指纹的分析结果放在不同的子目录里:
+# 规则配置或者分析/融合的实现一变，旧的缓存自然不会再被读到。
+#
+# 文件格式 (小端、定长字段，用 mmap 读取，各段按头部记录的偏移随机访问):
+#   头部   HEADER: 魔数、格式版本、标志位、代码长度、各段的条目数与偏移
+#   位图段 JUMPDEST 位图，(代码长度 + 7) // 8 字节，第 pc 位表示 pc 是合法的跳转目标
+#   条目段 计划表里所有不是普通指令的条目，每个 ENTRY: pc、next_pc、操作码 ID、规则 ID、operand 的类型与位置
+#   数据段 各条目 operand 的编码 (见 _encode_operand)
+#   块段   基本块表里所有块入口，每个 BLOCK: pc、静态 gas 之和、最小栈深度、最大栈增长
+#
+# 信任模型: 文件里只有整数和字节串，读取时不 unpickle、不 exec 任何内容。
+# 读取时校验魔数、版本、代码长度、各段的边界、PC 范围、跳转目标和规则 ID，
+# 任何一项对不上都当作没有缓存 (重新分析后覆盖)。
+# 这些校验挡住的是损坏和过期的文件，不是刻意伪造的文件: 改动过的 gas 或位图仍然会改变执行结果，
+# 所以缓存目录应当只有运行者自己可写。
+#
+# 翻译好的函数、trace、溢出检查的合成函数这类 Python 函数不写进缓存:
+# 溢出检查只记录跳转目标和 fallthrough_pc，mapping 访问只记录是否包括 SLOAD (融合范围就是条目的 next_pc)，
+# 读出时按代码重新合成 (CheckedArithmeticMatcher.rebuild、StorageMappingMatcher.rebuild)。
+
+import mmap
+import os
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from eth.abc import OpcodeAPI
+from eth_hash.auto import keccak
+
+from checked_arithmetic import CheckedArithmetic, CheckedArithmeticMatcher
+from fusion_synthesizer import PUSH0_OPCODE
+from jumpdest_bitmap import is_jump_destination
+from rule_compiler import PUSH32_OPCODE, push_data_size
+from selector_dispatch import SelectorDispatch
+from static_jumps import StaticJump
+from storage_mapping import StorageMapping, StorageMappingMatcher
+
+
+# 缓存格式的版本，文件格式、计划表或块表的结构变化时加一，旧的缓存自然失效
+ANALYSIS_CACHE_VERSION = 5
+
+CACHE_MAGIC = b"FPAC"
+
+# 分析结果依赖的模块: 这些文件的内容计入指纹，改动任何一个都会换一个缓存子目录
+ANALYSIS_SOURCE_MODULES = (
+    "analysis_cache.py",
+    "basic_blocks.py",
+    "checked_arithmetic.py",
+    "constant_folding.py",
+    "fused_logic.py",
+    "fusion_plan.py",
+    "fusion_synthesizer.py",
+    "jumpdest_bitmap.py",
+    "predecoded_ops.py",
+    "rule_compiler.py",
+    "selector_dispatch.py",
+    "static_jumps.py",
+    "storage_mapping.py",
+)
+
+# 头部: 魔数, 版本, 标志位, 代码长度, 条目数, 块数, 位图段偏移, 条目段偏移, 数据段偏移, 数据段长度, 块段偏移
+HEADER = struct.Struct("<4sHHIIIIIIII")
+# 条目: pc, next_pc, 操作码 ID, 规则 ID, operand 类型, operand 在数据段里的偏移和长度
+ENTRY = struct.Struct("<IIIHBII")
+# 块: 入口 pc, 静态 gas 之和, 入口处需要的最小栈深度, 块内的最大栈增长
+BLOCK = struct.Struct("<IQII")
+
+# 标志位: 文件里带有基本块表
+FLAG_HAS_BLOCKS = 0x1
+
+# 条目里表示 None 的 next_pc / 规则 ID
+NO_PC = 0xFFFFFFFF
+NO_RULE = 0xFFFF
+
+# operand 的类型
+OPERAND_NONE = 0
+OPERAND_INT = 1
+OPERAND_FOLDED = 2
+OPERAND_SELECTOR = 3
+OPERAND_STATIC_JUMP = 4
+OPERAND_CHECKED = 5
+OPERAND_MAPPING = 6
+
+# 常量折叠的 operand: 静态 gas 之和, 最大栈增长, 常量个数；之后每个常量是 (类型, 长度) 加上数据
+FOLDED = struct.Struct("<QiH")
+FOLDED_CONSTANT = struct.Struct("<BB")
+CONSTANT_INT = 0
+CONSTANT_BYTES = 1
+# 函数分派器的 operand: 未命中时的 gas, fallthrough_pc, 选择器个数；之后每个选择器是 SELECTOR_TARGET
+SELECTOR = struct.Struct("<QII")
+SELECTOR_TARGET = struct.Struct("<IQI")
+# 静态跳转的 operand: gas, 跳转目标, fallthrough_pc
+STATIC_JUMP = struct.Struct("<QII")
+# 溢出检查的 operand: 跳转目标, fallthrough_pc
+CHECKED = struct.Struct("<II")
+# mapping 访问的 operand: 最后的存储访问指令 (SLOAD / SSTORE)，没有时为 0
+MAPPING = struct.Struct("<B")
+
+# 读出的内容: ({pc: 不是普通指令的计划表条目}, JUMPDEST 位图, 基本块表)，
+# 基本块表还没建过时为 None。计划表里其余位置都是普通指令，由 fusion_plan 补齐
+CachedAnalysis = Tuple[Dict[int, Tuple[int, Optional[int], Optional[int], Any]], bytearray, Optional[Any]]
+
+# 分析模块代码的哈希，每个进程只算一次
+_source_hash: Optional[str] = None
+
+
+def analysis_source_hash() -> str:
+    """ANALYSIS_SOURCE_MODULES 里各个文件内容的哈希 (找不到的文件按缺失计入)。"""
+    global _source_hash
+    if _source_hash is None:
+        directory = os.path.dirname(os.path.abspath(__file__))
+        digest = b""
+        for name in ANALYSIS_SOURCE_MODULES:
+            try:
+                with open(os.path.join(directory, name), "rb") as f:
+                    content = f.read()
+            except OSError:
+                content = b"<missing>"
+            digest = keccak(digest + name.encode("utf-8") + keccak(content))
+        _source_hash = digest.hex()
+    return _source_hash
+
+
+def analysis_fingerprint(rules: List[Dict], predecode_push: bool, opcode_lookup: Dict[int, OpcodeAPI]) -> str:
+    """启用的规则 (按规则 ID 的顺序)、predecode_push、各指令静态 gas 和分析模块代码的指纹。"""
+    rule_summary = [
+        sorted((key, repr(value)) for key, value in rule.items())
+        for rule in rules
+    ]
+    gas_costs = sorted(
+        (opcode, opcode_fn.gas_cost)
+        for opcode, opcode_fn in opcode_lookup.items()
+        if hasattr(opcode_fn, "gas_cost")
+    )
+    payload = repr((ANALYSIS_CACHE_VERSION, rule_summary, predecode_push, gas_costs, analysis_source_hash()))
+    return keccak(payload.encode("utf-8")).hex()[:16]
+
+
+def _rule_operand_kind(rule: Dict) -> int:
+    if rule.get("constant_folding"):
+        return OPERAND_FOLDED
+    if rule.get("selector_dispatch"):
+        return OPERAND_SELECTOR
+    if rule.get("static_jump"):
+        return OPERAND_STATIC_JUMP
+    if rule.get("checked_arithmetic"):
+        return OPERAND_CHECKED
+    if rule.get("storage_mapping"):
+        return OPERAND_MAPPING
+    return OPERAND_NONE
+
+
+def _encode_operand(operand: Any) -> Tuple[int, bytes]:
+    if operand is None:
+        return OPERAND_NONE, b""
+    if isinstance(operand, int):
+        return OPERAND_INT, operand.to_bytes((operand.bit_length() + 7) >> 3, "big")
+    if isinstance(operand, tuple):
+        total_gas, constants, max_growth = operand
+        parts = [FOLDED.pack(total_gas, max_growth, len(constants))]
+        for constant in constants:
+            if isinstance(constant, int):
+                data = constant.to_bytes((constant.bit_length() + 7) >> 3, "big")
+                parts.append(FOLDED_CONSTANT.pack(CONSTANT_INT, len(data)))
+            else:
+                data = constant
+                parts.append(FOLDED_CONSTANT.pack(CONSTANT_BYTES, len(data)))
+            parts.append(data)
+        return OPERAND_FOLDED, b"".join(parts)
+    if isinstance(operand, SelectorDispatch):
+        parts = [SELECTOR.pack(operand.miss_gas, operand.fallthrough_pc, len(operand.targets))]
+        for selector, (gas, dest) in operand.targets.items():
+            parts.append(SELECTOR_TARGET.pack(selector, gas, dest))
+        return OPERAND_SELECTOR, b"".join(parts)
+    if isinstance(operand, StaticJump):
+        return OPERAND_STATIC_JUMP, STATIC_JUMP.pack(operand.gas, operand.dest, operand.fallthrough_pc)
+    if isinstance(operand, CheckedArithmetic):
+        return OPERAND_CHECKED, CHECKED.pack(operand.dest, operand.fallthrough_pc)
+    if isinstance(operand, StorageMapping):
+        return OPERAND_MAPPING, MAPPING.pack(operand.access or 0)
+    raise TypeError(f"cannot cache operand of type {type(operand).__name__}")
+
+
+def encode_analysis(code: bytes, plan: List[Any], jumpdests: bytearray, blocks: Optional[Any]) -> bytes:
+    """把一份代码的分析结果编码成缓存文件的内容。"""
+    entries = []
+    operands = []
+    operand_offset = 0
+    for pc, (opcode, next_pc, rule_id, operand) in enumerate(plan):
+        if next_pc is None and rule_id is None and operand is None:
+            continue
+        kind, data = _encode_operand(operand)
+        entries.append(ENTRY.pack(
+            pc,
+            NO_PC if next_pc is None else next_pc,
+            opcode,
+            NO_RULE if rule_id is None else rule_id,
+            kind,
+            operand_offset,
+            len(data),
+        ))
+        operands.append(data)
+        operand_offset += len(data)
+
+    block_records = []
+    if blocks is not None:
+        for pc, info in enumerate(blocks.entries):
+            if info is not None:
+                block_records.append(BLOCK.pack(pc, *info))
+
+    bitmap_offset = HEADER.size
+    entries_offset = bitmap_offset + len(jumpdests)
+    operands_offset = entries_offset + ENTRY.size * len(entries)
+    blocks_offset = operands_offset + operand_offset
+    header = HEADER.pack(
+        CACHE_MAGIC,
+        ANALYSIS_CACHE_VERSION,
+        FLAG_HAS_BLOCKS if blocks is not None else 0,
+        len(code),
+        len(entries),
+        len(block_records),
+        bitmap_offset,
+        entries_offset,
+        operands_offset,
+        operand_offset,
+        blocks_offset,
+    )
+    return b"".join([header, bytes(jumpdests)] + entries + operands + block_records)
+
+
+class AnalysisDiskCache:
+    """
+    按 code hash 读写一种规则配置 (fingerprint) 下的代码分析结果。
+
+    rules 是生成这些分析结果的规则 (带 rule_id)，读取时用来校验条目的规则 ID、融合操作码 ID 和 operand 类型；
+    block_table 把读出的块入口列表包装成 basic_blocks.BlockTable
+    (这里不导入 basic_blocks 和 fusion_plan，fusion_plan 才能反过来使用这个缓存)；
+    checked_arithmetic、storage_mapping 是启用 CHECKED_ARITHMETIC、STORAGE_MAPPING 时的 matcher，
+    用来按代码重建溢出检查和 mapping 访问的 operand。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        fingerprint: str,
+        rules: List[Dict],
+        block_table: Callable[[List[Optional[Tuple[int, int, int]]]], Any],
+        checked_arithmetic: Optional[CheckedArithmeticMatcher] = None,
+        storage_mapping: Optional[StorageMappingMatcher] = None,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.directory = os.path.join(cache_dir, f"v{ANALYSIS_CACHE_VERSION}-{fingerprint}")
+        # 规则 ID -> (融合操作码 ID, operand 类型)
+        self._rules = {rule["rule_id"]: (rule["fused_opcode_id"], _rule_operand_kind(rule)) for rule in rules}
+        self._block_table = block_table
+        self._checked_arithmetic = checked_arithmetic
+        self._storage_mapping = storage_mapping
+        self.loads = 0
+        self.stores = 0
+
+    def path(self, code_hash: bytes) -> str:
+        return os.path.join(self.directory, f"{code_hash.hex()}.bin")
+
+    def load(self, code_hash: bytes, code: bytes) -> Optional[CachedAnalysis]:
+        """读出 code 的分析结果。文件不存在、损坏、或者与代码对不上时返回 None。"""
+        path = self.path(code_hash)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                cached = self._decode(data, code)
+        except (OSError, ValueError, IndexError, struct.error):
+            # 写到一半的文件等损坏的缓存当作没有，重新分析后会覆盖它
+            return None
+        self.loads += 1
+        return cached
+
+    def _decode(self, data: mmap.mmap, code: bytes) -> CachedAnalysis:
+        (
+            magic, version, flags, code_len, entry_count, block_count,
+            bitmap_offset, entries_offset, operands_offset, operands_size, blocks_offset,
+        ) = HEADER.unpack_from(data, 0)
+        if magic != CACHE_MAGIC or version != ANALYSIS_CACHE_VERSION or code_len != len(code):
+            raise ValueError("analysis cache header does not match")
+        bitmap_size = (code_len + 7) >> 3
+        if (
+            bitmap_offset != HEADER.size
+            or entries_offset != bitmap_offset + bitmap_size
+            or operands_offset != entries_offset + ENTRY.size * entry_count
+            or blocks_offset != operands_offset + operands_size
+            or len(data) != blocks_offset + BLOCK.size * block_count
+        ):
+            raise ValueError("analysis cache sections are inconsistent")
+
+        jumpdests = bytearray(data[bitmap_offset:entries_offset])
+        operands = data[operands_offset:blocks_offset]
+
+        entries = {}
+        for index in range(entry_count):
+            pc, next_pc, opcode, rule_id, kind, offset, size = ENTRY.unpack_from(data, entries_offset + ENTRY.size * index)
+            if pc >= code_len or offset + size > operands_size:
+                raise ValueError("analysis cache entry out of range")
+            next_pc = None if next_pc == NO_PC else next_pc
+            # 代码末尾被截断的 PUSH 的立即数可以越过代码结尾
+            if next_pc is not None and not pc < next_pc <= code_len + push_data_size(PUSH32_OPCODE):
+                raise ValueError("analysis cache entry out of range")
+            raw = operands[offset:offset + size]
+            if rule_id == NO_RULE:
+                # 预解码的 PUSH: 操作码必须就是代码里的 PUSH，立即数不超过它的宽度
+                if (
+                    kind != OPERAND_INT
+                    or opcode != code[pc]
+                    or not PUSH0_OPCODE <= opcode <= PUSH32_OPCODE
+                    or next_pc != pc + 1 + push_data_size(opcode)
+                    or size > push_data_size(opcode)
+                ):
+                    raise ValueError("analysis cache entry does not match the code")
+                entries[pc] = (opcode, next_pc, None, int.from_bytes(raw, "big"))
+                continue
+            if self._rules.get(rule_id) != (opcode, kind):
+                raise ValueError("analysis cache entry does not match the rules")
+            entries[pc] = (opcode, next_pc, rule_id, self._decode_operand(kind, raw, code, pc, next_pc, jumpdests))
+
+        blocks = None
+        if flags & FLAG_HAS_BLOCKS:
+            block_entries: List[Optional[Tuple[int, int, int]]] = [None] * code_len
+            for index in range(block_count):
+                pc, total, depth, growth = BLOCK.unpack_from(data, blocks_offset + BLOCK.size * index)
+                if pc >= code_len:
+                    raise ValueError("analysis cache block out of range")
+                block_entries[pc] = (total, depth, growth)
+            blocks = self._block_table(block_entries)
+        elif block_count:
+            raise ValueError("analysis cache sections are inconsistent")
+
+        return entries, jumpdests, blocks
+
+    def _decode_operand(
+        self, kind: int, raw: bytes, code: bytes, pc: int, next_pc: Optional[int], jumpdests: bytearray
+    ) -> Any:
+        code_len = len(code)
+        if kind == OPERAND_NONE:
+            if raw:
+                raise ValueError("analysis cache operand has trailing data")
+            return None
+        if kind == OPERAND_FOLDED:
+            total_gas, max_growth, count = FOLDED.unpack_from(raw, 0)
+            offset = FOLDED.size
+            constants = []
+            for _ in range(count):
+                constant_kind, size = FOLDED_CONSTANT.unpack_from(raw, offset)
+                offset += FOLDED_CONSTANT.size
+                value = bytes(raw[offset:offset + size])
+                if len(value) != size or size > 32 or constant_kind not in (CONSTANT_INT, CONSTANT_BYTES):
+                    raise ValueError("analysis cache constant out of range")
+                offset += size
+                constants.append(int.from_bytes(value, "big") if constant_kind == CONSTANT_INT else value)
+            if offset != len(raw):
+                raise ValueError("analysis cache operand has trailing data")
+            return total_gas, tuple(constants), max_growth
+        if kind == OPERAND_SELECTOR:
+            miss_gas, fallthrough_pc, count = SELECTOR.unpack_from(raw, 0)
+            if len(raw) != SELECTOR.size + SELECTOR_TARGET.size * count or fallthrough_pc > code_len:
+                raise ValueError("analysis cache operand out of range")
+            targets = {}
+            for index in range(count):
+                selector, gas, dest = SELECTOR_TARGET.unpack_from(raw, SELECTOR.size + SELECTOR_TARGET.size * index)
+                if not is_jump_destination(jumpdests, dest):
+                    raise ValueError("analysis cache jump target is not a JUMPDEST")
+                targets[selector] = (gas, dest)
+            return SelectorDispatch(targets, miss_gas, fallthrough_pc)
+        if kind == OPERAND_STATIC_JUMP:
+            gas, dest, fallthrough_pc = STATIC_JUMP.unpack(raw)
+            if not is_jump_destination(jumpdests, dest) or fallthrough_pc > code_len:
+                raise ValueError("analysis cache jump target is not a JUMPDEST")
+            return StaticJump(gas, dest, fallthrough_pc)
+        if kind == OPERAND_CHECKED and self._checked_arithmetic is not None:
+            dest, fallthrough_pc = CHECKED.unpack(raw)
+            if not is_jump_destination(jumpdests, dest):
+                raise ValueError("analysis cache jump target is not a JUMPDEST")
+            return self._checked_arithmetic.rebuild(code, pc, dest, fallthrough_pc)
+        if kind == OPERAND_MAPPING and self._storage_mapping is not None and next_pc is not None:
+            (access,) = MAPPING.unpack(raw)
+            return self._storage_mapping.rebuild(code, pc, next_pc, access or None)
+        raise ValueError("analysis cache operand cannot be decoded")
+
+    def store(self, code_hash: bytes, code: bytes, plan: List[Any], jumpdests: bytearray, blocks: Optional[Any]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(code_hash)
+        # 先写临时文件再改名，同时运行的多个进程不会读到写了一半的文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(encode_analysis(code, plan, jumpdests, blocks))
+        os.replace(tmp_path, path)
+        self.stores += 1
@@ -0,0 +1,432 @@
+# aot_transpiler.py
+#
+# 预先 (ahead-of-time) 把整份合约字节码翻译成一个 Python 模块。
+#
+# 生成的模块里每个基本块是一个函数 block_<pc>(computation)，返回下一个要执行的块的 PC，
+# 由模块里的 BLOCKS 字典 (块入口 PC -> 块函数) 找到下一个块。
+# 紧跟在 PUSH 后面、目标合法的 JUMP/JUMPI 在翻译时就确定了目标，直接返回常量 PC；
+# 其余 (动态) 跳转由原 fork 的指令完成目标校验并设置 PC。块内:
+#   - 只做栈上纯计算的连续指令用 fusion_synthesizer 翻译成 run_<pc> 函数，中间值放在局部变量里，
+#     立即数写成常量；剩余 gas 不够整段时把 PC 摆好并返回 None，交给解释器逐条执行
+#   - 其余指令直接调用原 fork 的 opcode 对象 (op_xx)，gas、报错与逐条执行完全一致
+# 块函数返回 None 表示“从 code.program_counter 起交给解释器继续执行”。
+#
+# 磁盘缓存里只存翻译时做出的选择 (AotLayout: 静态跳转和代码段的起止 PC)，是纯数据的 JSON 文件，
+# 不存源码，也不会执行缓存目录里的任何内容。FusedComputation 执行时如果缓存里有这份代码的布局，
+# 就逐项对照字节码校验，再在进程内用它和原 fork 的 opcode 表重新生成模块源码并 compile()；
+# 校验不通过的文件当作没有缓存。文件名里带着 opcode 表 (各指令的名字和静态 gas) 的指纹，
+# 换了 fork 或 gas 表之后旧文件自然不再命中。
+
+import json
+import os
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth_hash.auto import keccak
+
+from block_translator import MIN_TRANSLATED_LENGTH, find_straight_line_runs
+from fusion_plan import build_fusion_plan
+from fusion_synthesizer import (
+    JUMPDEST_OPCODE,
+    PUSH0_OPCODE,
+    compile_synthesized,
+    is_synthesizable_opcode,
+    synthesize_source,
+)
+from jumpdest_bitmap import JUMPDEST_BITMAPS, is_jump_destination
+from rule_compiler import PUSH32_OPCODE, RuleTrieNode, push_data_size
+
+
+# 缓存文件的格式版本，写在缓存文件名里；格式变化时加一，旧的缓存文件自然失效
+AOT_FORMAT_VERSION = 2
+
+# AotModuleCache 默认最多保留多少份代码的加载结果 (包括“没有缓存”的记录)
+DEFAULT_AOT_CACHE_SIZE = 1024
+
+JUMP_OPCODE = 0x56
+JUMPI_OPCODE = 0x57
+PC_OPCODE = 0x58
+# 会停机的指令: 调用后不会再顺序执行下一条
+HALTING_OPCODES = frozenset([0x00, 0xF3, 0xFD, 0xFE, 0xFF])  # STOP RETURN REVERT INVALID SELFDESTRUCT
+
+# 加载后的模块: 块入口 PC -> 块函数
+AotBlocks = Dict[int, Callable[[ComputationAPI], Optional[int]]]
+
+# 翻译时做出的选择: 静态跳转 (PUSH 的 PC -> 跳转目标) 和代码段 [(起始 PC, 结束后的 PC)]
+AotLayout = Tuple[Dict[int, int], List[Tuple[int, int]]]
+
+
+def _block_source(
+    code: bytes,
+    start_pc: int,
+    runs: Dict[int, Tuple[Tuple[int, ...], int, int]],
+    static_jumps: Dict[int, int],
+    opcode_lookup: Dict[int, OpcodeAPI],
+    fallthrough_starts: List[int],
+) -> List[str]:
+    lines: List[str] = []
+    uses_gas_meter = False
+    code_len = len(code)
+    pc = start_pc
+    while True:
+        if pc >= code_len or (pc != start_pc and code[pc] == JUMPDEST_OPCODE):
+            # 顺序执行进入下一个块 (或越过代码末尾，由 BLOCKS 找不到入口时交给解释器处理)
+            lines.append(f"    return {pc}")
+            break
+
+        if pc in runs:
+            _, end_pc, run_gas = runs[pc]
+            uses_gas_meter = True
+            lines += [
+                f"    if gas_meter.gas_remaining < {run_gas}:",
+                f"        code.program_counter = {pc}",
+                "        return None",
+                f"    run_{pc}(computation)",
+            ]
+            pc = end_pc
+            continue
+
+        opcode = code[pc]
+        if pc in static_jumps:
+            # PUSHn <dest> JUMP/JUMPI: 目标已校验。gas 或栈不满足时交给解释器从 PUSH 起逐条执行并报错
+            jump_pc = pc + 1 + push_data_size(opcode)
+            jump_opcode = code[jump_pc]
+            jump_gas = opcode_lookup[opcode].gas_cost + opcode_lookup[jump_opcode].gas_cost
+            uses_gas_meter = True
+            lines.append("    values = computation._stack.values")
+            if jump_opcode == JUMP_OPCODE:
+                lines.append(f"    if gas_meter.gas_remaining < {jump_gas} or len(values) >= STACK_LIMIT:")
+            else:
+                lines.append(
+                    f"    if gas_meter.gas_remaining < {jump_gas} or not values or len(values) >= STACK_LIMIT:"
+                )
+            lines += [
+                f"        code.program_counter = {pc}",
+                "        return None",
+                f"    gas_meter.consume_gas({jump_gas}, reason={opcode_lookup[jump_opcode].mnemonic!r})",
+            ]
+            if jump_opcode == JUMP_OPCODE:
+                lines.append(f"    return {static_jumps[pc]}")
+            else:
+                lines += [
+                    "    condition = values.pop()",
+                    "    if condition.__class__ is bytes:",
+                    "        condition = int.from_bytes(condition, 'big')",
+                    f"    return {static_jumps[pc]} if condition else {jump_pc + 1}",
+                ]
+                fallthrough_starts.append(jump_pc + 1)
+            break
+
+        if opcode not in opcode_lookup:
+            # 未定义的指令交给解释器报错
+            lines += [f"    code.program_counter = {pc}", "    return None"]
+            break
+
+        mnemonic = opcode_lookup[opcode].mnemonic
+        data_size = push_data_size(opcode)
+        if opcode in (JUMP_OPCODE, JUMPI_OPCODE):
+            # 由原指令校验目标并设置 PC；JUMPI 不跳转时 PC 停在下一条指令
+            lines += [
+                f"    code.program_counter = {pc + 1}",
+                f"    op_{opcode:02x}(computation)  # {mnemonic}",
+                "    return code.program_counter",
+            ]
+            if opcode == JUMPI_OPCODE:
+                fallthrough_starts.append(pc + 1)
+            break
+        if opcode in HALTING_OPCODES:
+            lines += [
+                f"    code.program_counter = {pc + 1}",
+                f"    op_{opcode:02x}(computation)  # {mnemonic}",
+                "    return None",
+            ]
+            break
+
+        if data_size or opcode == PC_OPCODE:
+            # 需要从代码流读取立即数或当前 PC 的指令 (没有并入 run 的 PUSH，例如被代码末尾截断的)
+            lines.append(f"    code.program_counter = {pc + 1}")
+        lines.append(f"    op_{opcode:02x}(computation)  # {mnemonic}")
+        pc += 1 + data_size
+
+    header = [f"def block_{start_pc}(computation):", "    code = computation.code"]
+    if uses_gas_meter:
+        header.append("    gas_meter = computation._gas_meter")
+    return header + lines
+
+
+def _static_jump_target(
+    code: bytes,
+    pc: int,
+    jumpdests: bytearray,
+    opcode_lookup: Dict[int, OpcodeAPI],
+) -> Optional[int]:
+    """pc 处是 PUSHn <dest> JUMP/JUMPI 并且 dest 是合法的 JUMPDEST 时返回 dest，否则返回 None。"""
+    opcode = code[pc]
+    jump_pc = pc + 1 + push_data_size(opcode)
+    if (
+        PUSH0_OPCODE <= opcode <= PUSH32_OPCODE
+        and jump_pc < len(code)
+        and code[jump_pc] in (JUMP_OPCODE, JUMPI_OPCODE)
+        and opcode in opcode_lookup
+        and code[jump_pc] in opcode_lookup
+    ):
+        dest = int.from_bytes(code[pc + 1:jump_pc], "big")
+        if is_jump_destination(jumpdests, dest):
+            return dest
+    return None
+
+
+def _decode_run(
+    code: bytes,
+    start_pc: int,
+    end_pc: int,
+    opcode_lookup: Dict[int, OpcodeAPI],
+) -> Tuple[Tuple[int, ...], Tuple[Optional[bytes], ...]]:
+    """按指令边界解码 [start_pc, end_pc) 这一段，返回指令序列和立即数；不是一段可翻译的指令时抛 ValueError。"""
+    sequence: List[int] = []
+    immediates: List[Optional[bytes]] = []
+    pc = start_pc
+    while pc < end_pc:
+        opcode = code[pc]
+        data_size = push_data_size(opcode)
+        if (
+            not is_synthesizable_opcode(opcode)
+            or opcode not in opcode_lookup
+            or (opcode == JUMPDEST_OPCODE and pc != start_pc)
+            or pc + 1 + data_size > end_pc
+        ):
+            raise ValueError(f"AOT run at pc {start_pc} is not a straight-line run")
+        sequence.append(opcode)
+        immediates.append(code[pc + 1:pc + 1 + data_size] if data_size else None)
+        pc += 1 + data_size
+    if len(sequence) < MIN_TRANSLATED_LENGTH:
+        raise ValueError(f"AOT run at pc {start_pc} is too short")
+    return tuple(sequence), tuple(immediates)
+
+
+def plan_layout(code: bytes, opcode_lookup: Dict[int, OpcodeAPI]) -> AotLayout:
+    """找出一份字节码里的静态跳转和可以翻译的代码段。"""
+    jumpdests = JUMPDEST_BITMAPS.get(code)
+    static_jumps: Dict[int, int] = {}
+    pc = 0
+    while pc < len(code):
+        dest = _static_jump_target(code, pc, jumpdests, opcode_lookup)
+        if dest is not None:
+            static_jumps[pc] = dest
+        pc += 1 + push_data_size(code[pc])
+
+    plain_plan = build_fusion_plan(code, RuleTrieNode())
+    runs = []
+    for start_pc, sequence, _, end_pc in find_straight_line_runs(code, plain_plan, opcode_lookup):
+        # 静态跳转前面的 PUSH 留给跳转处理
+        if end_pc < len(code) and code[end_pc] in (JUMP_OPCODE, JUMPI_OPCODE):
+            push_pc = end_pc - 1 - push_data_size(sequence[-1])
+            if push_pc in static_jumps:
+                sequence, end_pc = sequence[:-1], push_pc
+        if len(sequence) >= MIN_TRANSLATED_LENGTH:
+            runs.append((start_pc, end_pc))
+    return static_jumps, runs
+
+
+def render_module(code: bytes, layout: AotLayout, opcode_lookup: Dict[int, OpcodeAPI]) -> str:
+    """
+    按布局生成模块源码。布局里的每一项都会对照字节码重新校验 (布局可能来自磁盘缓存)，
+    不符合时抛 ValueError。
+    """
+    static_jumps, run_bounds = layout
+    jumpdests = JUMPDEST_BITMAPS.get(code)
+    for pc, dest in static_jumps.items():
+        if not 0 <= pc < len(code) or _static_jump_target(code, pc, jumpdests, opcode_lookup) != dest:
+            raise ValueError(f"AOT static jump at pc {pc} does not match the code")
+
+    instruction_opcodes = set()
+    # 基本块的入口: 代码开头和每个合法的 JUMPDEST
+    block_starts = [0]
+    pc = 0
+    while pc < len(code):
+        opcode = code[pc]
+        instruction_opcodes.add(opcode)
+        if opcode == JUMPDEST_OPCODE:
+            block_starts.append(pc)
+        pc += 1 + push_data_size(opcode)
+
+    straight_line_runs = []
+    for start_pc, end_pc in run_bounds:
+        if not 0 <= start_pc < end_pc <= len(code):
+            raise ValueError(f"AOT run at pc {start_pc} is out of range")
+        straight_line_runs.append((start_pc, *_decode_run(code, start_pc, end_pc, opcode_lookup), end_pc))
+    # 起始 PC -> (指令序列, 结束后的 PC, 静态 gas 之和)
+    runs = {
+        start_pc: (sequence, end_pc, sum(opcode_lookup[opcode].gas_cost for opcode in sequence))
+        for start_pc, sequence, _, end_pc in straight_line_runs
+    }
+
+    source = [
+        f"# 由 aot_transpiler.py 自动生成 (format {AOT_FORMAT_VERSION})，请勿手动修改",
+        f"# code hash: {keccak(code).hex()}",
+        "",
+    ]
+    block_starts = sorted(set(block_starts))
+    block_sources: Dict[int, List[str]] = {}
+    while block_starts:
+        start_pc = block_starts.pop()
+        if start_pc in block_sources or start_pc >= len(code):
+            continue
+        block_sources[start_pc] = _block_source(code, start_pc, runs, static_jumps, opcode_lookup, block_starts)
+
+    source += [
+        f"op_{opcode:02x} = OPCODES[0x{opcode:02x}]"
+        for opcode in sorted(instruction_opcodes & set(opcode_lookup))
+    ]
+
+    for start_pc, sequence, immediates, _ in straight_line_runs:
+        source += ["", ""]
+        source.append(synthesize_source(f"run_{start_pc}", sequence, opcode_lookup, "AOT_BLOCK", immediates))
+    for start_pc in sorted(block_sources):
+        source += ["", ""]
+        source += block_sources[start_pc]
+
+    source += ["", "", "BLOCKS = {"]
+    source += [f"    {start_pc}: block_{start_pc}," for start_pc in sorted(block_sources)]
+    source += ["}", ""]
+    return "\n".join(source)
+
+
+def transpile(code: bytes, opcode_lookup: Dict[int, OpcodeAPI]) -> str:
+    """把一份字节码翻译成模块源码。"""
+    return render_module(code, plan_layout(code, opcode_lookup), opcode_lookup)
+
+
+def opcode_fingerprint(opcode_lookup: Dict[int, OpcodeAPI]) -> str:
+    """opcode 表的指纹: 每条指令的名字和静态 gas。"""
+    table = sorted(
+        (opcode, opcode_fn.mnemonic, opcode_fn.gas_cost)
+        for opcode, opcode_fn in opcode_lookup.items()
+        if hasattr(opcode_fn, "gas_cost")
+    )
+    return keccak(repr((AOT_FORMAT_VERSION, table)).encode("utf-8")).hex()[:16]
+
+
+def cache_path(cache_dir: str, code_hash: bytes, fingerprint: str) -> str:
+    return os.path.join(cache_dir, f"{code_hash.hex()}.v{AOT_FORMAT_VERSION}-{fingerprint}.json")
+
+
+def encode_layout(code_hash: bytes, layout: AotLayout) -> str:
+    static_jumps, runs = layout
+    return json.dumps({
+        "format": AOT_FORMAT_VERSION,
+        "code_hash": code_hash.hex(),
+        "static_jumps": sorted(static_jumps.items()),
+        "runs": runs,
+    })
+
+
+def decode_layout(code_hash: bytes, text: str) -> AotLayout:
+    """解析缓存文件的内容；格式或 code hash 不符时抛 ValueError。"""
+    try:
+        data = json.loads(text)
+        if data["format"] != AOT_FORMAT_VERSION or data["code_hash"] != code_hash.hex():
+            raise ValueError("AOT cache file belongs to another format or code")
+        static_jumps = {int(pc): int(dest) for pc, dest in data["static_jumps"]}
+        runs = [(int(start_pc), int(end_pc)) for start_pc, end_pc in data["runs"]]
+    except (KeyError, TypeError) as exc:
+        raise ValueError(f"malformed AOT cache file: {exc!r}") from exc
+    return static_jumps, runs
+
+
+def write_module(cache_dir: str, code: bytes, opcode_lookup: Dict[int, OpcodeAPI]) -> str:
+    """翻译一份字节码并把布局写进缓存目录，返回文件路径。"""
+    os.makedirs(cache_dir, exist_ok=True)
+    code_hash = keccak(code)
+    path = cache_path(cache_dir, code_hash, opcode_fingerprint(opcode_lookup))
+    # 先写临时文件再改名，同时运行的多个进程不会读到写了一半的文件
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(encode_layout(code_hash, plan_layout(code, opcode_lookup)))
+    os.replace(tmp_path, path)
+    return path
+
+
+class AotModuleCache:
+    """
+    按 code hash 从磁盘缓存目录读取布局，校验后在进程内生成并编译模块。
+
+    每份代码只查一次磁盘、只 compile() 一次，没有缓存或校验不通过的代码也记下来，避免重复查找；
+    最多保留 max_size 份代码的结果，超过时淘汰最久未使用的。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        opcode_lookup: Dict[int, OpcodeAPI],
+        max_size: int = DEFAULT_AOT_CACHE_SIZE,
+    ) -> None:
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.fingerprint = opcode_fingerprint(opcode_lookup)
+        self._opcode_lookup = opcode_lookup
+        self._modules: "OrderedDict[bytes, Optional[AotBlocks]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._modules)
+
+    def load(self, code: bytes) -> Optional[AotBlocks]:
+        code_hash = keccak(code)
+        if code_hash in self._modules:
+            self._modules.move_to_end(code_hash)
+            return self._modules[code_hash]
+
+        blocks = None
+        path = cache_path(self.cache_dir, code_hash, self.fingerprint)
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    layout = decode_layout(code_hash, f.read())
+                source = render_module(code, layout, self._opcode_lookup)
+            except (OSError, ValueError):
+                # 损坏或与代码对不上的文件当作没有缓存，照常解释执行
+                pass
+            else:
+                namespace = compile_synthesized(source, f"<aot {code_hash.hex()}>", {"OPCODES": self._opcode_lookup})
+                blocks = namespace["BLOCKS"]
+        self._modules[code_hash] = blocks
+        if len(self._modules) > self.max_size:
+            self._modules.popitem(last=False)
+        return blocks
+
+
+def transpile_hot_contracts(
+    hot_contracts_path: str,
+    cache_dir: str,
+    top_n: int,
+    opcode_lookup: Dict[int, OpcodeAPI],
+) -> None:
+    """读取 DataAnalysis/rank_hot_contract.py 的统计结果，把调用次数最多的 top_n 个合约翻译进缓存目录。"""
+    import pandas as pd
+
+    from db_utils import fetch_bytecode
+
+    hot_contracts = pd.read_excel(hot_contracts_path)
+    written = 0
+    for address in hot_contracts["Contract Address"].head(top_n):
+        bytecode = fetch_bytecode(address)
+        if not bytecode:
+            print(f"[WARN] 数据库中没有 {address} 的字节码，跳过")
+            continue
+        path = write_module(cache_dir, bytecode, opcode_lookup)
+        written += 1
+        print(f"  {address} -> {path}")
+    print(f"[INFO] 已翻译 {written} 个热点合约，缓存目录: {cache_dir}")
+
+
+if __name__ == "__main__":
+    from eth.vm.forks.cancun.computation import CancunComputation
+
+    # --- 主要配置 ---
+    # rank_hot_contract.py 输出的热点合约统计表
+    HOT_CONTRACTS_PATH = "../DataAnalysis/statistics/hot_contracts_from_csv.xlsx"
+    AOT_CACHE_DIR = "aot_cache"
+    TOP_N = 50
+
+    transpile_hot_contracts(HOT_CONTRACTS_PATH, AOT_CACHE_DIR, TOP_N, CancunComputation.opcodes)
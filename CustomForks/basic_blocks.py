@@ -0,0 +1,191 @@
+# basic_blocks.py
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from eth.abc import OpcodeAPI
+from eth.vm.opcode import Opcode
+
+from fusion_plan import FusionPlan
+from rule_compiler import push_data_size, skip_instructions
+from unchecked_ops import UNCHECKED_OPS
+
+
+JUMPDEST_OPCODE = 0x5B
+
+# EVM 栈的最大深度
+STACK_LIMIT = 1024
+
+# 只消耗静态 gas、且执行过程不会观察到剩余 gas 的指令，可以放在基本块中间。
+# 其余指令 (JUMP/JUMPI、停机指令、带内存扩展等动态 gas 的指令、GAS、CALL/CREATE 等)
+# 都会结束当前基本块: 它们执行到动态部分时，剩余 gas 必须和逐条扣费时完全一样。
+STATIC_GAS_OPCODES = frozenset(
+    [0x01, 0x02, 0x03, 0x04, 0x05, 0x06, 0x07, 0x08, 0x09, 0x0B]  # 算术 (不含 EXP)
+    + list(range(0x10, 0x1E))  # 比较与位运算
+    + [0x30, 0x32, 0x33, 0x34, 0x35, 0x36, 0x38, 0x3A, 0x3D]  # 执行环境
+    + list(range(0x40, 0x4B))  # 区块信息
+    + [0x50, 0x58, 0x59, 0x5B, 0x5C, 0x5D]  # POP PC MSIZE JUMPDEST TLOAD TSTORE
+    + list(range(0x5F, 0xA0))  # PUSH0..PUSH32, DUP1..DUP16, SWAP1..SWAP16
+)
+
+# 会结束基本块、但同样只消耗静态 gas、不访问 GasMeter 的指令: STOP JUMP JUMPI
+LOCAL_GAS_CONTROL_OPCODES = frozenset([0x00, 0x56, 0x57])
+
+# build_local_gas_lookup 的条目: (静态 gas, 助记符, logic_fn)
+LocalGasEntry = Tuple[int, str, Callable]
+
+
+# 每条指令的栈效果: (弹出的元素个数, 压入的元素个数)。
+# DUPn 记为弹出 n 个、压入 n+1 个，SWAPn 记为弹出 n+1 个、压入 n+1 个，
+# 这样就能用同一套公式算出块需要的最小栈深度。
+STACK_EFFECTS: Dict[int, Tuple[int, int]] = {
+    0x00: (0, 0), 0x01: (2, 1), 0x02: (2, 1), 0x03: (2, 1), 0x04: (2, 1), 0x05: (2, 1),
+    0x06: (2, 1), 0x07: (2, 1), 0x08: (3, 1), 0x09: (3, 1), 0x0A: (2, 1), 0x0B: (2, 1),
+    0x10: (2, 1), 0x11: (2, 1), 0x12: (2, 1), 0x13: (2, 1), 0x14: (2, 1), 0x15: (1, 1),
+    0x16: (2, 1), 0x17: (2, 1), 0x18: (2, 1), 0x19: (1, 1), 0x1A: (2, 1), 0x1B: (2, 1),
+    0x1C: (2, 1), 0x1D: (2, 1),
+    0x20: (2, 1),
+    0x30: (0, 1), 0x31: (1, 1), 0x32: (0, 1), 0x33: (0, 1), 0x34: (0, 1), 0x35: (1, 1),
+    0x36: (0, 1), 0x37: (3, 0), 0x38: (0, 1), 0x39: (3, 0), 0x3A: (0, 1), 0x3B: (1, 1),
+    0x3C: (4, 0), 0x3D: (0, 1), 0x3E: (3, 0), 0x3F: (1, 1),
+    0x40: (1, 1), 0x41: (0, 1), 0x42: (0, 1), 0x43: (0, 1), 0x44: (0, 1), 0x45: (0, 1),
+    0x46: (0, 1), 0x47: (0, 1), 0x48: (0, 1), 0x49: (1, 1), 0x4A: (0, 1),
+    0x50: (1, 0), 0x51: (1, 1), 0x52: (2, 0), 0x53: (2, 0), 0x54: (1, 1), 0x55: (2, 0),
+    0x56: (1, 0), 0x57: (2, 0), 0x58: (0, 1), 0x59: (0, 1), 0x5A: (0, 1), 0x5B: (0, 0),
+    0x5C: (1, 1), 0x5D: (2, 0), 0x5E: (3, 0), 0x5F: (0, 1),
+    0xF0: (3, 1), 0xF1: (7, 1), 0xF2: (7, 1), 0xF3: (2, 0), 0xF4: (6, 1), 0xF5: (4, 1),
+    0xFA: (6, 1), 0xFD: (2, 0), 0xFE: (0, 0), 0xFF: (1, 0),
+}
+STACK_EFFECTS.update({0x60 + i: (0, 1) for i in range(32)})
+STACK_EFFECTS.update({0x80 + i: (i + 1, i + 2) for i in range(16)})
+STACK_EFFECTS.update({0x90 + i: (i + 2, i + 2) for i in range(16)})
+STACK_EFFECTS.update({0xA0 + i: (i + 2, 0) for i in range(5)})
+
+# 块信息: (静态 gas 之和, 入口处需要的最小栈深度, 块内相对入口的最大栈增长)
+BlockInfo = Tuple[int, int, int]
+
+
+class BlockTable:
+    """
+    一份字节码的基本块表。
+
+    entries[pc] 不为 None 时，pc 是某个基本块的入口，值为该块的 BlockInfo。
+    块由 JUMPDEST 开始、在 JUMP/JUMPI/停机指令/动态 gas 指令/融合指令处结束，
+    所以块内的执行路径是固定的，入口处一次性扣费、一次性检查栈高度
+    都不会改变任何可观察的行为。
+    """
+
+    __slots__ = ("entries",)
+
+    def __init__(self, entries: List[Optional[BlockInfo]]) -> None:
+        self.entries = entries
+
+
+def _is_fast_opcode(opcode_fn: OpcodeAPI) -> bool:
+    # 只有 as_opcode 生成的对象是 “先扣静态 gas，再调用 logic_fn” 的结构，
+    # CALL/CREATE 等 Opcode 子类会自己计算 gas，必须原样调用。
+    return hasattr(opcode_fn, "logic_fn") and not isinstance(opcode_fn, Opcode)
+
+
+def build_precharged_lookup(opcode_lookup: Dict[int, OpcodeAPI]) -> List[Optional[Callable]]:
+    """
+    生成 “静态 gas 已在块入口扣过” 时使用的 256 项分派表:
+    as_opcode 指令直接调用 logic_fn，其余指令照常调用 (它们的 gas 不计入块的预扣费)。
+    """
+    lookup: List[Optional[Callable]] = [None] * 256
+    for opcode, opcode_fn in opcode_lookup.items():
+        lookup[opcode] = opcode_fn.logic_fn if _is_fast_opcode(opcode_fn) else opcode_fn
+    return lookup
+
+
+def build_local_gas_lookup(opcode_lookup: Dict[int, OpcodeAPI]) -> List[Optional[LocalGasEntry]]:
+    """
+    生成 “剩余 gas 放在局部变量里” 时使用的 256 项分派表 (见 FusedComputation._local_gas_loop):
+    只收录静态 gas、执行时不访问 GasMeter 的 as_opcode 指令 (STATIC_GAS_OPCODES、STOP、JUMP/JUMPI)，
+    值为 (gas, 助记符, logic_fn)；其余指令为 None，执行前后要与 GasMeter 同步。
+    """
+    lookup: List[Optional[LocalGasEntry]] = [None] * 256
+    for opcode, opcode_fn in opcode_lookup.items():
+        if (opcode in STATIC_GAS_OPCODES or opcode in LOCAL_GAS_CONTROL_OPCODES) and _is_fast_opcode(opcode_fn):
+            lookup[opcode] = (opcode_fn.gas_cost, opcode_fn.mnemonic, opcode_fn.logic_fn)
+    return lookup
+
+
+def build_unchecked_lookup(opcode_lookup: Dict[int, OpcodeAPI]) -> List[Optional[Callable]]:
+    """生成免检查栈操作的 256 项分派表，只收录当前 fork 里确实存在的指令。"""
+    lookup: List[Optional[Callable]] = [None] * 256
+    for opcode, unchecked_fn in UNCHECKED_OPS.items():
+        if opcode in opcode_lookup:
+            lookup[opcode] = unchecked_fn
+    return lookup
+
+
+def build_block_table(
+    code: bytes,
+    plan: FusionPlan,
+    opcode_lookup: Dict[int, OpcodeAPI],
+    rule_lengths: List[int],
+) -> BlockTable:
+    """
+    在融合计划表之上切分基本块，计算每个块的静态 gas 总和与栈高度范围。
+
+    块的入口包括: PC 0、每条 JUMPDEST 指令，以及每个块结束后顺序执行到的下一个 PC。
+    融合指令自己在内部扣费、检查栈，因此被当作块的最后一条指令，不计入块信息。
+    rule_lengths[rule_id] 是每条融合规则覆盖的指令条数，用来找到跳转类融合指令
+    (计划表里没有 next_pc) 不跳转时顺序执行到的下一个 PC；带 operand 的跳转类条目
+    (函数分派器) 直接由 operand.fallthrough_pc 给出。
+    """
+    code_len = len(code)
+    entries: List[Optional[BlockInfo]] = [None] * code_len
+
+    starts = [0]
+    pc = 0
+    while pc < code_len:
+        opcode = code[pc]
+        if opcode == JUMPDEST_OPCODE:
+            starts.append(pc)
+        pc += 1 + push_data_size(opcode)
+
+    while starts:
+        start = starts.pop()
+        if start >= code_len or entries[start] is not None:
+            continue
+
+        total = 0
+        height = 0
+        min_height = 0
+        max_height = 0
+        pc = start
+        while pc < code_len:
+            opcode, fused_next_pc, rule_id, operand = plan[pc]
+            if rule_id is not None:
+                if fused_next_pc is None and operand is not None:
+                    fused_next_pc = operand.fallthrough_pc
+                elif fused_next_pc is None:
+                    fused_next_pc = skip_instructions(code, pc, rule_lengths[rule_id])
+                starts.append(fused_next_pc)
+                break
+            if opcode == JUMPDEST_OPCODE and pc != start:
+                # 顺序执行进入下一个 JUMPDEST，它本身就是一个块入口
+                break
+
+            pops, pushes = STACK_EFFECTS.get(opcode, (0, 0))
+            height -= pops
+            min_height = min(min_height, height)
+            height += pushes
+            max_height = max(max_height, height)
+
+            opcode_fn = opcode_lookup.get(opcode)
+            if opcode in STATIC_GAS_OPCODES and opcode_fn is not None:
+                total += opcode_fn.gas_cost
+                pc += 1 + push_data_size(opcode)
+                continue
+
+            # 块的最后一条指令: 静态部分计入预扣费，动态部分在执行时照常扣
+            if opcode_fn is not None and _is_fast_opcode(opcode_fn):
+                total += opcode_fn.gas_cost
+            starts.append(pc + 1)
+            break
+
+        entries[start] = (total, -min_height, max_height)
+
+    return BlockTable(entries)
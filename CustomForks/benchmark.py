@@ -142,9 +142,35 @@ def main_benchmark_from_csv():
 
     # --- 设定要测试的 fused opcode ---
     rules_to_test = ["SUB_MUL"]
+    # 如果要测试 rule_generator.py 根据 profile 生成的规则，先注册再按名字启用:
+    # import generated_fusion_rules
+    # ExperimentComputation.register_rules(
+    #     generated_fusion_rules.GENERATED_FUSION_RULES, generated_fusion_rules.GENERATED_LOGIC_FNS
+    # )
+    # rules_to_test = list(generated_fusion_rules.GENERATED_FUSION_RULES)
     ExperimentComputation.configure_rules(rules_to_test)
     print(f"当前测试的 fused opcodes 为{rules_to_test}")
 
+    # --- 设定执行引擎的模式 ---
+    ExperimentComputation.configure_engine(
+        block_gas_precharge=False,
+        unchecked_stack=False,
+        predecode_push=False,
+        translate_blocks=False,
+        int_stack=False,
+        local_gas=False,
+    )
+    # 如果已经用 aot_transpiler.py 把热点合约翻译进缓存目录，打开下面这行即可直接执行翻译好的模块
+    # ExperimentComputation.configure_aot("aot_cache")
+    # 分层执行: 每份代码前 2 次用原生解释器，之后用计划表执行，超过 10 次后执行翻译好的代码
+    # ExperimentComputation.configure_tiers(fused_threshold=2, compiled_threshold=10)
+    # 热点循环的 trace 编译: 向后跳转到同一目标 50 次后把这个循环编译成一个函数
+    # ExperimentComputation.configure_traces(50)
+    # 把代码分析结果写进磁盘缓存，下次运行不必重新分析 (规则配置变化时自动换用新的缓存)
+    # ExperimentComputation.configure_analysis_cache("analysis_cache")
+    # SHA3 的 keccak 结果缓存: 不超过 128 字节的输入按内容缓存，最多占用 16 MiB 内存
+    # ExperimentComputation.configure_keccak_cache(max_bytes=16 * 1024 * 1024, max_preimage_size=128)
+
     # --- 主要配置 ---
     csv_path = "200k_transactions_with_inputs.csv" 
     max_transactions_to_process = 100
@@ -324,6 +350,23 @@ def main_benchmark_from_csv():
     else:
         print("  在所有成功比较的交易中，没有任何融合规则被触发。")
 
+    if ExperimentComputation.tier_metrics:
+        print("\n--- 分层执行统计 ---")
+        for tier_key, count in ExperimentComputation.tier_metrics.items():
+            print(f"  {tier_key}: {count}")
+
+    if ExperimentComputation.keccak_cache is not None:
+        keccak_stats = ExperimentComputation.keccak_cache.stats()
+        print("\n--- Keccak 缓存统计 ---")
+        print(
+            f"  命中 {keccak_stats['hits']} 次, 未命中 {keccak_stats['misses']} 次, "
+            f"命中率 {keccak_stats['hit_rate']:.2%}"
+        )
+        print(
+            f"  条目 {keccak_stats['entries']} 个, 占用 {keccak_stats['size_bytes']} / {keccak_stats['max_bytes']} 字节, "
+            f"淘汰 {keccak_stats['evictions']} 次"
+        )
+
 
 if __name__ == "__main__":
     if 'Halt' not in globals(): Halt = type('Halt', (Exception,), {})
@@ -0,0 +1,111 @@
+# block_translator.py
+#
+# 直线代码段的“栈 -> 局部变量”翻译 (configure_engine(translate_blocks=True) 的执行层)。
+#
+# 基本块里大部分中间值刚压栈就被下一条指令弹出。这里把一份字节码中只做栈上纯计算的
+# 连续指令 (PUSH/DUP/SWAP/POP/JUMPDEST 和算术、比较、位运算，见 fusion_synthesizer) 找出来，
+# 每一段翻译成一个 Python 函数: 中间值都放在局部变量里，只在入口读一次真实栈、在出口写回一次，
+# PUSH 的立即数直接作为常量写进源码。每条指令的语义用的是 fusion_synthesizer 里与
+# OpcodeFucntionsInPyEVM 一一对应的那一套，整份代码的函数一次编译，随 CodeAnalysis 按 code hash 缓存。
+#
+# 代码段在 JUMPDEST 处切开 (JUMPDEST 是跳转目标，只能作为一段的开头)，
+# 计划表里的跳转类融合指令 (静态跳转、函数分派器) 留给计划表执行，不并入代码段。
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from eth.abc import ComputationAPI, OpcodeAPI
+
+from fusion_plan import FusionPlan
+from fusion_synthesizer import JUMPDEST_OPCODE, compile_synthesized, is_synthesizable_opcode, synthesize_source
+from rule_compiler import push_data_size, skip_instructions
+
+
+# 至少这么多条指令才值得翻译成一个函数
+MIN_TRANSLATED_LENGTH = 2
+
+# OutOfGas 等报错里显示的名字
+TRANSLATED_BLOCK_MNEMONIC = "TRANSLATED_BLOCK"
+
+# 翻译结果: (函数, 代码段结束后的 PC, 代码段的静态 gas 之和)
+TranslatedBlock = Tuple[Callable[[ComputationAPI], None], int, int]
+
+# 一个代码段: (起始 PC, 指令序列, 每条指令的立即数, 结束后的 PC)
+_Run = Tuple[int, Tuple[int, ...], Tuple[Optional[bytes], ...], int]
+
+
+def find_straight_line_runs(
+    code: bytes,
+    plan: FusionPlan,
+    opcode_lookup: Dict[int, OpcodeAPI],
+    rule_lengths: Sequence[int] = (),
+) -> List[_Run]:
+    """
+    按指令边界扫描代码，找出所有可以翻译的连续指令段。
+    rule_lengths[rule_id] 是每条融合规则覆盖的指令条数，用来跳过没有 operand 的跳转类融合指令
+    (例如以 JUMPI 结尾的规则)；plan 里没有这类条目时可以不给。
+    """
+    runs: List[_Run] = []
+    sequence: List[int] = []
+    immediates: List[Optional[bytes]] = []
+    start_pc = 0
+    code_len = len(code)
+
+    def flush(end_pc: int) -> None:
+        if len(sequence) >= MIN_TRANSLATED_LENGTH:
+            runs.append((start_pc, tuple(sequence), tuple(immediates), end_pc))
+        sequence.clear()
+        immediates.clear()
+
+    pc = 0
+    while pc < code_len:
+        opcode = code[pc]
+        _, next_pc, rule_id, operand = plan[pc]
+        if rule_id is not None and next_pc is None:
+            # 跳转类融合指令由计划表执行，直接跳过它覆盖的指令
+            flush(pc)
+            pc = operand.fallthrough_pc if operand is not None else skip_instructions(code, pc, rule_lengths[rule_id])
+            continue
+
+        data_size = push_data_size(opcode)
+        translatable = (
+            is_synthesizable_opcode(opcode)
+            and opcode in opcode_lookup
+            and pc + 1 + data_size <= code_len  # 被代码末尾截断的 PUSH 照常执行
+        )
+        if not translatable or opcode == JUMPDEST_OPCODE:
+            flush(pc)
+        if translatable:
+            if not sequence:
+                start_pc = pc
+            sequence.append(opcode)
+            immediates.append(code[pc + 1:pc + 1 + data_size] if data_size else None)
+        pc += 1 + data_size
+
+    flush(pc)
+    return runs
+
+
+def translate_code(
+    code: bytes,
+    plan: FusionPlan,
+    opcode_lookup: Dict[int, OpcodeAPI],
+    rule_lengths: Sequence[int] = (),
+) -> List[Optional[TranslatedBlock]]:
+    """
+    翻译一份字节码里的所有直线代码段，返回按 PC 索引的表:
+    代码段起点处是 TranslatedBlock，其余位置为 None。
+    """
+    table: List[Optional[TranslatedBlock]] = [None] * len(code)
+    runs = find_straight_line_runs(code, plan, opcode_lookup, rule_lengths)
+    if not runs:
+        return table
+
+    sources = [
+        synthesize_source(f"block_{start_pc}", sequence, opcode_lookup, TRANSLATED_BLOCK_MNEMONIC, immediates)
+        for start_pc, sequence, immediates, _ in runs
+    ]
+    functions = compile_synthesized("\n\n".join(sources), "<translated blocks>")
+    for start_pc, sequence, _, end_pc in runs:
+        block_gas = sum(opcode_lookup[opcode].gas_cost for opcode in sequence)
+        table[start_pc] = (functions[f"block_{start_pc}"], end_pc, block_gas)
+    return table
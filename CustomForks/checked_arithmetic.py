@@ -0,0 +1,265 @@
+# checked_arithmetic.py
+#
+# Solidity 0.8 溢出检查 (checked arithmetic) 的融合。
+#
+# solc 0.8 起每个 a + b、a - b、a * b 都带一段溢出检查，溢出时调用 Panic(0x11):
+#   旧版本 (checked_add_t_uint256):  PUSH1 0x00 DUP3 NOT DUP3 GT ISZERO PUSH2 <ok> JUMPI
+#                                      PUSH2 <ok> PUSH2 <panic> JUMP
+#   新版本 (0.8.16 起):               先算出结果再比较，sum := add(x, y)  if gt(x, sum) { panic }，常被内联
+# 不同 solc 版本、不同运算生成的指令各不相同，所以这里不按固定的指令序列匹配，而是按语义识别:
+# 一个 PUSHn <ok> JUMPI，不跳转时进入 Panic(0x11) 的代码，前面紧挨着一段只做栈上纯计算的指令 (检查段)。
+# 整段 (检查段 + PUSHn + JUMPI) 融合成一条指令: 检查段由 fusion_synthesizer 合成，
+# 运算结果和溢出条件都在 Python 局部变量里算出，只扣一次 gas、只检查一次栈，然后直接跳到 <ok> 或 panic 分支。
+#
+# 指令完全相同的检查段 (同一个 solc 版本生成的同一种运算) 共用一份合成源码和编译好的函数。
+# 磁盘缓存 (analysis_cache) 只记录跳转目标和 fallthrough_pc，读出时由 rebuild 按代码重新合成，
+# 缓存文件里不保存任何要执行的源码。
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from eth.abc import ComputationAPI, OpcodeAPI
+
+from fusion_synthesizer import (
+    JUMPDEST_OPCODE,
+    JUMPI_OPCODE,
+    OPCODE_SEMANTICS,
+    PUSH0_OPCODE,
+    compile_synthesized,
+    is_synthesizable_opcode,
+    synthesize_source,
+)
+from jumpdest_bitmap import is_jump_destination
+from rule_compiler import PUSH32_OPCODE, push_data_size
+
+
+JUMP_OPCODE = 0x56
+PUSH1_OPCODE = 0x60
+PUSH4_OPCODE = 0x63
+
+# Panic(uint256) 的函数选择器，以及算术溢出的错误码
+PANIC_SELECTOR = bytes.fromhex("4e487b71")
+PANIC_ARITHMETIC_OVERFLOW = 0x11
+
+# 检查段最多向前包含这么多条指令
+MAX_CHECK_INSTRUCTIONS = 12
+
+# 合成函数的函数名
+CHECK_FN_NAME = "checked_arithmetic_check"
+
+# 合成函数: fn(computation)，扣费、计算检查段并返回 JUMPI 的条件
+CheckFn = Callable[[ComputationAPI], int]
+
+# 编译好的函数和合成源码各最多保留这么多份，超过时淘汰最久未使用的
+CHECK_CACHE_SIZE = 4096
+
+# 合成源码 -> 编译好的函数，所有合约共用 (LRU)
+_CHECK_FNS: "OrderedDict[str, CheckFn]" = OrderedDict()
+
+
+def _compile_check(source: str) -> CheckFn:
+    check_fn = _CHECK_FNS.get(source)
+    if check_fn is not None:
+        _CHECK_FNS.move_to_end(source)
+        return check_fn
+    check_fn = compile_synthesized(source, "<checked arithmetic>")[CHECK_FN_NAME]
+    _CHECK_FNS[source] = check_fn
+    if len(_CHECK_FNS) > CHECK_CACHE_SIZE:
+        _CHECK_FNS.popitem(last=False)
+    return check_fn
+
+
+class CheckedArithmetic:
+    """
+    一处溢出检查的分析结果，作为计划表条目的 operand。
+
+    source 是检查段的合成源码，dest 是不溢出时的跳转目标，fallthrough_pc 是溢出时进入的 panic 分支。
+    check_fn 由 source 编译而来。
+    """
+
+    __slots__ = ("source", "dest", "fallthrough_pc", "check_fn")
+
+    def __init__(self, source: str, dest: int, fallthrough_pc: int) -> None:
+        self.source = source
+        self.dest = dest
+        self.fallthrough_pc = fallthrough_pc
+        self.check_fn = _compile_check(source)
+
+
+def _instruction_starts(code: bytes) -> List[int]:
+    starts = []
+    pc = 0
+    code_len = len(code)
+    while pc < code_len:
+        starts.append(pc)
+        pc += 1 + push_data_size(code[pc])
+    return starts
+
+
+def _push_value(code: bytes, pc: int) -> Optional[int]:
+    """pc 处是 PUSH 时返回立即数 (代码末尾被截断的立即数在右侧补零)，否则返回 None。"""
+    if pc >= len(code) or not PUSH0_OPCODE <= code[pc] <= PUSH32_OPCODE:
+        return None
+    data_size = push_data_size(code[pc])
+    return int.from_bytes(code[pc + 1:pc + 1 + data_size].ljust(data_size, b"\x00"), "big")
+
+
+def _is_overflow_panic(code: bytes, pc: int) -> bool:
+    """
+    pc 处是否是 Panic(0x11) 的 revert 代码: PUSH4 0x4e487b71 PUSH1 0xe0 SHL ... 或 PUSH32 0x4e487b71<00...>，
+    之后几条指令内写入错误码 0x11。
+    """
+    opcode = code[pc] if pc < len(code) else None
+    if opcode == PUSH4_OPCODE:
+        if code[pc + 1:pc + 5] != PANIC_SELECTOR:
+            return False
+    elif opcode == PUSH32_OPCODE:
+        if code[pc + 1:pc + 33] != PANIC_SELECTOR.ljust(32, b"\x00"):
+            return False
+    else:
+        return False
+
+    pc += 1 + push_data_size(opcode)
+    for _ in range(6):
+        if pc >= len(code):
+            return False
+        if code[pc] == PUSH1_OPCODE and code[pc + 1:pc + 2] == bytes([PANIC_ARITHMETIC_OVERFLOW]):
+            return True
+        pc += 1 + push_data_size(code[pc])
+    return False
+
+
+def _leads_to_overflow_panic(code: bytes, pc: int, panics: Set[int]) -> bool:
+    """
+    从 pc 顺序执行是否进入 Panic(0x11): 直接就是 panic 代码，
+    或者是 PUSHn <panic> JUMP、PUSHn <返回地址> PUSHn <panic> JUMP 这样的调用。
+    """
+    if pc in panics:
+        return True
+    for _ in range(2):
+        target = _push_value(code, pc)
+        if target is None:
+            return False
+        pc += 1 + push_data_size(code[pc])
+        if pc < len(code) and code[pc] == JUMP_OPCODE:
+            return target in panics
+    return False
+
+
+class CheckedArithmeticMatcher:
+    """在一份字节码里找出所有守卫 Panic(0x11) 的 PUSHn <ok> JUMPI 及其前面的检查段。"""
+
+    def __init__(self, rule: Dict, opcode_lookup: Dict[int, OpcodeAPI]) -> None:
+        self.rule = rule
+        self.fused_opcode_id = rule["fused_opcode_id"]
+        self.rule_id = rule["rule_id"]
+        self._opcode_lookup = opcode_lookup
+        # (检查段的指令, 立即数) -> 合成源码 (LRU)
+        self._sources: "OrderedDict[Tuple[Tuple[int, ...], Tuple[Optional[bytes], ...]], str]" = OrderedDict()
+
+    def _source(self, sequence: Tuple[int, ...], immediates: Tuple[Optional[bytes], ...]) -> str:
+        key = (sequence, immediates)
+        source = self._sources.get(key)
+        if source is not None:
+            self._sources.move_to_end(key)
+            return source
+        source = synthesize_source(
+            CHECK_FN_NAME,
+            sequence,
+            self._opcode_lookup,
+            self.rule["fused_mnemonic"],
+            immediates,
+            ends_with_jumpi=True,
+        )
+        self._sources[key] = source
+        if len(self._sources) > CHECK_CACHE_SIZE:
+            self._sources.popitem(last=False)
+        return source
+
+    def _check(self, code: bytes, segment: List[int], dest: int, fallthrough_pc: int) -> CheckedArithmetic:
+        # 压入跳转目标的 PUSH 的立即数不参与计算，按零合成，目标不同的同一种检查段共用一份源码
+        sequence = tuple(code[pc] for pc in segment)
+        immediates = tuple(
+            code[pc + 1:pc + 1 + push_data_size(code[pc])].ljust(push_data_size(code[pc]), b"\x00")
+            if push_data_size(code[pc]) else None
+            for pc in segment[:-1]
+        )
+        source = self._source(sequence, immediates + (b"\x00" * push_data_size(code[segment[-1]]),))
+        return CheckedArithmetic(source, dest, fallthrough_pc)
+
+    def rebuild(self, code: bytes, pc: int, dest: int, fallthrough_pc: int) -> CheckedArithmetic:
+        """
+        按代码重新取得 pc 处检查段的 CheckedArithmetic (磁盘缓存读出时使用)。
+        pc 到 fallthrough_pc 之间不是一段以 PUSHn <dest> JUMPI 结尾的检查段时抛出 ValueError。
+        """
+        if fallthrough_pc > len(code):
+            raise ValueError("checked arithmetic segment does not match the code")
+        segment = []
+        while pc < fallthrough_pc - 1:
+            segment.append(pc)
+            pc += 1 + push_data_size(code[pc])
+        if (
+            pc != fallthrough_pc - 1
+            or code[pc] != JUMPI_OPCODE
+            or not 1 < len(segment) <= MAX_CHECK_INSTRUCTIONS
+            or not PUSH0_OPCODE < code[segment[-1]] <= PUSH32_OPCODE
+            or _push_value(code, segment[-1]) != dest
+            or JUMPDEST_OPCODE in (code[start] for start in segment[1:])
+            or not all(is_synthesizable_opcode(code[start]) for start in segment)
+            or not all(code[start] in self._opcode_lookup for start in segment)
+        ):
+            raise ValueError("checked arithmetic segment does not match the code")
+        return self._check(code, segment, dest, fallthrough_pc)
+
+    def find(self, code: bytes, jumpdests: bytearray) -> Dict[int, Tuple[int, CheckedArithmetic]]:
+        """返回 {检查段起点的 PC: (fallthrough_pc, CheckedArithmetic)}，jumpdests 是代码的 JUMPDEST 位图。"""
+        if JUMPI_OPCODE not in self._opcode_lookup:
+            return {}
+
+        starts = _instruction_starts(code)
+        panics: Set[int] = set()
+        for index, pc in enumerate(starts):
+            if _is_overflow_panic(code, pc):
+                panics.add(pc)
+                if index and code[starts[index - 1]] == JUMPDEST_OPCODE:
+                    panics.add(starts[index - 1])
+        if not panics:
+            return {}
+
+        checks: Dict[int, Tuple[int, CheckedArithmetic]] = {}
+        for index in range(1, len(starts)):
+            jumpi_pc = starts[index]
+            push_pc = starts[index - 1]
+            if code[jumpi_pc] != JUMPI_OPCODE or not PUSH0_OPCODE < code[push_pc] <= PUSH32_OPCODE:
+                continue
+            fallthrough_pc = jumpi_pc + 1
+            dest = _push_value(code, push_pc)
+            if not is_jump_destination(jumpdests, dest) or not _leads_to_overflow_panic(code, fallthrough_pc, panics):
+                continue
+
+            # 向前收集只做栈上纯计算的指令，遇到 JUMPDEST 时把它作为检查段的第一条指令
+            first = index - 1
+            while first > 0 and index - first <= MAX_CHECK_INSTRUCTIONS:
+                opcode = code[starts[first - 1]]
+                if not is_synthesizable_opcode(opcode):
+                    break
+                first -= 1
+                if opcode == JUMPDEST_OPCODE:
+                    break
+            segment = starts[first:index]
+            sequence = tuple(code[pc] for pc in segment)
+            if not any(opcode in OPCODE_SEMANTICS for opcode in sequence):
+                continue
+            if any(opcode not in self._opcode_lookup for opcode in sequence):
+                continue
+
+            checks[segment[0]] = (fallthrough_pc, self._check(code, segment, dest, fallthrough_pc))
+        return checks
+
+
+def checked_arithmetic(computation: ComputationAPI, check: CheckedArithmetic) -> None:
+    """执行一段溢出检查: 合成函数扣费并算出条件，不溢出时跳到 dest，否则顺序进入 panic 分支。"""
+    if check.check_fn(computation):
+        computation.code.program_counter = check.dest
+    else:
+        computation.code.program_counter = check.fallthrough_pc
@@ -0,0 +1,116 @@
+# constant_folding.py
+#
+# 分析阶段的常量折叠。
+#
+# 编译出来的 Solidity 里有大量只依赖立即数的指令序列，例如
+#   PUSH1 a PUSH1 b ADD           -> a + b
+#   PUSH1 0x1f NOT                -> ~0x1f (掩码)
+#   PUSH1 1 PUSH1 1 SHL           -> 2     (后面的 SUB 用到了栈上的值，不参与折叠)
+# 它们的结果在拿到字节码时就已经确定。ConstantFolder 在生成融合计划表时把这样的序列
+# 求值成常量，执行时整条序列只剩一次分派: 扣掉原序列的静态 gas 之和，再把常量压栈。
+#
+# 压栈的常量保持逐条执行时的表示: 运算结果是 int，序列末尾没有被用掉的 PUSH 仍然是 bytes。
+
+from typing import Dict, List, Optional, Tuple, Union
+
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth.exceptions import FullStack
+
+from fusion_synthesizer import OPCODE_FUNCTIONS, OPCODE_SEMANTICS, POP_OPCODE, PUSH0_OPCODE, STACK_LIMIT
+from rule_compiler import push_data_size
+
+
+# 一次折叠最多覆盖多少条指令
+MAX_FOLD_LENGTH = 32
+
+# 折叠结果，作为计划表条目的 operand: (原序列的静态 gas 之和, 要压栈的常量, 序列执行过程中的最大栈增长)
+FoldedConstants = Tuple[int, Tuple[Union[int, bytes], ...], int]
+
+
+class ConstantFolder:
+    """
+    对一份字节码的某个 PC 尝试常量折叠。
+
+    折叠区间只包含 PUSH/DUP/SWAP/POP 和纯运算指令，并且所有运算的输入都来自区间内的常量
+    (不会读到进入区间之前的栈元素)；区间里至少要有一条运算指令。取满足条件的最长区间。
+    """
+
+    def __init__(self, rule: Dict, opcode_lookup: Dict[int, OpcodeAPI]) -> None:
+        self.rule = rule
+        self.fused_opcode_id = rule["fused_opcode_id"]
+        self.rule_id = rule["rule_id"]
+        # 只有 as_opcode 生成的指令有固定的 gas_cost，折叠也只会用到这些指令
+        self._gas_costs = {
+            opcode: opcode_fn.gas_cost
+            for opcode, opcode_fn in opcode_lookup.items()
+            if hasattr(opcode_fn, "gas_cost")
+        }
+
+    def fold(self, code: bytes, pc: int) -> Optional[Tuple[int, FoldedConstants]]:
+        """返回 (折叠区间结束后的 PC, 折叠结果)，pc 处不能折叠时返回 None。"""
+        code_len = len(code)
+        if pc >= code_len or not PUSH0_OPCODE <= code[pc] <= 0x7F:
+            return None  # 区间一定从 PUSH 开始
+
+        stack: List[Union[int, bytes]] = []
+        total_gas = 0
+        max_growth = 0
+        folded_any = False
+        best = None
+
+        for _ in range(MAX_FOLD_LENGTH):
+            if pc >= code_len:
+                break
+            opcode = code[pc]
+            data_size = push_data_size(opcode)
+
+            if opcode == PUSH0_OPCODE:
+                stack.append(b"")
+            elif data_size:
+                if pc + 1 + data_size > code_len:
+                    break  # 立即数被代码末尾截断
+                stack.append(code[pc + 1:pc + 1 + data_size])
+            elif 0x80 <= opcode <= 0x8F:  # DUPn
+                position = opcode - 0x7F
+                if len(stack) < position:
+                    break
+                stack.append(stack[-position])
+            elif 0x90 <= opcode <= 0x9F:  # SWAPn
+                position = opcode - 0x8F
+                if len(stack) < position + 1:
+                    break
+                stack[-1], stack[-position - 1] = stack[-position - 1], stack[-1]
+            elif opcode == POP_OPCODE:
+                if not stack:
+                    break
+                stack.pop()
+            elif opcode in OPCODE_SEMANTICS:
+                num_inputs = OPCODE_SEMANTICS[opcode][0]
+                if len(stack) < num_inputs:
+                    break
+                inputs = [stack.pop() for _ in range(num_inputs)]
+                inputs = [int.from_bytes(value, "big") if value.__class__ is bytes else value for value in inputs]
+                stack.append(OPCODE_FUNCTIONS[opcode](*inputs))
+                folded_any = True
+            else:
+                break
+
+            if opcode not in self._gas_costs:
+                break
+            total_gas += self._gas_costs[opcode]
+            max_growth = max(max_growth, len(stack))
+            pc += 1 + data_size
+            if folded_any:
+                best = (pc, (total_gas, tuple(stack), max_growth))
+
+        return best
+
+
+def push_folded_constants(computation: ComputationAPI, folded: FoldedConstants) -> None:
+    """执行一个常量折叠条目: 扣掉原序列的 gas，把折叠好的常量压栈。"""
+    total_gas, constants, max_growth = folded
+    computation.consume_gas(total_gas, reason="FUSED_CONST_FOLD")
+    values = computation._stack.values
+    if len(values) + max_growth > STACK_LIMIT:
+        raise FullStack("Stack limit reached")
+    values.extend(constants)
@@ -1,6 +1,7 @@
 # custom_computation.py
 
-from typing import Dict, List, Optional, cast
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple, cast
 from eth.abc import (
     ComputationAPI,
     MessageAPI,
@@ -8,15 +9,41 @@ from eth.abc import (
     TransactionContextAPI,
     OpcodeAPI,
 )
-from eth.exceptions import Halt
+from eth.exceptions import Halt, OutOfGas
 from eth.vm.logic.invalid import InvalidOpcode
-from eth.vm.opcode import as_opcode
 from eth.vm.computation import BaseComputation
+from eth.vm.opcode import as_opcode
 
 
 # 导入基础类和配置
 from eth.vm.forks.cancun.computation import CancunComputation as BaseComputationForFusion
 import fusion_config
+from fusion_plan import CodeAnalysis, FusionPlanCache
+from analysis_cache import AnalysisDiskCache, analysis_fingerprint
+from basic_blocks import (
+    STACK_LIMIT,
+    BlockTable,
+    LocalGasEntry,
+    build_block_table,
+    build_local_gas_lookup,
+    build_precharged_lookup,
+    build_unchecked_lookup,
+)
+from rule_compiler import RuleTrieNode, compile_rules, rule_sequence
+from fusion_synthesizer import can_synthesize, synthesize_fused_fn
+from constant_folding import ConstantFolder, push_folded_constants
+from predecoded_ops import build_push_table, push_int_precharged
+from selector_dispatch import SelectorDispatchMatcher, dispatch_selector
+from checked_arithmetic import CheckedArithmeticMatcher, checked_arithmetic
+from storage_mapping import StorageMappingMatcher, storage_mapping
+from aot_transpiler import AotModuleCache
+from block_translator import translate_code
+from static_jumps import JUMP_OPCODE, JUMPI_OPCODE, StaticJumpMatcher, static_jump, static_jumpi
+from trace_compiler import DEFAULT_TRACE_THRESHOLD, compile_trace, record_trace
+from jumpdest_bitmap import jump_with_bitmap, jumpi_with_bitmap
+from halting_ops import build_halting_opcodes
+from keccak_cache import DEFAULT_KECCAK_CACHE_BYTES, MAX_PREIMAGE_SIZE, KeccakCache, build_keccak_opcodes
+from int_stack import IntStack
 from fused_logic import fused_sub_mul, fused_push1_dup1
 
 def NO_RESULT(computation: ComputationAPI) -> None:
@@ -32,45 +59,465 @@ def NO_RESULT(computation: ComputationAPI) -> None:
 class IdenticalComputation(BaseComputationForFusion):
     pass
 
+
+# 分层执行的三个层级，同时也是 tier_metrics 里的键
+TIER_INTERPRETER = "interpreter"
+TIER_FUSED = "fused"
+TIER_COMPILED = "compiled"
+
+
+# 按值匹配的规则: 规则里的标志 -> configure_rules 打印的说明
+VALUE_RULE_LABELS = {
+    "constant_folding": "constant folding",
+    "selector_dispatch": "selector dispatch",
+    "static_jump": "static jump",
+    "checked_arithmetic": "checked arithmetic",
+    "storage_mapping": "storage mapping",
+}
+
+
+def _is_value_rule(rule: Dict) -> bool:
+    """按值匹配的规则 (VALUE_RULE_LABELS 里的标志) 由专门的 matcher 识别，不进入规则 trie。"""
+    return any(rule.get(flag) for flag in VALUE_RULE_LABELS)
+
+
+def _rule_label(rule: Dict) -> str:
+    """configure_rules 打印的规则说明: 按值匹配的规则写明种类，其余规则列出指令序列。"""
+    for flag, label in VALUE_RULE_LABELS.items():
+        if rule.get(flag):
+            return f"{rule['rule_name']} ({label})"
+    mnemonics = " ".join(fusion_config.OPCODE_MNEMONICS.get(op, f"0x{op:02x}") for op in rule_sequence(rule))
+    return f"{rule['rule_name']} ({mnemonics})"
+
 # =============================================================
 # ===            核心的 FusedComputation 类 (修正版)        ===
 # =============================================================
 class FusedComputation(BaseComputationForFusion):
-    _active_rules: Dict[int, List[Dict]] = {}
+    _active_rules: List[Dict] = []
+    # 通过 register_rules 注册的额外规则 (规则名 -> 规则)，与 fusion_config 中的规则一起供 configure_rules 选择
+    _registered_rules: Dict[str, Dict] = {}
+    # 由 _active_rules 编译出的指令前缀树，用于最长匹配
+    _rule_trie: RuleTrieNode = RuleTrieNode()
+    # 启用 CONST_FOLD 这类按值匹配的规则时，生成计划表时用它做常量折叠
+    _constant_folder: Optional[ConstantFolder] = None
+    # 启用 SELECTOR_DISPATCH 时，生成计划表时用它识别函数分派器的比较链
+    _selector_dispatcher: Optional[SelectorDispatchMatcher] = None
+    # 启用 STATIC_JUMP / STATIC_JUMPI 时，生成计划表时用它识别目标固定的跳转
+    _static_jumps: Optional[StaticJumpMatcher] = None
+    # 启用 CHECKED_ARITHMETIC 时，生成计划表时用它识别 Solidity 0.8 的溢出检查
+    _checked_arithmetic: Optional[CheckedArithmeticMatcher] = None
+    # 启用 STORAGE_MAPPING 时，生成计划表时用它识别 mapping 的存储访问
+    _storage_mapping: Optional[StorageMappingMatcher] = None
+    # 按 code hash 缓存的融合计划表，规则变化时必须重建 (见 _reset_plan_cache)
+    _plan_cache: FusionPlanCache = FusionPlanCache()
+    # 代码分析结果的磁盘缓存目录 (见 configure_analysis_cache)，为 None 时只在内存里缓存
+    _analysis_cache_dir: Optional[str] = None
+    # 是否按基本块在入口处一次性预扣静态 gas (见 configure_engine)
+    block_gas_precharge: bool = False
+    # 是否在块入口一次性检查栈高度，块内改用免检查的栈操作 (需要 block_gas_precharge)
+    unchecked_stack: bool = False
+    # 是否在代码分析时把 PUSH 的立即数预解码成 int，执行时直接压栈
+    predecode_push: bool = False
+    # 是否把只做栈上纯计算的直线代码段翻译成 Python 函数执行 (见 block_translator)
+    translate_blocks: bool = False
+    # 是否使用压栈时就把 bytes 转成 int 的整数栈 (见 int_stack)
+    int_stack: bool = False
+    # 是否把剩余 gas 放在主循环的局部变量里，只在需要时写回 GasMeter (见 _local_gas_loop)
+    local_gas: bool = False
+    # 预先翻译好的模块的磁盘缓存 (见 aot_transpiler)，为 None 时不使用
+    _aot_cache: Optional[AotModuleCache] = None
+
+    # 分层执行的阈值 (见 configure_tiers)，tier_fused_threshold 为 None 时不分层
+    tier_fused_threshold: Optional[int] = None
+    tier_compiled_threshold: Optional[int] = None
+    # hash(code) -> 这份代码已经执行的次数。用 Python 的 hash 而不是 keccak: 每个调用帧都要计数，
+    # bytes 的 hash 算一次后缓存在对象上；碰撞只会让两份代码共用计数、提早切换层级，不影响执行结果
+    _execution_counts: Dict[int, int] = {}
+    # 每个层级的执行次数，以及 "interpreter->fused" 这样的层级切换次数
+    tier_metrics: Dict[str, int] = {}
+    # 向后跳转到同一目标多少次后编译这个循环的 trace (见 configure_traces)，为 None 时不编译
+    trace_threshold: Optional[int] = None
+    # SHA3 的 keccak 结果缓存 (见 configure_keccak_cache)，为 None 时不缓存
+    keccak_cache: Optional[KeccakCache] = None
+    # configure_engine / configure_traces 选定的执行循环的方法名 (见 _select_loops):
+    # _loop 用于不分层执行，_fused_loop 用于分层执行的第二层
+    _loop: str = "_main_loop"
+    _fused_loop: str = "_main_loop"
+
+    # 融合操作码 ID -> (融合逻辑函数, 助记符)
+    fused_logic_fns: Dict[int, Tuple[Callable[[ComputationAPI], None], str]] = {
+        fusion_config.VIRTUAL_SUB_MUL_OPCODE: (fused_sub_mul, "FUSED_SUB_MUL"),
+        fusion_config.VIRTUAL_PUSH1_DUP1_OPCODE: (fused_push1_dup1, "FUSED_PUSH1_DUP1"),
+    }
+    # 需要分析期数据的融合操作码 ID -> (融合逻辑函数 fn(computation, operand), 助记符)，
+    # operand 由计划表条目提供 (见 fusion_plan.PlanEntry)
+    operand_logic_fns: Dict[int, Tuple[Callable[[ComputationAPI, Any], None], str]] = {
+        fusion_config.VIRTUAL_CONST_FOLD_OPCODE: (push_folded_constants, "FUSED_CONST_FOLD"),
+        fusion_config.VIRTUAL_SELECTOR_DISPATCH_OPCODE: (dispatch_selector, "FUSED_SELECTOR_DISPATCH"),
+        fusion_config.VIRTUAL_STATIC_JUMP_OPCODE: (static_jump, "FUSED_STATIC_JUMP"),
+        fusion_config.VIRTUAL_STATIC_JUMPI_OPCODE: (static_jumpi, "FUSED_STATIC_JUMPI"),
+        fusion_config.VIRTUAL_CHECKED_ARITHMETIC_OPCODE: (checked_arithmetic, "FUSED_CHECKED_ARITHMETIC"),
+        fusion_config.VIRTUAL_STORAGE_MAPPING_OPCODE: (storage_mapping, "FUSED_STORAGE_MAPPING"),
+    }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.fusion_hit_counts: Dict[str, int] = {}
+    # 以下分派表由 _build_dispatch_tables 按类和规则配置一次性建好，所有 computation 共用
+    # opcode -> OpcodeAPI 的字典 (py-evm 的 opcodes 接口)，只包含 fork 真实存在的指令
+    opcodes: Dict[int, OpcodeAPI] = None
+    # 同样内容的 256 项列表，主循环直接按 opcode 下标取，未定义的指令为 None
+    _opcode_table: List[Optional[OpcodeAPI]] = None
+    # 融合条目使用的分派表: 融合操作码 ID -> 融合逻辑函数 (fused_logic_fns)。
+    # 融合 ID 只出现在计划表的融合条目里，与真实指令分开存放，
+    # 代码里的未定义字节 (例如 0xb0) 在普通条目里照常抛出 InvalidOpcode
+    _fused_table: Dict[int, Callable[[ComputationAPI], None]] = None
+    # 块入口已预扣静态 gas 时使用的分派表
+    _precharged_lookup: List[Optional[Callable]] = None
+    # _local_gas_loop 在局部变量里扣费的指令: opcode -> (静态 gas, 助记符, logic_fn)
+    _local_gas_table: List[Optional[LocalGasEntry]] = None
+    # 块入口已检查栈高度时使用的免检查分派表
+    _unchecked_lookup: List[Optional[Callable]] = None
+    # 带 operand 的条目使用的 256 项分派表: 预解码的 PUSH 和 operand_logic_fns
+    _operand_table: List[Optional[Callable]] = None
+
+    # 融合规则的整数 ID -> 规则名，由 configure_rules 分配
+    _rule_names: List[str] = []
+    # 融合规则的整数 ID -> 规则覆盖的指令条数
+    _rule_lengths: List[int] = []
+    # 可能改变 PC 的指令: JUMP/JUMPI 和跳转类融合指令，_trace_loop 只在它们之后检查向后跳转
+    _jump_opcodes: frozenset = frozenset([JUMP_OPCODE, JUMPI_OPCODE])
+
+    # 这份代码的 JUMPDEST 位图 (CodeAnalysis.jumpdests)，JUMP/JUMPI 用它校验目标
+    jumpdests: Optional[bytearray] = None
+
+    # 每条规则的命中次数，按规则 ID 下标。子调用帧与发起交易的 origin computation
+    # 共用同一个列表，所以 origin 上的计数已经包含了所有子调用。
+    fusion_hits: Optional[List[int]] = None
+
+    def __init__(
+        self,
+        state: StateAPI,
+        message: MessageAPI,
+        transaction_context: TransactionContextAPI,
+    ) -> None:
+        super().__init__(state, message, transaction_context)
+        if self.int_stack:
+            self._stack = IntStack()
 
     @property
-    def opcodes(self) -> Dict[int, OpcodeAPI]:
-        original_opcodes = super().opcodes
-        custom_opcodes = {
-            fusion_config.VIRTUAL_SUB_MUL_OPCODE: as_opcode(
-                logic_fn=fused_sub_mul, mnemonic="FUSED_SUB_MUL", gas_cost=0
-            ),
-            fusion_config.VIRTUAL_PUSH1_DUP1_OPCODE: as_opcode(
-                logic_fn=fused_push1_dup1, mnemonic="FUSED_PUSH1_DUP1", gas_cost=0
-            ),
+    def fusion_hit_counts(self) -> Dict[str, int]:
+        """按规则名汇总的命中次数 (只包含命中过的规则)，供 benchmark 报告使用。"""
+        if not self.fusion_hits:
+            return {}
+        return {
+            rule_name: count
+            for rule_name, count in zip(self._rule_names, self.fusion_hits)
+            if count
+        }
+
+    @classmethod
+    def _build_dispatch_tables(cls) -> None:
+        # JUMP/JUMPI 换成查 JUMPDEST 位图的版本，gas 与报错都和原版相同
+        base_opcodes = super().opcodes
+        bitmap_jumps = {
+            opcode: as_opcode(
+                logic_fn=logic_fn,
+                mnemonic=base_opcodes[opcode].mnemonic,
+                gas_cost=base_opcodes[opcode].gas_cost,
+            )
+            for opcode, logic_fn in ((JUMP_OPCODE, jump_with_bitmap), (JUMPI_OPCODE, jumpi_with_bitmap))
+        }
+        # STOP/RETURN 换成不抛出 Halt 的版本: 把 PC 摆到代码末尾，由循环按越过末尾退出
+        halting_opcodes = build_halting_opcodes(base_opcodes)
+        # 打开 keccak 缓存时，SHA3 换成先查缓存的版本
+        keccak_opcodes = build_keccak_opcodes(base_opcodes, cls.keccak_cache) if cls.keccak_cache is not None else {}
+        cls.opcodes = {**base_opcodes, **bitmap_jumps, **halting_opcodes, **keccak_opcodes}
+
+        opcode_table: List[Optional[OpcodeAPI]] = [None] * 256
+        for opcode, opcode_fn in cls.opcodes.items():
+            opcode_table[opcode] = opcode_fn
+        cls._opcode_table = opcode_table
+        cls._precharged_lookup = build_precharged_lookup(cls.opcodes)
+        cls._unchecked_lookup = build_unchecked_lookup(cls.opcodes)
+        cls._local_gas_table = build_local_gas_lookup(cls.opcodes)
+        cls._fused_table = {opcode_id: logic_fn for opcode_id, (logic_fn, _) in cls.fused_logic_fns.items()}
+
+        operand_table: List[Optional[Callable]] = build_push_table(cls.opcodes)
+        for opcode, (logic_fn, _) in cls.operand_logic_fns.items():
+            operand_table[opcode] = logic_fn
+        cls._operand_table = operand_table
+
+    @classmethod
+    def _resolve_rule(cls, rule: Dict, rule_id: int) -> Dict:
+        """
+        返回规则的一份副本，把运行时需要的信息提前算好:
+        rule_id 是规则的稠密整数 ID，用作命中计数列表的下标；
+        is_jump 表示融合函数自己会设置 PC (跳转类)，计划表里不记录 next_pc:
+        指令序列以 JUMP/JUMPI 结尾的规则，以及函数分派器、静态跳转、溢出检查这几种按值匹配的规则。
+        规则自己给出 is_jump 时 (例如自动生成的规则) 直接使用。
+        """
+        if "is_jump" in rule:
+            return {**rule, "rule_id": rule_id}
+        if _is_value_rule(rule):
+            is_jump = bool(rule.get("selector_dispatch") or rule.get("static_jump") or rule.get("checked_arithmetic"))
+        else:
+            is_jump = rule_sequence(rule)[-1] in (JUMP_OPCODE, JUMPI_OPCODE)
+        return {**rule, "rule_id": rule_id, "is_jump": is_jump}
+
+    @classmethod
+    def register_rules(
+        cls,
+        rules: Dict[str, Dict],
+        logic_fns: Dict[int, Tuple[Callable[[ComputationAPI], None], str]],
+    ) -> None:
+        """
+        注册额外的融合规则及其逻辑函数 (例如 rule_generator 生成的模块)，
+        之后就可以和 fusion_config 里的规则一样通过 configure_rules 按名字启用。
+        注册的融合 ID 必须不小于 fusion_config.REGISTERED_FUSED_OPCODE_BASE，并且不能与其他规则重复。
+        """
+        for opcode_id in logic_fns:
+            if opcode_id < fusion_config.REGISTERED_FUSED_OPCODE_BASE:
+                raise ValueError(f"Fused opcode 0x{opcode_id:02x} is inside the EVM opcode space")
+        taken_ids = {
+            rule["fused_opcode_id"]: rule_name
+            for rule_name, rule in {**fusion_config.ALL_FUSION_RULES, **cls._registered_rules}.items()
         }
-        return {**original_opcodes, **custom_opcodes}
+        for rule_name, rule in rules.items():
+            fused_id = rule["fused_opcode_id"]
+            if fused_id < fusion_config.REGISTERED_FUSED_OPCODE_BASE:
+                raise ValueError(f"Fusion rule {rule_name} uses fused opcode 0x{fused_id:02x} inside the EVM opcode space")
+            if taken_ids.get(fused_id, rule_name) != rule_name:
+                raise ValueError(f"Fusion rule {rule_name} reuses fused opcode 0x{fused_id:x} of {taken_ids[fused_id]}")
+            if _is_value_rule(rule):
+                continue
+            if fused_id not in logic_fns and fused_id not in cls.fused_logic_fns and not can_synthesize(rule_sequence(rule)):
+                raise ValueError(f"Fusion rule {rule_name} has no logic function and cannot be synthesized")
+        cls.fused_logic_fns = {**cls.fused_logic_fns, **logic_fns}
+        cls._registered_rules = {**cls._registered_rules, **rules}
+        cls._build_dispatch_tables()
+
+    @classmethod
+    def _synthesize_logic_fns(cls, rules: List[Dict]) -> None:
+        """
+        没有手写融合函数的规则，由 fusion_synthesizer 按单条指令的语义自动合成。
+        合成的函数和手写的一样只放进 fused_logic_fns (进而只进 _fused_table)，不进 opcodes。
+        """
+        synthesized = {}
+        for rule in rules:
+            fused_id = rule["fused_opcode_id"]
+            if _is_value_rule(rule) or fused_id in cls.fused_logic_fns or fused_id in synthesized:
+                continue
+            mnemonic = rule.get("fused_mnemonic") or f"FUSED_{rule['rule_name']}"
+            fused_fn = synthesize_fused_fn(rule_sequence(rule), super().opcodes, mnemonic)
+            synthesized[fused_id] = (fused_fn, mnemonic)
+        if synthesized:
+            cls.fused_logic_fns = {**cls.fused_logic_fns, **synthesized}
 
     @classmethod
     def configure_rules(cls, rule_names: List[str]) -> None:
-        cls._active_rules.clear()
-        all_rules = fusion_config.ALL_FUSION_RULES
-        for name in rule_names:
-            if name in all_rules:
-                rule_info = all_rules[name]
-                trigger_op = rule_info['trigger_opcode']
-                if trigger_op not in cls._active_rules:
-                    cls._active_rules[trigger_op] = []
-                cls._active_rules[trigger_op].append(rule_info)
-        active_rules_info = [
-            f"{fusion_config.OPCODE_MNEMONICS.get(op, 'UNKNOWN')} (0x{op:02x})" 
-            for op in cls._active_rules.keys()
+        all_rules = {**fusion_config.ALL_FUSION_RULES, **cls._registered_rules}
+        selected_rules = [all_rules[name] for name in rule_names if name in all_rules]
+        cls._synthesize_logic_fns(selected_rules)
+        cls._active_rules = [cls._resolve_rule(rule, rule_id) for rule_id, rule in enumerate(selected_rules)]
+        cls._rule_names = [rule["rule_name"] for rule in cls._active_rules]
+        sequence_rules = [rule for rule in cls._active_rules if not _is_value_rule(rule)]
+        cls._rule_lengths = [
+            0 if _is_value_rule(rule) else len(rule_sequence(rule)) for rule in cls._active_rules
         ]
-        print(f"[INFO] FusedComputation configured with rules triggered by: {active_rules_info}")
+        cls._rule_trie = compile_rules(sequence_rules)
+        cls._jump_opcodes = frozenset(
+            [JUMP_OPCODE, JUMPI_OPCODE] + [rule["fused_opcode_id"] for rule in cls._active_rules if rule["is_jump"]]
+        )
+        fold_rules = [rule for rule in cls._active_rules if rule.get("constant_folding")]
+        cls._constant_folder = ConstantFolder(fold_rules[0], super().opcodes) if fold_rules else None
+        dispatch_rules = [rule for rule in cls._active_rules if rule.get("selector_dispatch")]
+        cls._selector_dispatcher = (
+            SelectorDispatchMatcher(dispatch_rules[0], super().opcodes) if dispatch_rules else None
+        )
+        jump_rules = [rule for rule in cls._active_rules if rule.get("static_jump")]
+        cls._static_jumps = StaticJumpMatcher(jump_rules, super().opcodes) if jump_rules else None
+        checked_rules = [rule for rule in cls._active_rules if rule.get("checked_arithmetic")]
+        cls._checked_arithmetic = (
+            CheckedArithmeticMatcher(checked_rules[0], super().opcodes) if checked_rules else None
+        )
+        mapping_rules = [rule for rule in cls._active_rules if rule.get("storage_mapping")]
+        cls._storage_mapping = (
+            StorageMappingMatcher(mapping_rules[0], super().opcodes) if mapping_rules else None
+        )
+        cls._reset_plan_cache()
+        cls._build_dispatch_tables()
+        active_rules_info = [_rule_label(rule) for rule in cls._active_rules]
+        print(f"[INFO] FusedComputation configured with rules: {active_rules_info}")
+
+    @classmethod
+    def configure_engine(
+        cls,
+        block_gas_precharge: bool = False,
+        unchecked_stack: bool = False,
+        predecode_push: bool = False,
+        translate_blocks: bool = False,
+        int_stack: bool = False,
+        local_gas: bool = False,
+    ) -> None:
+        if unchecked_stack and not block_gas_precharge:
+            raise ValueError("unchecked_stack requires block_gas_precharge")
+        if translate_blocks and block_gas_precharge:
+            raise ValueError("translate_blocks cannot be combined with block_gas_precharge")
+        if local_gas and (block_gas_precharge or translate_blocks):
+            raise ValueError("local_gas cannot be combined with block_gas_precharge or translate_blocks")
+        cls.block_gas_precharge = block_gas_precharge
+        cls.unchecked_stack = unchecked_stack
+        cls.translate_blocks = translate_blocks
+        cls.int_stack = int_stack
+        cls.local_gas = local_gas
+        cls._select_loops()
+        if predecode_push != cls.predecode_push:
+            # 计划表的内容变了，已经缓存的分析结果不能再用
+            cls.predecode_push = predecode_push
+            cls._reset_plan_cache()
+        print(
+            f"[INFO] FusedComputation engine: block_gas_precharge={block_gas_precharge}, "
+            f"unchecked_stack={unchecked_stack}, predecode_push={predecode_push}, "
+            f"translate_blocks={translate_blocks}, int_stack={int_stack}, local_gas={local_gas}"
+        )
+
+    @classmethod
+    def _select_loops(cls) -> None:
+        """按当前的执行配置选定执行循环，apply_computation 每帧直接调用，不再逐个判断配置开关。"""
+        if cls.block_gas_precharge:
+            cls._fused_loop = "_block_loop"
+        elif cls.trace_threshold is not None:
+            cls._fused_loop = "_trace_loop"
+        elif cls.local_gas:
+            cls._fused_loop = "_local_gas_loop"
+        else:
+            cls._fused_loop = "_main_loop"
+        # translate_blocks 与 block_gas_precharge 不能同时打开 (见 configure_engine)
+        cls._loop = "_translated_loop" if cls.translate_blocks else cls._fused_loop
+
+    @classmethod
+    def configure_aot(cls, cache_dir: Optional[str]) -> None:
+        """
+        指定 aot_transpiler 写入翻译布局的缓存目录。缓存里有布局的代码在进程内生成模块并直接执行，
+        其余代码照常按 configure_engine 选定的循环解释执行；cache_dir 为 None 时关闭。
+        """
+        cls._aot_cache = AotModuleCache(cache_dir, super().opcodes) if cache_dir else None
+        # 已缓存的分析结果里记着“是否有模块”，目录变了要重新查找
+        cls._reset_plan_cache()
+        print(f"[INFO] FusedComputation AOT cache: {cache_dir}")
+
+    @classmethod
+    def configure_tiers(cls, fused_threshold: Optional[int] = None, compiled_threshold: Optional[int] = None) -> None:
+        """
+        按 code hash 统计执行次数，分层选择执行方式:
+        前 fused_threshold 次用原生解释器逐条执行 (不做代码分析)，之后用计划表执行
+        (融合规则、预解码，以及 configure_engine 选定的 _main_loop / _block_loop)，
+        执行次数超过 compiled_threshold 后用最重的一层: 有 AOT 模块时执行模块，否则执行翻译好的直线代码段。
+        compiled_threshold 为 None 时不进入最后一层；fused_threshold 为 None 时关闭分层，
+        执行方式完全由 configure_engine / configure_aot 决定。
+        """
+        if fused_threshold is None and compiled_threshold is not None:
+            raise ValueError("compiled_threshold requires fused_threshold")
+        if fused_threshold is not None and fused_threshold < 0:
+            raise ValueError("fused_threshold must be non-negative")
+        if compiled_threshold is not None and compiled_threshold < fused_threshold:
+            raise ValueError("compiled_threshold must not be smaller than fused_threshold")
+        cls.tier_fused_threshold = fused_threshold
+        cls.tier_compiled_threshold = compiled_threshold
+        cls._execution_counts = {}
+        cls.tier_metrics = {}
+        print(
+            f"[INFO] FusedComputation tiers: fused_threshold={fused_threshold}, "
+            f"compiled_threshold={compiled_threshold}"
+        )
+
+    @classmethod
+    def _tier_for_count(cls, count: int) -> str:
+        """第 count 次执行 (从 1 开始) 所在的层级。"""
+        if cls.tier_compiled_threshold is not None and count > cls.tier_compiled_threshold:
+            return TIER_COMPILED
+        if count > cls.tier_fused_threshold:
+            return TIER_FUSED
+        return TIER_INTERPRETER
+
+    @classmethod
+    def _next_tier(cls, code: bytes) -> str:
+        """记一次执行，返回这次执行所在的层级，并把执行次数和层级切换记进 tier_metrics。"""
+        code_key = hash(code)
+        count = cls._execution_counts.get(code_key, 0) + 1
+        cls._execution_counts[code_key] = count
+        tier = cls._tier_for_count(count)
+        tier_metrics = cls.tier_metrics
+        tier_metrics[tier] = tier_metrics.get(tier, 0) + 1
+        previous_tier = cls._tier_for_count(count - 1)
+        if count > 1 and previous_tier != tier:
+            transition = f"{previous_tier}->{tier}"
+            tier_metrics[transition] = tier_metrics.get(transition, 0) + 1
+        return tier
+
+    @classmethod
+    def configure_traces(cls, threshold: Optional[int] = DEFAULT_TRACE_THRESHOLD) -> None:
+        """
+        打开热点循环的 trace 编译 (见 trace_compiler): 按计划表逐条执行的地方改用 _trace_loop，
+        向后跳转到同一目标 threshold 次后记录并编译这个循环。threshold 为 None 时关闭。
+        """
+        if threshold is not None and threshold < 1:
+            raise ValueError("trace threshold must be positive")
+        cls.trace_threshold = threshold
+        cls._select_loops()
+        # 跳转计数和编译好的 trace 都记在缓存的分析结果里，重新开始统计
+        cls._reset_plan_cache()
+        print(f"[INFO] FusedComputation trace threshold: {threshold}")
+
+    @classmethod
+    def configure_analysis_cache(cls, cache_dir: Optional[str]) -> None:
+        """
+        把代码分析结果 (计划表、基本块表) 按 code hash 写进 cache_dir，下次运行直接读取 (见 analysis_cache)。
+        缓存按规则配置的指纹分目录存放，之后再调用 configure_rules / configure_engine 会自动换到对应的目录。
+        cache_dir 为 None 时关闭。
+        """
+        cls._analysis_cache_dir = cache_dir
+        cls._reset_plan_cache()
+        print(f"[INFO] FusedComputation analysis cache: {cache_dir}")
+
+    @classmethod
+    def configure_keccak_cache(
+        cls,
+        max_bytes: Optional[int] = DEFAULT_KECCAK_CACHE_BYTES,
+        max_preimage_size: int = MAX_PREIMAGE_SIZE,
+    ) -> None:
+        """
+        打开 SHA3 的 keccak 结果缓存 (见 keccak_cache): 不超过 max_preimage_size 字节的输入按内容缓存结果，
+        缓存最多占用 max_bytes 字节的内存，命中率等统计见 keccak_cache.stats()。max_bytes 为 None 时关闭。
+        """
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError("keccak cache max_bytes must be positive")
+        if max_preimage_size < 0:
+            raise ValueError("max_preimage_size must be non-negative")
+        cls.keccak_cache = KeccakCache(max_bytes, max_preimage_size) if max_bytes is not None else None
+        cls._build_dispatch_tables()
+        print(f"[INFO] FusedComputation keccak cache: max_bytes={max_bytes}, max_preimage_size={max_preimage_size}")
+
+    @classmethod
+    def _reset_plan_cache(cls) -> None:
+        """丢弃内存里缓存的分析结果；打开了磁盘缓存时，按当前的规则配置重新选定缓存目录。"""
+        disk_cache = None
+        if cls._analysis_cache_dir is not None:
+            fingerprint = analysis_fingerprint(cls._active_rules, cls.predecode_push, super().opcodes)
+            disk_cache = AnalysisDiskCache(
+                cls._analysis_cache_dir,
+                fingerprint,
+                cls._active_rules,
+                BlockTable,
+                cls._checked_arithmetic,
+                cls._storage_mapping,
+            )
+        cls._plan_cache = FusionPlanCache(cls._plan_cache.max_size, disk_cache)
+
+    @classmethod
+    def _load_aot_blocks(cls, analysis: CodeAnalysis) -> Optional[Dict]:
+        if not analysis.aot_checked:
+            analysis.aot_blocks = cls._aot_cache.load(analysis.code)
+            analysis.aot_checked = True
+        return analysis.aot_blocks
 
     @classmethod
     def apply_computation(
@@ -81,6 +528,13 @@ class FusedComputation(BaseComputationForFusion):
         parent_computation: Optional[ComputationAPI] = None,
     ) -> ComputationAPI:
         with cls(state, message, transaction_context) as computation:
+            # 子调用帧直接累加到父帧 (最终是 origin computation) 的计数列表里
+            parent_hits = getattr(parent_computation, "fusion_hits", None)
+            if parent_hits is not None and len(parent_hits) == len(cls._rule_names):
+                computation.fusion_hits = parent_hits
+            else:
+                computation.fusion_hits = [0] * len(cls._rule_names)
+
             if computation.is_origin_computation:
                 # If origin computation, reset contracts_created
                 computation.contracts_created = []
@@ -108,100 +562,501 @@ class FusedComputation(BaseComputationForFusion):
                     precompile(computation)
                 return computation
 
-            show_debug2 = computation.logger.show_debug2
+            if cls.tier_fused_threshold is None:
+                tier = None
+            else:
+                tier = cls._next_tier(message.code)
+            debug = computation.logger.isEnabledFor(logging.DEBUG)
+
+            if tier == TIER_INTERPRETER and not debug:
+                # 执行次数还少的代码不值得做代码分析，直接用原生解释器
+                cls._interpreter_loop(computation)
+                return computation
+
+            # 取出(或一次性生成)该合约的代码分析结果，主循环只需要按 PC 查表
+            analysis = cls._plan_cache.get_analysis(
+                message.code,
+                cls._rule_trie,
+                cls._constant_folder,
+                cls.predecode_push,
+                cls._selector_dispatcher,
+                cls._static_jumps,
+                cls._checked_arithmetic,
+                cls._storage_mapping,
+            )
+            computation.jumpdests = analysis.jumpdests
+
+            # 在创建 computation 时就选定循环实现，生产循环里不再有任何日志判断
+            if debug:
+                cls._debug_loop(computation, analysis)
+            elif tier == TIER_FUSED:
+                getattr(cls, cls._fused_loop)(computation, analysis)
+            elif cls._aot_cache is not None and cls._load_aot_blocks(analysis) is not None:
+                # 预先翻译好的模块要看这份代码有没有缓存，只能按帧判断
+                cls._aot_loop(computation, analysis)
+            elif tier == TIER_COMPILED:
+                cls._translated_loop(computation, analysis)
+            else:
+                getattr(cls, cls._loop)(computation, analysis)
+
+        return computation
+
+    @classmethod
+    def _interpreter_loop(cls, computation: ComputationAPI) -> None:
+        """分层执行的第一层: 与 py-evm 相同，按字节码逐条解释执行，不查计划表。"""
+        opcode_lookup = super().opcodes
+
+        for opcode in computation.code:
+            try:
+                opcode_fn = opcode_lookup[opcode]
+            except KeyError:
+                opcode_fn = InvalidOpcode(opcode)
+
+            try:
+                opcode_fn(computation)
+            except Halt:
+                break
+
+    @classmethod
+    def _main_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis) -> None:
+        """逐条指令扣费的生产循环: 不做任何日志和字符串处理。"""
+        opcode_table = cls._opcode_table
+        operand_table = cls._operand_table
+        fused_table = cls._fused_table
+        fusion_hits = computation.fusion_hits
+        plan = analysis.plan
+        plan_len = len(plan)
+        code = computation.code
+
+        while True:
+            pc = code.program_counter
+            if pc >= plan_len:
+                # 越过代码末尾，等价于执行 STOP
+                break
 
-            opcode_lookup = computation.opcodes
+            opcode, next_pc, rule_id, operand = plan[pc]
 
-            # 标记还需跳过的循环次数
-            skip_num = 0
+            try:
+                if operand is None:
+                    code.program_counter = pc + 1
+                    if rule_id is None:
+                        opcode_fn = opcode_table[opcode]
+                        if opcode_fn is None:
+                            opcode_fn = InvalidOpcode(opcode)
+                        opcode_fn(computation)
+                    else:
+                        fused_table[opcode](computation)
+                else:
+                    # 分析期已经解码好的条目 (预解码的 PUSH、常量折叠) 不读取代码流，直接跳到下一条指令
+                    code.program_counter = next_pc
+                    operand_table[opcode](computation, operand)
+            except Halt:
+                break
 
-            for opcode in computation.code:
-                
-                if skip_num > 0:
-                    skip_num -= 1
+            if rule_id is not None:
+                # 融合指令: 非跳转类的把 PC 移到整个融合序列之后，跳转类的 PC 已由融合函数设好
+                if next_pc is not None:
+                    code.program_counter = next_pc
+                fusion_hits[rule_id] += 1
+
+    @classmethod
+    def _local_gas_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis) -> None:
+        """
+        与 _main_loop 相同，但剩余 gas 放在局部变量 gas 里:
+        _local_gas_table 里的指令 (以及预解码的 PUSH) 在局部变量上扣费后直接调用 logic_fn，
+        不再经过 consume_gas；其余指令 (动态 gas、CALL/CREATE、GAS、停机、融合指令) 执行前把 gas
+        写回 GasMeter，执行后再读回来。退出循环 (包括抛出异常) 时 GasMeter 与逐条扣费时完全一致。
+        """
+        local_gas_table = cls._local_gas_table
+        opcode_table = cls._opcode_table
+        operand_table = cls._operand_table
+        fused_table = cls._fused_table
+        fusion_hits = computation.fusion_hits
+        plan = analysis.plan
+        plan_len = len(plan)
+        code = computation.code
+        gas_meter = computation._gas_meter
+        # gas 为 None 表示最新的剩余 gas 在 GasMeter 里
+        gas = gas_meter.gas_remaining
+
+        try:
+            while True:
+                pc = code.program_counter
+                if pc >= plan_len:
+                    # 越过代码末尾，等价于执行 STOP
+                    break
+
+                opcode, next_pc, rule_id, operand = plan[pc]
+
+                # 融合条目的 ID 不是 fork 的指令 (可能超出 256)，一律与 GasMeter 同步后执行
+                local_entry = local_gas_table[opcode] if rule_id is None else None
+                if local_entry is not None:
+                    gas_cost, mnemonic, logic_fn = local_entry
+                    if gas_cost > gas:
+                        # 与 GasMeter.consume_gas 报同样的错，剩余 gas 不变
+                        raise OutOfGas(f"Out of gas: Needed {gas_cost} - Remaining {gas} - Reason: {mnemonic}")
+                    gas -= gas_cost
+                    if operand is None:
+                        code.program_counter = pc + 1
+                        logic_fn(computation)
+                    else:
+                        # 预解码的 PUSH
+                        code.program_counter = next_pc
+                        push_int_precharged(computation, operand)
                     continue
-                
-                # 重新引入fusion_successful这个量，是为了处理jump的情况。
-                # jump类型的函数本身就有跳转的功能，因此它跳转后我不能再跳过其后续的
-                fusion_successful = False
-
-                # 记录当前PC，以便在融合时进行操作
-                pc_before_opcode = computation.code.program_counter - 1
-                
-                # =================== START: FUSION LOGIC INSERTION ===================
-                # 检查当前 opcode 是否是我们关心的“触发器”
-                if opcode in cls._active_rules:
-                    # 遍历所有由该 opcode 触发的规则
-                    for rule in cls._active_rules[opcode]:
-                        # --- 执行模式匹配 ---
-                        trigger_arg_bytes = rule["trigger_arg_bytes"]
-                        pattern_bytes = rule["pattern_bytes"]
-                        pattern_opcodes = rule["pattern_opcodes"]
-                        pattern_start_pc = pc_before_opcode + 1 + trigger_arg_bytes
-
-                        if pattern_start_pc + pattern_bytes > len(computation.code):
-                            continue # 边界检查失败，尝试下一条规则
-
-                        actual_pattern = computation.code[pattern_start_pc : pattern_start_pc + pattern_bytes]
-                        is_match = actual_pattern == pattern_opcodes
-                        
-                        # is_match = False # 用于强制关闭匹配
-                        # --- 如果匹配成功 ---
-                        if is_match:
-                            rule_name = rule["rule_name"]
-                            computation.logger.debug(f"FUSION HIT: {rule_name} at PC {pc_before_opcode}")
-
-                            # 获取并执行对应的融合函数
-                            fused_op_id = rule["fused_opcode_id"]
-                            fused_op_fn = opcode_lookup[fused_op_id]
-                            
-                            # 执行前，将PC重置到触发器之后，以便融合函数能正确读取参数
-                            computation.code.seek(pc_before_opcode + 1)
-                            fused_op_fn(computation=computation)
-                            
-                            # Check if the fused operation was a JUMP type.
-                            is_jump_type = "JUMP" in fused_op_fn.mnemonic.upper()
-
-                            if not is_jump_type:
-                                # If it's not a JUMP, set skip_num to skip the pattern opcodes.
-                                skip_num = pattern_bytes
-                            # If it IS a JUMP, we do NOT set skip_num. The JUMP has already
-                            # moved the PC, and the loop will naturally continue from there.
-                            
-                            fusion_successful = True
-
-                            # 标记融合成功，并记录次数
-                            computation.fusion_hit_counts[rule_name] = computation.fusion_hit_counts.get(rule_name, 0) + 1
-                            break # 成功匹配并执行了一条规则，跳出规则循环
-                
-                # 如果融合已成功，跳过原生 Opcode 的执行，进入下一次主循环
-                if fusion_successful:
+
+                gas_meter.gas_remaining = gas
+                gas = None
+                if operand is None:
+                    code.program_counter = pc + 1
+                    if rule_id is None:
+                        opcode_fn = opcode_table[opcode]
+                        if opcode_fn is None:
+                            opcode_fn = InvalidOpcode(opcode)
+                        opcode_fn(computation)
+                    else:
+                        fused_table[opcode](computation)
+                else:
+                    code.program_counter = next_pc
+                    operand_table[opcode](computation, operand)
+                gas = gas_meter.gas_remaining
+
+                if rule_id is not None:
+                    if next_pc is not None:
+                        code.program_counter = next_pc
+                    fusion_hits[rule_id] += 1
+        except Halt:
+            pass
+        finally:
+            if gas is not None:
+                gas_meter.gas_remaining = gas
+
+    @classmethod
+    def _trace_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis) -> None:
+        """
+        与 _main_loop 相同，另外在每个跳转之后检查是否向后跳转 (进入下一轮循环)，
+        由 _enter_loop 统计次数、编译并执行热点循环的 trace。
+        """
+        opcode_table = cls._opcode_table
+        operand_table = cls._operand_table
+        fused_table = cls._fused_table
+        jump_opcodes = cls._jump_opcodes
+        fusion_hits = computation.fusion_hits
+        plan = analysis.plan
+        plan_len = len(plan)
+        code = computation.code
+
+        while True:
+            pc = code.program_counter
+            if pc >= plan_len:
+                # 越过代码末尾，等价于执行 STOP
+                break
+
+            opcode, next_pc, rule_id, operand = plan[pc]
+
+            try:
+                if operand is None:
+                    code.program_counter = pc + 1
+                    if rule_id is None:
+                        opcode_fn = opcode_table[opcode]
+                        if opcode_fn is None:
+                            opcode_fn = InvalidOpcode(opcode)
+                        opcode_fn(computation)
+                    else:
+                        fused_table[opcode](computation)
+                else:
+                    code.program_counter = next_pc
+                    operand_table[opcode](computation, operand)
+
+                if rule_id is not None:
+                    if next_pc is not None:
+                        code.program_counter = next_pc
+                    fusion_hits[rule_id] += 1
+
+                if opcode in jump_opcodes and code.program_counter < pc:
+                    cls._enter_loop(computation, analysis, code.program_counter)
+            except Halt:
+                break
+
+    @classmethod
+    def _enter_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis, head_pc: int) -> None:
+        """刚向后跳转到 head_pc: 有 trace 就执行；否则计数，达到阈值时记录一轮循环并编译成 trace。"""
+        traces = analysis.traces
+        if head_pc in traces:
+            trace_fn = traces[head_pc]
+        else:
+            count = analysis.loop_counts.get(head_pc, 0) + 1
+            analysis.loop_counts[head_pc] = count
+            if count < cls.trace_threshold:
+                return
+            opcode_lookup = super().opcodes
+            trace = record_trace(computation, head_pc, opcode_lookup)
+            trace_fn = compile_trace(analysis.code, trace, opcode_lookup) if trace is not None else None
+            traces[head_pc] = trace_fn
+            if trace_fn is None or computation.code.program_counter != head_pc:
+                return
+
+        if trace_fn is not None:
+            trace_fn(computation)
+
+    @classmethod
+    def _aot_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis) -> None:
+        """
+        执行预先翻译好的模块: 每个块函数返回下一个块的 PC，在 BLOCKS 里找到它继续执行。
+
+        块函数返回 None (剩余 gas 不够整段、未定义的指令)，或者下一个 PC 不是块入口
+        (例如越过代码末尾) 时，从当前 PC 起交给 _main_loop 解释执行。
+        """
+        blocks = analysis.aot_blocks
+        code = computation.code
+        pc = code.program_counter
+
+        try:
+            while True:
+                block_fn = blocks.get(pc)
+                if block_fn is None:
+                    code.program_counter = pc
+                    break
+                pc = block_fn(computation)
+                if pc is None:
+                    break
+        except Halt:
+            return
+
+        cls._main_loop(computation, analysis)
+
+    @classmethod
+    def _translated_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis) -> None:
+        """
+        翻译执行的生产循环: 能翻译的直线代码段整段调用翻译好的函数，其余指令与 _main_loop 相同。
+
+        剩余 gas 不够整段的静态 gas 时，这一段退回按计划表逐条执行，
+        保证 OutOfGas 仍然在原来的那条指令上抛出。
+        """
+        if analysis.translated is None:
+            analysis.translated = translate_code(
+                analysis.code, analysis.plan, super().opcodes, cls._rule_lengths
+            )
+
+        opcode_table = cls._opcode_table
+        operand_table = cls._operand_table
+        fused_table = cls._fused_table
+        fusion_hits = computation.fusion_hits
+        plan = analysis.plan
+        plan_len = len(plan)
+        translated = analysis.translated
+        code = computation.code
+        gas_meter = computation.get_gas_meter()
+
+        while True:
+            pc = code.program_counter
+            if pc >= plan_len:
+                # 越过代码末尾，等价于执行 STOP
+                break
+
+            block = translated[pc]
+            if block is not None:
+                block_fn, end_pc, block_gas = block
+                if gas_meter.gas_remaining >= block_gas:
+                    block_fn(computation)
+                    code.program_counter = end_pc
                     continue
-                # ==================== END: FUSION LOGIC INSERTION ====================
 
+            opcode, next_pc, rule_id, operand = plan[pc]
+
+            try:
+                if operand is None:
+                    code.program_counter = pc + 1
+                    if rule_id is None:
+                        opcode_fn = opcode_table[opcode]
+                        if opcode_fn is None:
+                            opcode_fn = InvalidOpcode(opcode)
+                        opcode_fn(computation)
+                    else:
+                        fused_table[opcode](computation)
+                else:
+                    code.program_counter = next_pc
+                    operand_table[opcode](computation, operand)
+            except Halt:
+                break
+
+            if rule_id is not None:
+                if next_pc is not None:
+                    code.program_counter = next_pc
+                fusion_hits[rule_id] += 1
+
+    @classmethod
+    def _block_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis) -> None:
+        """
+        按基本块执行的生产循环。
+
+        进入一个块时，如果剩余 gas 足够支付整个块的静态 gas，就一次性扣掉，
+        块内的 as_opcode 指令直接调用 logic_fn；否则这个块退回逐条扣费，
+        保证 OutOfGas 仍然在原来的那条指令上抛出。
+        打开 unchecked_stack 时，再在块入口检查一次栈高度，通过后块内的
+        栈操作改用 unchecked_ops 中的免检查版本；检查不通过则整个块照常执行，
+        下溢/上溢仍然在原来的那条指令上抛出。
+        """
+        if analysis.blocks is None:
+            analysis.blocks = build_block_table(analysis.code, analysis.plan, cls.opcodes, cls._rule_lengths)
+            cls._plan_cache.persist(analysis)
+
+        opcode_table = cls._opcode_table
+        operand_table = cls._operand_table
+        fused_table = cls._fused_table
+        precharged_lookup = cls._precharged_lookup
+        unchecked_lookup = cls._unchecked_lookup
+        unchecked_stack = cls.unchecked_stack
+        fusion_hits = computation.fusion_hits
+        plan = analysis.plan
+        plan_len = len(plan)
+        block_entries = analysis.blocks.entries
+        code = computation.code
+        gas_meter = computation.get_gas_meter()
+        values = cast(BaseComputation, computation)._stack.values
+        precharged = False
+        unchecked = False
+
+        while True:
+            pc = code.program_counter
+            if pc >= plan_len:
+                # 越过代码末尾，等价于执行 STOP
+                break
+
+            opcode, next_pc, rule_id, operand = plan[pc]
+            code.program_counter = pc + 1
+
+            block_info = block_entries[pc]
+            if block_info is not None:
+                block_total, required_depth, max_growth = block_info
+                precharged = gas_meter.gas_remaining >= block_total
+                if precharged and block_total:
+                    gas_meter.consume_gas(block_total, reason="BLOCK PRECHARGE")
+                unchecked = (
+                    precharged
+                    and unchecked_stack
+                    and required_depth <= len(values) <= STACK_LIMIT - max_growth
+                )
+
+            if rule_id is not None:
+                # 融合指令是块的最后一条，自己扣费、自己检查栈
                 try:
-                    opcode_fn = opcode_lookup[opcode]
-                except KeyError:
-                    opcode_fn = InvalidOpcode(opcode)
+                    if operand is None:
+                        fused_table[opcode](computation)
+                    else:
+                        operand_table[opcode](computation, operand)
+                except Halt:
+                    break
+                if next_pc is not None:
+                    code.program_counter = next_pc
+                fusion_hits[rule_id] += 1
+                continue
 
-                if show_debug2:
-                    # We dig into some internals for debug logs
-                    base_comp = cast(BaseComputation, computation)
+            if operand is not None:
+                # 预解码的 PUSH: 直接压入 int，跳过立即数
+                code.program_counter = next_pc
+                if unchecked:
+                    values.append(operand)
+                elif precharged:
+                    push_int_precharged(computation, operand)
+                else:
+                    operand_table[opcode](computation, operand)
+                continue
+
+            if unchecked:
+                unchecked_fn = unchecked_lookup[opcode]
+                if unchecked_fn is not None:
+                    unchecked_fn(computation, values)
+                    continue
 
+            if precharged:
+                opcode_fn = precharged_lookup[opcode]
+            else:
+                opcode_fn = opcode_table[opcode]
+            if opcode_fn is None:
+                opcode_fn = InvalidOpcode(opcode)
+
+            try:
+                opcode_fn(computation)
+            except Halt:
+                break
+
+    @classmethod
+    def _debug_loop(cls, computation: ComputationAPI, analysis: CodeAnalysis) -> None:
+        """
+        带调试输出的循环，只在 computation logger 打开 DEBUG 级别时使用。
+
+        总是逐条指令扣费 (与 _main_loop 的执行结果完全一致)，记录每次融合命中，
+        打开 DEBUG2 时还会输出每条指令的 PC 和栈内容。
+        """
+        show_debug2 = computation.logger.show_debug2
+        opcode_table = cls._opcode_table
+        operand_table = cls._operand_table
+        fused_table = cls._fused_table
+        fusion_hits = computation.fusion_hits
+        plan = analysis.plan
+        plan_len = len(plan)
+        code = computation.code
+
+        while True:
+            pc = code.program_counter
+            if pc >= plan_len:
+                # 越过代码末尾，等价于执行 STOP
+                break
+
+            opcode, next_pc, rule_id, operand = plan[pc]
+
+            if operand is None:
+                code.program_counter = pc + 1
+                if rule_id is None:
+                    opcode_fn = opcode_table[opcode]
+                    if opcode_fn is None:
+                        opcode_fn = InvalidOpcode(opcode)
+                else:
+                    opcode_fn = fused_table[opcode]
+            else:
+                code.program_counter = next_pc
+                operand_fn = operand_table[opcode]
+                if rule_id is not None:
+                    operand_mnemonic = cls.operand_logic_fns[opcode][1]
+                else:
+                    operand_mnemonic = opcode_table[opcode].mnemonic
+
+            if rule_id is not None:
+                computation.logger.debug(f"FUSION HIT: {cls._rule_names[rule_id]} at PC {pc}")
+
+            if show_debug2:
+                # We dig into some internals for debug logs
+                base_comp = cast(BaseComputation, computation)
+
+                if operand is not None:
+                    mnemonic = operand_mnemonic
+                elif rule_id is not None:
+                    mnemonic = cls.fused_logic_fns[opcode][1]
+                else:
                     try:
                         mnemonic = opcode_fn.mnemonic
                     except AttributeError:
                         mnemonic = opcode_fn.__wrapped__.mnemonic  # type: ignore
 
-                    computation.logger.debug2(
-                        f"OPCODE: 0x{opcode:x} ({mnemonic}) | "
-                        f"pc: {max(0, computation.code.program_counter - 1)} | "
-                        f"stack: {base_comp._stack}"
-                    )
+                computation.logger.debug2(
+                    f"OPCODE: 0x{opcode:x} ({mnemonic}) | "
+                    f"pc: {pc} | "
+                    f"stack: {base_comp._stack}"
+                )
 
-                try:
-                    opcode_fn(computation=computation)
-                except Halt:
-                    break
+            try:
+                if operand is None:
+                    opcode_fn(computation)
+                else:
+                    operand_fn(computation, operand)
+            except Halt:
+                break
 
-        return computation
+            if rule_id is not None:
+                if next_pc is not None:
+                    code.program_counter = next_pc
+                fusion_hits[rule_id] += 1
+
+
+FusedComputation._build_dispatch_tables()
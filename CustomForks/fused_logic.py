@@ -13,6 +13,11 @@ from eth._utils.numeric import (
 from eth.abc import (
     ComputationAPI,
 )
+from eth.exceptions import (
+    FullStack,
+)
+
+from int_stack import STACK_LIMIT, pop_ints, push_int
 
 def fused_sub_mul(computation: ComputationAPI) -> None:
     """
@@ -26,11 +31,13 @@ def fused_sub_mul(computation: ComputationAPI) -> None:
     1. SUB: Pops s0, s1. Pushes (s1 - s0). Stack: [..., s2, (s1-s0)]
     2. MUL: Pops (s1-s0), s2. Pushes (s2 * (s1-s0)). Stack: [..., result]
     """
-    # computation.stack_pop_ints(3) 返回一个元组，
+    # pop_ints(values, 3) 与 computation.stack_pop_ints(3) 相同，返回一个元组，
     # 其中第一个元素是原栈顶 (s0)，第二个是原次栈顶 (s1)，第三个是原第三个元素 (s2)。
-    # 例如，如果栈是 [..., X, Y, Z] (Z是栈顶), stack_pop_ints(3) 返回 (Z, Y, X)
+    # 例如，如果栈是 [..., X, Y, Z] (Z是栈顶), pop_ints(values, 3) 返回 (Z, Y, X)
     # 所以 s0 = Z, s1 = Y, s2 = X
-    s0, s1, s2 = computation.stack_pop_ints(3)
+    # 直接操作栈的 values 列表，省掉 Stack 方法的属性查找和逐个元素的类型转换函数调用
+    values = computation._stack.values
+    s0, s1, s2 = pop_ints(values, 3)
 
     # 执行减法: (s1 - s0)
     # 结果需要 & UINT_256_MAX 来模拟 EVM 的 256位无符号整数行为
@@ -41,7 +48,7 @@ def fused_sub_mul(computation: ComputationAPI) -> None:
     mul_result = (s2 * sub_result) & constants.UINT_256_MAX
 
     # 将最终结果压回堆栈
-    computation.stack_push_int(mul_result)
+    push_int(values, mul_result)
 
 # 示例中使用的常量 (通常在 py-evm 的 constants 模块中)
 # class constants: # 只是为了让上面的代码片段能独立理解
@@ -71,8 +78,13 @@ def fused_push1_dup1(computation: ComputationAPI) -> None:
     # 2. 将读取到的值连续两次压入堆栈。
     #    这比一次 push + 一次 dup 更高效，因为它减少了内部的堆栈指针操作
     #    和一次函数分派的开销。
-    computation.stack_push_bytes(value_to_push)
-    computation.stack_push_bytes(value_to_push)
+    #    直接压入 int (与压入 bytes 等价，见 int_stack)，两次压栈的上溢检查合并成一次。
+    values = computation._stack.values
+    if len(values) > STACK_LIMIT - 2:
+        raise FullStack("Stack limit reached")
+    value = int.from_bytes(value_to_push, "big")
+    values.append(value)
+    values.append(value)
 
     # 3. 消耗 Gas。原始成本是 3 + 3 = 6。
     #    我们设定一个更低的值（例如4或5）来体现优化带来的节省。
@@ -7,14 +7,30 @@
 PUSH1_OPCODE = 0x60
 PUSH2_OPCODE = 0x61
 JUMP_OPCODE = 0x56
+JUMPI_OPCODE = 0x57
 SUB_OPCODE = 0x03
 MUL_OPCODE = 0x02
 ADD_OPCODE = 0x01
 DUP1_OPCODE = 0x80
+POP_OPCODE = 0x50
+SWAP1_OPCODE = 0x90
 
 # --- 虚拟的融合操作码ID (Virtual Fused Opcode IDs) ---
 VIRTUAL_SUB_MUL_OPCODE = 0xB0
 VIRTUAL_PUSH1_DUP1_OPCODE = 0xB1
+VIRTUAL_SWAP1_POP_OPCODE = 0xB2
+VIRTUAL_PUSH1_ADD_OPCODE = 0xB3
+VIRTUAL_CONST_FOLD_OPCODE = 0xB4
+VIRTUAL_SELECTOR_DISPATCH_OPCODE = 0xB5
+VIRTUAL_STATIC_JUMP_OPCODE = 0xB6
+VIRTUAL_STATIC_JUMPI_OPCODE = 0xB7
+VIRTUAL_CHECKED_ARITHMETIC_OPCODE = 0xB8
+VIRTUAL_STORAGE_MAPPING_OPCODE = 0xB9
+
+# 通过 register_rules 注册的规则 (例如 rule_generator 生成的) 使用不小于这个值的融合 ID。
+# 融合 ID 只出现在计划表的融合条目里，由 FusedComputation._fused_table 分派，
+# 放在 0x100 以上就不会与任何 fork 的 opcode (包括以后新增的) 重叠。
+REGISTERED_FUSED_OPCODE_BASE = 0x100
 
 
 # =================================================================
@@ -26,19 +42,47 @@ OPCODE_MNEMONICS = {
     PUSH1_OPCODE: "PUSH1",
     PUSH2_OPCODE: "PUSH2",
     JUMP_OPCODE: "JUMP",
+    JUMPI_OPCODE: "JUMPI",
     SUB_OPCODE: "SUB",
     MUL_OPCODE: "MUL",
     ADD_OPCODE: "ADD",
+    DUP1_OPCODE: "DUP1",
+    POP_OPCODE: "POP",
+    SWAP1_OPCODE: "SWAP1",
     # --- 融合后的操作码也可以加进来 ---
     VIRTUAL_SUB_MUL_OPCODE: "FUSED_SUB_MUL",
-    VIRTUAL_PUSH1_DUP1_OPCODE: "FUSED_PUSH1_DUP1"
+    VIRTUAL_PUSH1_DUP1_OPCODE: "FUSED_PUSH1_DUP1",
+    VIRTUAL_SWAP1_POP_OPCODE: "FUSED_SWAP1_POP",
+    VIRTUAL_PUSH1_ADD_OPCODE: "FUSED_PUSH1_ADD",
+    VIRTUAL_CONST_FOLD_OPCODE: "FUSED_CONST_FOLD",
+    VIRTUAL_SELECTOR_DISPATCH_OPCODE: "FUSED_SELECTOR_DISPATCH",
+    VIRTUAL_STATIC_JUMP_OPCODE: "FUSED_STATIC_JUMP",
+    VIRTUAL_STATIC_JUMPI_OPCODE: "FUSED_STATIC_JUMPI",
+    VIRTUAL_CHECKED_ARITHMETIC_OPCODE: "FUSED_CHECKED_ARITHMETIC",
+    VIRTUAL_STORAGE_MAPPING_OPCODE: "FUSED_STORAGE_MAPPING",
 }
 
 
 # =================================================================
 # 3. 定义所有融合规则 (All Fusion Rules)
 # =================================================================
-# 这部分结构保持不变。
+# 规则会被 rule_compiler 编译成一棵按指令匹配的前缀树，匹配时总是取最长的规则。
+# 一条规则可以用两种方式描述它覆盖的指令序列:
+#   - "sequence": 直接给出 2~8 条指令的 opcode 元组 (PUSH 的立即数不算在内)，
+#     例如 (PUSH1_OPCODE, DUP1_OPCODE)
+#   - 旧写法: "trigger_opcode" + "pattern_opcodes"，由编译器按指令边界自动解码
+# fused_logic.py 里没有手写融合函数的规则，会由 fusion_synthesizer 按单条指令的语义自动合成
+# (序列只能包含 PUSH/DUP/SWAP/POP/JUMPDEST 和算术、比较、位运算指令)。
+# 带 "constant_folding": True 的规则按值匹配，没有固定的指令序列: 启用后，只依赖立即数的
+# PUSH/运算序列 (例如 PUSH1 a PUSH1 b ADD、PUSH1 0x1f NOT) 会在分析阶段被折叠成常量。
+# 带 "selector_dispatch": True 的规则同样按值匹配: 启用后，Solidity 函数分派器里由
+# DUP1 PUSH4 <selector> EQ PUSH2 <dest> JUMPI 组成的比较链会被换成一次查表跳转。
+# 带 "static_jump": True 的规则把 PUSHn <dest> + "jump_opcode" (JUMP 或 JUMPI) 融合成一条指令，
+# 跳转目标在分析阶段校验，目标不合法的跳转不融合。
+# 带 "checked_arithmetic": True 的规则融合 Solidity 0.8 的溢出检查: 不跳转时进入 Panic(0x11) 的
+# PUSHn <ok> JUMPI 连同它前面只做栈上纯计算的检查段 (运算本身、比较、ISZERO 等) 合成一条指令。
+# 带 "storage_mapping": True 的规则融合 mapping 的存储访问: MSTORE key、MSTORE slot、SHA3 以及紧跟着的 SLOAD / SSTORE
+# (连同中间的 DUP/SWAP 等) 合成一条指令，存储位置直接由 key、slot 算出并缓存。
 ALL_FUSION_RULES = {
     "SUB_MUL": {
         "rule_name": "SUB_MUL",
@@ -58,4 +102,54 @@ ALL_FUSION_RULES = {
         "fused_opcode_id": VIRTUAL_PUSH1_DUP1_OPCODE,
         "fused_mnemonic": "FUSED_PUSH1_DUP1"
     },
+    "SWAP1_POP": {
+        "rule_name": "SWAP1_POP",
+        "sequence": (SWAP1_OPCODE, POP_OPCODE),
+        "fused_opcode_id": VIRTUAL_SWAP1_POP_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_SWAP1_POP_OPCODE)
+    },
+    "PUSH1_ADD": {
+        "rule_name": "PUSH1_ADD",
+        "sequence": (PUSH1_OPCODE, ADD_OPCODE),
+        "fused_opcode_id": VIRTUAL_PUSH1_ADD_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_PUSH1_ADD_OPCODE)
+    },
+    "CONST_FOLD": {
+        "rule_name": "CONST_FOLD",
+        "constant_folding": True,
+        "fused_opcode_id": VIRTUAL_CONST_FOLD_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_CONST_FOLD_OPCODE)
+    },
+    "SELECTOR_DISPATCH": {
+        "rule_name": "SELECTOR_DISPATCH",
+        "selector_dispatch": True,
+        "fused_opcode_id": VIRTUAL_SELECTOR_DISPATCH_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_SELECTOR_DISPATCH_OPCODE)
+    },
+    "STATIC_JUMP": {
+        "rule_name": "STATIC_JUMP",
+        "static_jump": True,
+        "jump_opcode": JUMP_OPCODE,
+        "fused_opcode_id": VIRTUAL_STATIC_JUMP_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_STATIC_JUMP_OPCODE)
+    },
+    "STATIC_JUMPI": {
+        "rule_name": "STATIC_JUMPI",
+        "static_jump": True,
+        "jump_opcode": JUMPI_OPCODE,
+        "fused_opcode_id": VIRTUAL_STATIC_JUMPI_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_STATIC_JUMPI_OPCODE)
+    },
+    "CHECKED_ARITHMETIC": {
+        "rule_name": "CHECKED_ARITHMETIC",
+        "checked_arithmetic": True,
+        "fused_opcode_id": VIRTUAL_CHECKED_ARITHMETIC_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_CHECKED_ARITHMETIC_OPCODE)
+    },
+    "STORAGE_MAPPING": {
+        "rule_name": "STORAGE_MAPPING",
+        "storage_mapping": True,
+        "fused_opcode_id": VIRTUAL_STORAGE_MAPPING_OPCODE,
+        "fused_mnemonic": OPCODE_MNEMONICS.get(VIRTUAL_STORAGE_MAPPING_OPCODE)
+    },
 }
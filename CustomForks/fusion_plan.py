@@ -0,0 +1,241 @@
+# fusion_plan.py
+
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from eth_hash.auto import keccak
+
+from analysis_cache import AnalysisDiskCache
+from checked_arithmetic import CheckedArithmeticMatcher
+from constant_folding import ConstantFolder
+from jumpdest_bitmap import JUMPDEST_BITMAPS
+from rule_compiler import PUSH32_OPCODE, RuleTrieNode, match_longest, push_data_size
+from selector_dispatch import SelectorDispatchMatcher
+from static_jumps import StaticJumpMatcher
+from storage_mapping import StorageMappingMatcher
+
+
+# 计划表中每个 PC 对应一个条目: (opcode_id, next_pc, rule_id, operand)
+#   - 普通指令: (opcode, None, None, None)，由原生 opcode 函数自己读取参数、推进 PC
+#   - 融合指令: (fused_opcode_id, 融合序列结束后的 PC, 规则的整数 ID, operand)；
+#     跳转类融合指令 (rule["is_jump"]) 的 next_pc 为 None，PC 由融合函数自己设置。
+#     operand 是分析阶段为这一处代码算好的数据 (例如常量折叠的结果)，不为 None 时
+#     执行的是 fn(computation, operand) 形式的融合函数。跳转类且带 operand 的条目
+#     (函数分派器) 由 operand.fallthrough_pc 给出不跳转时顺序执行到的 PC
+#   - 预解码的 PUSH: (PUSHn, 下一条指令的 PC, None, 立即数的 int 值)，执行时不再读取代码流
+PlanEntry = Tuple[int, Optional[int], Optional[int], Any]
+FusionPlan = List[PlanEntry]
+
+# 普通指令的条目对所有合约都一样，预先建好 256 个共享的 tuple，避免每个字节都分配一次
+_PLAIN_ENTRIES: Tuple[PlanEntry, ...] = tuple((op, None, None, None) for op in range(256))
+
+PUSH0_OPCODE = 0x5F
+
+# 计划缓存默认最多保留多少个合约
+DEFAULT_PLAN_CACHE_SIZE = 512
+
+
+def build_fusion_plan(
+    code: bytes,
+    rule_trie: RuleTrieNode,
+    constant_folder: Optional[ConstantFolder] = None,
+    predecode_push: bool = False,
+    selector_dispatcher: Optional[SelectorDispatchMatcher] = None,
+    static_jumps: Optional[StaticJumpMatcher] = None,
+    jumpdests: Optional[bytearray] = None,
+    checked_arithmetic: Optional[CheckedArithmeticMatcher] = None,
+    storage_mapping: Optional[StorageMappingMatcher] = None,
+) -> FusionPlan:
+    """
+    对一份字节码做一次性的融合分析，生成按 PC 索引的计划表。
+
+    按指令边界线性扫描字节码 (跳过 PUSH 的立即数)，在每条指令处用规则 trie
+    做最长匹配，匹配成功的规则决定该 PC 的融合条目。
+    打开常量折叠时，同一个 PC 上再尝试一次折叠，取覆盖范围更长的那个 (一样长时用 trie 规则)。
+    打开函数分派器融合时，整条比较链优先替换成一个分派条目。
+    打开溢出检查融合时，守卫 Panic(0x11) 的检查段 (直到 JUMPI) 同样优先替换成一个条目。
+    打开 mapping 访问融合时，写入 key、slot 并做 SHA3 (以及紧跟着的 SLOAD) 的映射段同样优先替换成一个条目。
+    打开静态跳转融合时，目标合法的 PUSHn JUMP/JUMPI 换成静态跳转条目
+    (trie 规则或常量折叠覆盖得更长时让给它们)。
+    跳转目标的合法性用 jumpdests (jumpdest_bitmap 的位图) 校验，没有给出时从进程内的位图缓存取。
+    任何融合条目都不跨过中间的 JUMPDEST，跳转目标总是落在某个条目的开头。
+    打开 predecode_push 时，没有被融合的 PUSH 把立即数提前解码成 int 存进条目
+    (代码末尾被截断的立即数按 py-evm 的做法在右侧补零)。
+
+    PUSH 立即数所在的位置同样填入普通条目，和原来逐字节迭代 CodeStream 的行为保持一致
+    (正常情况下跳转校验会阻止 PC 落到这些位置)。
+    """
+    code_len = len(code)
+    plan = [_PLAIN_ENTRIES[op] for op in code]
+
+    if (
+        not rule_trie.children
+        and constant_folder is None
+        and not predecode_push
+        and selector_dispatcher is None
+        and static_jumps is None
+        and checked_arithmetic is None
+        and storage_mapping is None
+    ):
+        return plan
+
+    if jumpdests is None and (
+        selector_dispatcher is not None or static_jumps is not None or checked_arithmetic is not None
+    ):
+        jumpdests = JUMPDEST_BITMAPS.get(code)
+    dispatches = selector_dispatcher.find(code, jumpdests) if selector_dispatcher is not None else {}
+    checks = checked_arithmetic.find(code, jumpdests) if checked_arithmetic is not None else {}
+    mappings = storage_mapping.find(code) if storage_mapping is not None else {}
+
+    pc = 0
+    while pc < code_len:
+        opcode = code[pc]
+        if pc in dispatches:
+            fallthrough_pc, dispatch = dispatches[pc]
+            plan[pc] = (selector_dispatcher.fused_opcode_id, None, selector_dispatcher.rule_id, dispatch)
+            pc = fallthrough_pc
+            continue
+        if pc in checks:
+            fallthrough_pc, check = checks[pc]
+            plan[pc] = (checked_arithmetic.fused_opcode_id, None, checked_arithmetic.rule_id, check)
+            pc = fallthrough_pc
+            continue
+        if pc in mappings:
+            end_pc, mapping = mappings[pc]
+            plan[pc] = (storage_mapping.fused_opcode_id, end_pc, storage_mapping.rule_id, mapping)
+            pc = end_pc
+            continue
+
+        rule, end_pc = None, pc
+        if opcode in rule_trie.children:
+            rule, end_pc = match_longest(code, pc, rule_trie)
+        folded = constant_folder.fold(code, pc) if constant_folder is not None else None
+        jump = static_jumps.match(code, pc, jumpdests) if static_jumps is not None else None
+
+        if jump is not None and jump[0] >= end_pc and (folded is None or jump[0] >= folded[0]):
+            plan[pc] = jump[1]
+        elif folded is not None and folded[0] > end_pc:
+            plan[pc] = (constant_folder.fused_opcode_id, folded[0], constant_folder.rule_id, folded[1])
+        elif rule is not None:
+            next_pc = None if rule.get("is_jump") else end_pc
+            plan[pc] = (rule["fused_opcode_id"], next_pc, rule["rule_id"], None)
+        elif predecode_push and PUSH0_OPCODE <= opcode <= PUSH32_OPCODE:
+            data_size = push_data_size(opcode)
+            raw_value = code[pc + 1:pc + 1 + data_size].ljust(data_size, b"\x00")
+            plan[pc] = (opcode, pc + 1 + data_size, None, int.from_bytes(raw_value, "big"))
+        pc += 1 + push_data_size(opcode)
+
+    return plan
+
+
+class CodeAnalysis:
+    """
+    一份字节码的全部静态分析结果。
+
+    plan 在创建时就生成；其余的分析结果 (基本块表、翻译好的直线代码段、预先翻译好的模块、热点循环的 trace)
+    只有在对应的执行模式打开时才由 FusedComputation 按需补上，并随计划表一起缓存。
+    """
+
+    __slots__ = (
+        "code", "code_hash", "jumpdests", "plan", "blocks", "translated", "aot_blocks", "aot_checked",
+        "loop_counts", "traces",
+    )
+
+    def __init__(self, code: bytes, code_hash: bytes, jumpdests: bytearray, plan: FusionPlan) -> None:
+        self.code = code
+        self.code_hash = code_hash
+        # JUMPDEST 位图 (与 jumpdest_bitmap 的进程内缓存共用同一个对象)，JUMP/JUMPI 用它校验目标
+        self.jumpdests = jumpdests
+        self.plan = plan
+        self.blocks = None
+        self.translated = None
+        # 磁盘缓存里这份代码的 AOT 模块 (没有时为 None)，aot_checked 表示是否已经查找过
+        self.aot_blocks = None
+        self.aot_checked = False
+        # 向后跳转的目标 PC -> 跳转次数；目标 PC -> 编译好的 trace (记录失败时为 None，不再重试)
+        self.loop_counts = {}
+        self.traces = {}
+
+
+class FusionPlanCache:
+    """
+    按代码内容缓存代码分析结果 (CodeAnalysis) 的 LRU 缓存。
+
+    以代码的 bytes 本身作为键: 命中时只需要 bytes 的 Python hash (算一次后缓存在对象上) 和一次比较，
+    不必对每个调用帧的代码计算 keccak。code hash 只在未命中时计算，用作磁盘缓存和位图缓存的键。
+
+    重放时大量交易都落在少数热点合约上，模式匹配只需要对每个合约做一次。
+    超过 max_size 时淘汰最久未使用的条目。
+    给出 disk_cache 时，内存里没有的代码先到磁盘缓存里找，新分析出的结果也写进磁盘缓存，
+    下次运行不必重新分析。
+    """
+
+    def __init__(self, max_size: int = DEFAULT_PLAN_CACHE_SIZE, disk_cache: Optional[AnalysisDiskCache] = None) -> None:
+        self.max_size = max_size
+        self.disk_cache = disk_cache
+        self._analyses: "OrderedDict[bytes, CodeAnalysis]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_analysis(
+        self,
+        code: bytes,
+        rule_trie: RuleTrieNode,
+        constant_folder: Optional[ConstantFolder] = None,
+        predecode_push: bool = False,
+        selector_dispatcher: Optional[SelectorDispatchMatcher] = None,
+        static_jumps: Optional[StaticJumpMatcher] = None,
+        checked_arithmetic: Optional[CheckedArithmeticMatcher] = None,
+        storage_mapping: Optional[StorageMappingMatcher] = None,
+    ) -> CodeAnalysis:
+        analysis = self._analyses.get(code)
+        if analysis is not None:
+            self._analyses.move_to_end(code)
+            self.hits += 1
+            return analysis
+
+        self.misses += 1
+        code_hash = keccak(code)
+        cached = self.disk_cache.load(code_hash, code) if self.disk_cache is not None else None
+        if cached is not None:
+            # 磁盘缓存只记录不是普通指令的条目，其余位置补上共享的普通条目；
+            # 读出的 JUMPDEST 位图放进进程内的位图缓存，与其他用到位图的地方共用
+            entries, jumpdests, blocks = cached
+            plan = [_PLAIN_ENTRIES[op] for op in code]
+            for pc, entry in entries.items():
+                plan[pc] = entry
+            JUMPDEST_BITMAPS.put(code_hash, jumpdests)
+            analysis = CodeAnalysis(code, code_hash, jumpdests, plan)
+            analysis.blocks = blocks
+        else:
+            jumpdests = JUMPDEST_BITMAPS.get(code, code_hash)
+            plan = build_fusion_plan(
+                code,
+                rule_trie,
+                constant_folder,
+                predecode_push,
+                selector_dispatcher,
+                static_jumps,
+                jumpdests,
+                checked_arithmetic,
+                storage_mapping,
+            )
+            analysis = CodeAnalysis(code, code_hash, jumpdests, plan)
+            self.persist(analysis)
+        self._analyses[code] = analysis
+        if len(self._analyses) > self.max_size:
+            self._analyses.popitem(last=False)
+        return analysis
+
+    def persist(self, analysis: CodeAnalysis) -> None:
+        """把分析结果 (包括之后按需补上的基本块表) 写进磁盘缓存，没有磁盘缓存时什么也不做。"""
+        if self.disk_cache is not None:
+            self.disk_cache.store(analysis.code_hash, analysis.code, analysis.plan, analysis.jumpdests, analysis.blocks)
+
+    def clear(self) -> None:
+        self._analyses.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._analyses)
@@ -0,0 +1,423 @@
+# fusion_synthesizer.py
+#
+# 根据单条指令的语义自动合成融合函数 (superinstruction)。
+#
+# 每条指令的语义与 OpcodeFucntionsInPyEVM 中的原版实现一一对应
+# (arithmetic.py、comparison.py、stack.py、duplication.py、swap.py)，
+# 这里写成“输入 -> 表达式”的模板。合成时对整条序列做一次符号执行:
+#   - 序列用到的原栈元素在函数入口一次性读出，中间结果全部放在 Python 局部变量里，
+#     只在最后把结果一次性写回 EVM 栈
+#   - 整条序列的静态 gas 在入口一次性扣除，栈高度也在入口一次性检查
+#   - 栈元素的表示与逐条执行完全一致: PUSH 的结果是 bytes，运算结果是 int，
+#     DUP/SWAP 原样搬运，所以后续按 bytes 取值的指令 (MSTORE 等) 看到的内容不变
+#
+# 这样新增一条融合指令只需要在 fusion_config 里写规则，不需要再手写融合函数。
+
+from typing import Callable, Dict, List, Optional, Tuple
+
+from eth import constants
+from eth._utils.numeric import signed_to_unsigned, unsigned_to_signed
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth.exceptions import FullStack, InsufficientStack
+from eth_hash.auto import keccak
+
+from rule_compiler import push_data_size
+
+
+UINT_256_MAX = constants.UINT_256_MAX
+GAS_SHA3WORD = constants.GAS_SHA3WORD
+STACK_LIMIT = 1024
+
+POP_OPCODE = 0x50
+JUMPDEST_OPCODE = 0x5B
+JUMPI_OPCODE = 0x57
+PUSH0_OPCODE = 0x5F
+SHA3_OPCODE = 0x20
+MSTORE_OPCODE = 0x52
+
+# 访问内存的指令: 不属于 “栈上纯计算”，只有调用方明确需要时才放进 synthesize_source 的序列 (见 storage_mapping)
+MEMORY_OPCODES = frozenset([SHA3_OPCODE, MSTORE_OPCODE])
+
+
+#
+# 有符号运算的辅助函数，逻辑与 OpcodeFucntionsInPyEVM 中的原版相同
+#
+def _sdiv(numerator: int, denominator: int) -> int:
+    numerator = unsigned_to_signed(numerator)
+    denominator = unsigned_to_signed(denominator)
+    if denominator == 0:
+        return 0
+    pos_or_neg = -1 if numerator * denominator < 0 else 1
+    return signed_to_unsigned(pos_or_neg * (abs(numerator) // abs(denominator)))
+
+
+def _smod(value: int, mod: int) -> int:
+    value = unsigned_to_signed(value)
+    mod = unsigned_to_signed(mod)
+    if mod == 0:
+        return 0
+    pos_or_neg = -1 if value < 0 else 1
+    return signed_to_unsigned((abs(value) % abs(mod) * pos_or_neg) & UINT_256_MAX)
+
+
+def _signextend(bits: int, value: int) -> int:
+    if bits <= 31:
+        sign_bit = 1 << (bits * 8 + 7)
+        if value & sign_bit:
+            return value | (constants.UINT_256_CEILING - sign_bit)
+        return value & (sign_bit - 1)
+    return value
+
+
+def _sar(shift_length: int, value: int) -> int:
+    value = unsigned_to_signed(value)
+    if shift_length >= 256:
+        return 0 if value >= 0 else constants.UINT_255_NEGATIVE_ONE
+    return (value >> shift_length) & UINT_256_MAX
+
+
+# opcode -> (弹出的元素个数, 结果表达式)。{0} 是原栈顶，{1} 是次栈顶，依此类推 (与 stack_pop_ints 的顺序一致)，
+# 所有输入都已经转换成 int，表达式的值就是压回栈上的那个 int。
+OPCODE_SEMANTICS: Dict[int, Tuple[int, str]] = {
+    0x01: (2, "({0} + {1}) & UINT_256_MAX"),  # ADD
+    0x02: (2, "({0} * {1}) & UINT_256_MAX"),  # MUL
+    0x03: (2, "({0} - {1}) & UINT_256_MAX"),  # SUB
+    0x04: (2, "0 if {1} == 0 else {0} // {1}"),  # DIV
+    0x05: (2, "_sdiv({0}, {1})"),  # SDIV
+    0x06: (2, "0 if {1} == 0 else {0} % {1}"),  # MOD
+    0x07: (2, "_smod({0}, {1})"),  # SMOD
+    0x08: (3, "0 if {2} == 0 else ({0} + {1}) % {2}"),  # ADDMOD
+    0x09: (3, "0 if {2} == 0 else ({0} * {1}) % {2}"),  # MULMOD
+    0x0B: (2, "_signextend({0}, {1})"),  # SIGNEXTEND
+    0x10: (2, "1 if {0} < {1} else 0"),  # LT
+    0x11: (2, "1 if {0} > {1} else 0"),  # GT
+    0x12: (2, "1 if unsigned_to_signed({0}) < unsigned_to_signed({1}) else 0"),  # SLT
+    0x13: (2, "1 if unsigned_to_signed({0}) > unsigned_to_signed({1}) else 0"),  # SGT
+    0x14: (2, "1 if {0} == {1} else 0"),  # EQ
+    0x15: (1, "1 if {0} == 0 else 0"),  # ISZERO
+    0x16: (2, "{0} & {1}"),  # AND
+    0x17: (2, "{0} | {1}"),  # OR
+    0x18: (2, "{0} ^ {1}"),  # XOR
+    0x19: (1, "UINT_256_MAX - {0}"),  # NOT
+    0x1A: (2, "0 if {0} >= 32 else ({1} // pow(256, 31 - {0})) % 256"),  # BYTE
+    0x1B: (2, "0 if {0} >= 256 else ({1} << {0}) & UINT_256_MAX"),  # SHL
+    0x1C: (2, "0 if {0} >= 256 else {1} >> {0}"),  # SHR
+    0x1D: (2, "_sar({0}, {1})"),  # SAR
+}
+
+# 合成出来的函数在这个命名空间里执行
+_SYNTHESIS_GLOBALS = {
+    "UINT_256_MAX": UINT_256_MAX,
+    "STACK_LIMIT": STACK_LIMIT,
+    "FullStack": FullStack,
+    "InsufficientStack": InsufficientStack,
+    "unsigned_to_signed": unsigned_to_signed,
+    "_sdiv": _sdiv,
+    "_smod": _smod,
+    "_signextend": _signextend,
+    "_sar": _sar,
+    "GAS_SHA3WORD": GAS_SHA3WORD,
+    "keccak": keccak,
+    # SHA3 的输入正好是两次 MSTORE 写入的两个字时使用，调用方可以通过 extra_globals 换成带缓存的版本
+    "keccak_words": lambda first, second: keccak(first + second),
+}
+
+
+def synthesis_globals() -> Dict[str, object]:
+    """合成的源码用到的全局名字。把合成的代码写进别的模块时 (见 rule_generator) 放进那个模块的全局命名空间。"""
+    return dict(_SYNTHESIS_GLOBALS)
+
+
+def _compile_semantics() -> Dict[int, Callable[..., int]]:
+    functions = {}
+    for opcode, (num_inputs, template) in OPCODE_SEMANTICS.items():
+        args = [f"a{i}" for i in range(num_inputs)]
+        functions[opcode] = eval(f"lambda {', '.join(args)}: {template.format(*args)}", dict(_SYNTHESIS_GLOBALS))
+    return functions
+
+
+# 同一套语义的可调用版本: opcode -> fn(*int 输入) -> int 结果，供常量折叠在分析阶段直接求值
+OPCODE_FUNCTIONS: Dict[int, Callable[..., int]] = _compile_semantics()
+
+
+def is_synthesizable_opcode(opcode: int) -> bool:
+    return (
+        opcode in OPCODE_SEMANTICS
+        or PUSH0_OPCODE <= opcode <= 0x9F  # PUSH0..PUSH32, DUP1..DUP16, SWAP1..SWAP16
+        or opcode in (POP_OPCODE, JUMPDEST_OPCODE)
+    )
+
+
+def can_synthesize(sequence: Tuple[int, ...]) -> bool:
+    """序列中的每条指令都只做栈上的纯计算时，才能自动合成融合函数。"""
+    return all(is_synthesizable_opcode(opcode) for opcode in sequence)
+
+
+class _SymbolicStack:
+    """
+    合成时使用的符号栈: 元素是局部变量名，栈顶在列表末尾。
+    读到比当前符号栈更深的位置时，按需从真实栈里补充输入变量 s0 (原栈顶)、s1、...
+    """
+
+    def __init__(self) -> None:
+        self.items: List[str] = []
+        self.inputs: List[str] = []
+        self.max_growth = 0
+
+    def ensure(self, depth: int) -> None:
+        while len(self.items) < depth:
+            name = f"s{len(self.inputs)}"
+            self.inputs.append(name)
+            self.items.insert(0, name)
+
+    def pop(self) -> str:
+        self.ensure(1)
+        return self.items.pop()
+
+    def push(self, name: str) -> None:
+        self.items.append(name)
+        self.max_growth = max(self.max_growth, len(self.items) - len(self.inputs))
+
+
+def _two_words_condition(size: str, start_position: str, low_position: str, high_position: str) -> str:
+    """SHA3 的输入 (start_position, size) 正好是写在 low_position、high_position 的两个字时成立的条件表达式。"""
+    conditions = [f"{size} == 64"]
+    if low_position != start_position:
+        conditions.append(f"{start_position} == {low_position}")
+    conditions.append(f"{high_position} == {start_position} + 32")
+    return " and ".join(conditions)
+
+
+def synthesize_source(
+    fn_name: str,
+    sequence: Tuple[int, ...],
+    opcode_lookup: Dict[int, OpcodeAPI],
+    mnemonic: str,
+    immediates: Optional[Tuple[Optional[bytes], ...]] = None,
+    ends_with_jumpi: bool = False,
+) -> str:
+    """
+    生成融合函数的 Python 源码，供 synthesize_fused_fn 编译，也方便调试时打印出来查看。
+
+    immediates 与 sequence 一一对应，给出每条 PUSH 的立即数 (其余指令为 None)。
+    给出时立即数直接作为常量写进源码 (用于已知具体代码的场合，例如 block_translator)，
+    否则在执行时从代码里读取。
+    ends_with_jumpi 表示序列 (以压入跳转目标的 PUSH 结尾) 后面还有一条 JUMPI:
+    函数连同 JUMPI 的 gas 一起扣费，弹出目标和条件，返回条件的 int 值，由调用方设置 PC
+    (用于 checked_arithmetic)。
+
+    序列里还可以有 MSTORE 和 SHA3 (MEMORY_OPCODES，用于 storage_mapping)，它们照常扩展内存、扣内存扩展的 gas、
+    写入内存，SHA3 的按字 gas 在大小已知时并入入口的静态 gas。SHA3 的输入正好是前面最近两次 MSTORE
+    写入的 64 字节时，直接用这两个字调用 keccak_words，不再从内存读出来。
+    """
+    stack = _SymbolicStack()
+    body: List[str] = []
+    # 已知是 int 的符号 -> 自己 (或常量的字面值)；其余符号第一次按 int 使用时生成转换后的变量名
+    int_names: Dict[str, str] = {}
+    # PUSH 出来的常量一定是 bytes
+    bytes_names = set()
+    # 值在合成时已知的 PUSH 常量 -> 它的 bytes 字面值，写回栈时直接使用
+    literals: Dict[str, str] = {}
+    # 值在合成时已知的 PUSH 常量 -> 它的 int 值
+    constants_by_name: Dict[str, int] = {}
+    # 序列里的 MSTORE: (写入位置的 int 表达式, 写入位置的常量值 (未知时为 None), 写入的 32 字节变量名)
+    stores: List[Tuple[str, Optional[int], str]] = []
+
+    def as_int(name: str) -> str:
+        if name not in int_names:
+            int_name = f"{name}_int"
+            if name in bytes_names:
+                body.append(f"    {int_name} = int.from_bytes({name}, 'big')")
+            else:
+                body.append(
+                    f"    {int_name} = int.from_bytes({name}, 'big') if {name}.__class__ is bytes else {name}"
+                )
+            int_names[name] = int_name
+        return int_names[name]
+
+    def as_word(name: str) -> str:
+        # 与 MSTORE 的 pop1_bytes + rjust(32) 相同: bytes 左侧补零，int 转成 32 字节大端序
+        if name in constants_by_name:
+            return repr(constants_by_name[name].to_bytes(32, "big"))
+        if name in bytes_names:
+            return f"{name}.rjust(32, b'\\x00')"
+        if name in int_names:
+            return f"{int_names[name]}.to_bytes(32, 'big')"
+        return f"{name}.rjust(32, b'\\x00') if {name}.__class__ is bytes else {name}.to_bytes(32, 'big')"
+
+    total_gas = 0
+    offset = 0
+    for index, opcode in enumerate(sequence):
+        total_gas += opcode_lookup[opcode].gas_cost
+        data_size = push_data_size(opcode)
+
+        if opcode == PUSH0_OPCODE or (data_size and immediates is not None):
+            name = f"p{index}"
+            value = immediates[index] if data_size else b""
+            literals[name] = repr(value)
+            constants_by_name[name] = int.from_bytes(value, "big")
+            int_names[name] = repr(constants_by_name[name])
+            stack.push(name)
+        elif data_size:
+            # 立即数紧跟在指令后面: 指令位于 start_pc - 1 + offset
+            name = f"p{index}"
+            body.append(f"    {name} = raw_code[start_pc + {offset}:start_pc + {offset + data_size}]")
+            bytes_names.add(name)
+            stack.push(name)
+        elif 0x80 <= opcode <= 0x8F:  # DUPn
+            position = opcode - 0x7F
+            stack.ensure(position)
+            stack.push(stack.items[-position])
+        elif 0x90 <= opcode <= 0x9F:  # SWAPn
+            position = opcode - 0x8F
+            stack.ensure(position + 1)
+            items = stack.items
+            items[-1], items[-position - 1] = items[-position - 1], items[-1]
+        elif opcode == POP_OPCODE:
+            stack.pop()
+        elif opcode == JUMPDEST_OPCODE:
+            pass
+        elif opcode == MSTORE_OPCODE:
+            start_name = stack.pop()
+            start_position = as_int(start_name)
+            name = f"m{index}"
+            body += [
+                f"    {name} = {as_word(stack.pop())}",
+                f"    computation.extend_memory({start_position}, 32)",
+                f"    computation.memory_write({start_position}, 32, {name})",
+            ]
+            stores.append((start_position, constants_by_name.get(start_name), name))
+        elif opcode == SHA3_OPCODE:
+            start_name, size_name = stack.pop(), stack.pop()
+            start_position, size = as_int(start_name), as_int(size_name)
+            name = f"t{index}"
+            # 与 sha3 相同: 先扩展内存，再扣按字的 gas (大小已知时已经并入入口的静态 gas)
+            charge = [f"    computation.extend_memory({start_position}, {size})"]
+            if size_name in constants_by_name:
+                total_gas += GAS_SHA3WORD * ((constants_by_name[size_name] + 31) // 32)
+            else:
+                charge.append(
+                    f"    computation.consume_gas(GAS_SHA3WORD * (({size} + 31) // 32), reason='SHA3: word gas cost')"
+                )
+            read = f"keccak(computation.memory_read_bytes({start_position}, {size}))"
+            if len(stores) < 2:
+                body += charge + [f"    {name} = {read}"]
+            else:
+                (first_position, first_value, first_word), (second_position, second_value, second_word) = stores[-2:]
+                size_value = constants_by_name.get(size_name)
+                start_value = constants_by_name.get(start_name)
+                if None not in (size_value, start_value, first_value, second_value):
+                    # 位置和大小都是常量: 合成时就能确定输入是不是这两个字。
+                    # 是的话两次 MSTORE 已经把内存扩展到了这个范围，不需要再扩展
+                    if size_value == 64 and start_value == first_value and second_value == start_value + 32:
+                        body.append(f"    {name} = keccak_words({first_word}, {second_word})")
+                    elif size_value == 64 and start_value == second_value and first_value == start_value + 32:
+                        body.append(f"    {name} = keccak_words({second_word}, {first_word})")
+                    else:
+                        body += charge + [f"    {name} = {read}"]
+                else:
+                    body += charge + [
+                        f"    if {_two_words_condition(size, start_position, first_position, second_position)}:",
+                        f"        {name} = keccak_words({first_word}, {second_word})",
+                        f"    elif {_two_words_condition(size, start_position, second_position, first_position)}:",
+                        f"        {name} = keccak_words({second_word}, {first_word})",
+                        "    else:",
+                        f"        {name} = {read}",
+                    ]
+            # SHA3 压入的是 bytes
+            bytes_names.add(name)
+            stack.push(name)
+        else:
+            num_inputs, template = OPCODE_SEMANTICS[opcode]
+            operands = [as_int(stack.pop()) for _ in range(num_inputs)]
+            name = f"t{index}"
+            body.append(f"    {name} = {template.format(*operands)}")
+            int_names[name] = name
+            stack.push(name)
+
+        offset += 1 + data_size
+
+    condition = None
+    if ends_with_jumpi:
+        total_gas += opcode_lookup[JUMPI_OPCODE].gas_cost
+        stack.pop()
+        condition = as_int(stack.pop())
+
+    depth = len(stack.inputs)
+    lines = [
+        f"def {fn_name}(computation):",
+        f'    """{mnemonic}: 由 fusion_synthesizer 合成"""',
+    ]
+    if total_gas:
+        lines.append(f"    computation.consume_gas({total_gas}, reason={mnemonic!r})")
+    lines.append("    values = computation._stack.values")
+    if depth:
+        lines += [
+            f"    if len(values) < {depth}:",
+            f"        raise InsufficientStack('Wanted {depth} stack items, only had %d' % len(values))",
+        ]
+    if stack.max_growth:
+        lines += [
+            f"    if len(values) + {stack.max_growth} > STACK_LIMIT:",
+            "        raise FullStack('Stack limit reached')",
+        ]
+    if immediates is None and any(push_data_size(opcode) for opcode in sequence):
+        lines += [
+            "    code = computation.code",
+            "    raw_code = code._raw_code_bytes",
+            "    start_pc = code.program_counter",
+        ]
+    lines += [f"    {name} = values[-{i + 1}]" for i, name in enumerate(stack.inputs)]
+    lines += body
+
+    outputs = ", ".join(literals.get(name, name) for name in stack.items)
+    if depth == 0:
+        if len(stack.items) == 1:
+            lines.append(f"    values.append({outputs})")
+        elif stack.items:
+            lines.append(f"    values.extend(({outputs},))")
+    elif depth == 1 and len(stack.items) == 1:
+        lines.append(f"    values[-1] = {outputs}")
+    else:
+        lines.append(f"    values[-{depth}:] = [{outputs}]")
+    if condition is not None:
+        lines.append(f"    return {condition}")
+
+    return "\n".join(lines) + "\n"
+
+
+def compile_synthesized(
+    source: str,
+    filename: str,
+    extra_globals: Optional[Dict] = None,
+) -> Dict[str, Callable[[ComputationAPI], None]]:
+    """
+    编译 synthesize_source 生成的源码 (可以是多个函数拼在一起)，返回模块的命名空间 (函数名 -> 函数)。
+    extra_globals 是源码里额外用到的全局名字。
+    """
+    namespace = dict(_SYNTHESIS_GLOBALS)
+    if extra_globals:
+        namespace.update(extra_globals)
+    exec(compile(source, filename, "exec"), namespace)
+    return namespace
+
+
+def synthesize_fused_fn(
+    sequence: Tuple[int, ...],
+    opcode_lookup: Dict[int, OpcodeAPI],
+    mnemonic: str,
+) -> Callable[[ComputationAPI], None]:
+    """
+    为一个指令序列合成融合函数。
+
+    返回的函数自己扣费 (整条序列的静态 gas 之和)、自己检查栈高度，
+    PC 由主循环在执行后移到序列末尾，所以它可以直接作为 gas_cost=0 的 as_opcode 逻辑函数使用。
+    """
+    if not can_synthesize(sequence):
+        raise ValueError(f"Cannot synthesize {mnemonic}: sequence contains unsupported opcodes")
+
+    fn_name = mnemonic.lower()
+    source = synthesize_source(fn_name, sequence, opcode_lookup, mnemonic)
+    fused_fn = compile_synthesized(source, f"<fused {mnemonic}>")[fn_name]
+    fused_fn.source = source
+    return fused_fn
@@ -0,0 +1,62 @@
+# halting_ops.py
+#
+# 不抛出 Halt 的 STOP / RETURN。
+#
+# py-evm 的 STOP、RETURN 用 raise Halt 结束执行，主循环在每条指令外面 try/except Halt 接住它。
+# 查看函数、代币转账这类很短的调用，抛出并展开异常在整次调用里占的比例不小。
+# 这里的版本做完同样的事情之后，把 PC 摆到代码末尾再正常返回:
+# FusedComputation 的每个循环本来就在 PC 越过代码末尾时退出 (等价于 STOP)，不需要额外的判断。
+# 执行结果 (output、gas、错误) 与原版完全相同。
+#
+# REVERT、INVALID 这类错误，以及 SELFDESTRUCT，仍然按 py-evm 的方式抛出异常:
+# 它们要经过 computation 的 __exit__ 记录错误、按错误类型处理 gas 和 return data。
+
+from typing import Dict
+
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth.vm.logic.flow import stop
+from eth.vm.logic.system import return_op
+from eth.vm.opcode import as_opcode
+
+
+STOP_OPCODE = 0x00
+RETURN_OPCODE = 0xF3
+
+
+def stop_without_halt(computation: ComputationAPI) -> None:
+    code = computation.code
+    code.program_counter = len(code)
+
+
+def return_without_halt(computation: ComputationAPI) -> None:
+    start_position, size = computation.stack_pop_ints(2)
+
+    computation.extend_memory(start_position, size)
+
+    computation.output = computation.memory_read_bytes(start_position, size)
+    code = computation.code
+    code.program_counter = len(code)
+
+
+# opcode -> (py-evm 的原版 logic_fn, 不抛出 Halt 的版本)
+HALTING_LOGIC_FNS = {
+    STOP_OPCODE: (stop, stop_without_halt),
+    RETURN_OPCODE: (return_op, return_without_halt),
+}
+
+
+def build_halting_opcodes(opcode_lookup: Dict[int, OpcodeAPI]) -> Dict[int, OpcodeAPI]:
+    """
+    返回替换 STOP / RETURN 的 OpcodeAPI (gas 与助记符不变)。
+    只替换 logic_fn 确实是 py-evm 原版的指令，fork 改写过的指令保持原样。
+    """
+    halting_opcodes = {}
+    for opcode, (original_fn, logic_fn) in HALTING_LOGIC_FNS.items():
+        opcode_fn = opcode_lookup.get(opcode)
+        if getattr(opcode_fn, "logic_fn", None) is original_fn:
+            halting_opcodes[opcode] = as_opcode(
+                logic_fn=logic_fn,
+                mnemonic=opcode_fn.mnemonic,
+                gas_cost=opcode_fn.gas_cost,
+            )
+    return halting_opcodes
@@ -0,0 +1,94 @@
+# int_stack.py
+#
+# FusedComputation 用的整数栈 (configure_engine(int_stack=True))。
+#
+# py-evm 的 Stack 里既有 int 也有 bytes: PUSH、MLOAD、CALLDATALOAD 等压入 bytes，运算结果压入 int，
+# 每次按另一种类型取值都要经过 to_int / to_bytes 的函数调用和 isinstance 判断，
+# stack_pop_ints 还要为每个元素跑一遍生成器。IntStack 在压栈时就把 bytes 转成 int，
+# 栈上几乎全是 int，只有 MSTORE、TSTORE、地址类指令这几个按 bytes 取值的地方才转换回去。
+# 用 int 代替 bytes 不改变任何可观察的行为: 按 bytes 取值的指令都会先补齐或截取到固定长度。
+#
+# 栈本身仍然是 Python 列表 (values)，unchecked_ops、合成的融合函数等快速路径直接操作它，
+# 它们可能照旧压入 bytes，所以取值时仍然兼容 bytes。
+# 模块里的 pop_ints / push_int 直接操作 values 列表，供手写的融合函数使用。
+
+from typing import List, Tuple, Union
+
+from eth.exceptions import FullStack, InsufficientStack
+from eth.validation import validate_stack_bytes
+from eth.vm.stack import Stack
+from eth_utils import int_to_big_endian
+
+
+STACK_LIMIT = 1024
+
+StackValues = List[Union[int, bytes]]
+
+
+def pop_ints(values: StackValues, num_items: int) -> Tuple[int, ...]:
+    """弹出 num_items 个元素并转成 int，顺序与 stack_pop_ints 相同 (第一个是原栈顶)。"""
+    if num_items > len(values):
+        raise InsufficientStack(f"Wanted {num_items} stack items, only had {len(values)}")
+    popped = values[-num_items:]
+    del values[-num_items:]
+    popped.reverse()
+    for index, value in enumerate(popped):
+        if value.__class__ is bytes:
+            popped[index] = int.from_bytes(value, "big")
+    return tuple(popped)
+
+
+def push_int(values: StackValues, value: int) -> None:
+    """压入一个 int，不再做 validate_stack_int 的范围检查 (EVM 运算的结果总在 256 位之内)。"""
+    if len(values) >= STACK_LIMIT:
+        raise FullStack("Stack limit reached")
+    values.append(value)
+
+
+class IntStack(Stack):
+    """
+    压栈时把 bytes 转成 int 的 Stack，按 int 取值时不再需要转换。
+    报错信息与 py-evm 的 Stack 相同。
+    """
+
+    __slots__ = ()
+
+    def push_int(self, value: int) -> None:
+        values = self.values
+        if len(values) >= STACK_LIMIT:
+            raise FullStack("Stack limit reached")
+        values.append(value)
+
+    def push_bytes(self, value: bytes) -> None:
+        values = self.values
+        if len(values) >= STACK_LIMIT:
+            raise FullStack("Stack limit reached")
+        validate_stack_bytes(value)
+        values.append(int.from_bytes(value, "big"))
+
+    def pop1_int(self) -> int:
+        values = self.values
+        if not values:
+            raise InsufficientStack("Wanted 1 stack item, had none")
+        value = values.pop()
+        if value.__class__ is bytes:
+            return int.from_bytes(value, "big")
+        return value
+
+    def pop1_bytes(self) -> bytes:
+        values = self.values
+        if not values:
+            raise InsufficientStack("Wanted 1 stack item, had none")
+        value = values.pop()
+        if value.__class__ is bytes:
+            return value
+        return int_to_big_endian(value)
+
+    def pop_ints(self, num_items: int) -> Tuple[int, ...]:
+        return pop_ints(self.values, num_items)
+
+    def pop_bytes(self, num_items: int) -> Tuple[bytes, ...]:
+        return tuple(
+            value if value.__class__ is bytes else int_to_big_endian(value)
+            for value in self.pop_any(num_items)
+        )
@@ -0,0 +1,115 @@
+# jumpdest_bitmap.py
+#
+# 按 code hash 缓存的 JUMPDEST 合法性位图。
+#
+# py-evm 的 CodeStream 每个 computation 都要重新判断跳转目标是否落在 PUSH 的立即数里
+# (is_valid_opcode 向前回看 32 个字节，结果只缓存在这个 CodeStream 对象上)，
+# 同一个代理合约、代币合约在一笔交易里的每个调用帧、以及每笔交易都要重新分析一遍。
+# 这里对每份代码只扫描一次，生成一个 bytearray 位图 (第 pc 位为 1 表示 pc 是合法的 JUMPDEST)，
+# 放进进程内有上限的 LRU 缓存:
+#   - FusedComputation 的 JUMP/JUMPI 直接查位图校验目标 (jump_with_bitmap / jumpi_with_bitmap)
+#   - 生成计划表时，静态跳转、函数分派器用它校验目标
+# 位图与规则配置无关，重新配置规则 (计划表缓存被清空) 时不需要重建。
+
+from collections import OrderedDict
+from typing import Optional
+
+from eth.abc import ComputationAPI
+from eth.exceptions import InvalidInstruction, InvalidJumpDestination
+from eth_hash.auto import keccak
+
+from fusion_synthesizer import JUMPDEST_OPCODE
+from rule_compiler import push_data_size
+
+
+# 位图缓存默认最多保留多少份代码
+DEFAULT_BITMAP_CACHE_SIZE = 4096
+
+
+def build_jumpdest_bitmap(code: bytes) -> bytearray:
+    """按指令边界扫描一次代码 (跳过 PUSH 的立即数)，返回合法 JUMPDEST 的位图。"""
+    bitmap = bytearray((len(code) + 7) >> 3)
+    pc = 0
+    code_len = len(code)
+    while pc < code_len:
+        opcode = code[pc]
+        if opcode == JUMPDEST_OPCODE:
+            bitmap[pc >> 3] |= 1 << (pc & 7)
+        pc += 1 + push_data_size(opcode)
+    return bitmap
+
+
+def is_jump_destination(bitmap: bytearray, pc: int) -> bool:
+    index = pc >> 3
+    return index < len(bitmap) and bool(bitmap[index] & (1 << (pc & 7)))
+
+
+class JumpdestBitmapCache:
+    """按 code hash 缓存 JUMPDEST 位图的 LRU 缓存，超过 max_size 时淘汰最久未使用的条目。"""
+
+    def __init__(self, max_size: int = DEFAULT_BITMAP_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._bitmaps: "OrderedDict[bytes, bytearray]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, code: bytes, code_hash: Optional[bytes] = None) -> bytearray:
+        if code_hash is None:
+            code_hash = keccak(code)
+        bitmap = self._bitmaps.get(code_hash)
+        if bitmap is not None:
+            self._bitmaps.move_to_end(code_hash)
+            self.hits += 1
+            return bitmap
+
+        self.misses += 1
+        bitmap = build_jumpdest_bitmap(code)
+        self.put(code_hash, bitmap)
+        return bitmap
+
+    def put(self, code_hash: bytes, bitmap: bytearray) -> None:
+        """放入在别处得到的位图 (例如从分析结果的磁盘缓存读出的)。"""
+        self._bitmaps[code_hash] = bitmap
+        self._bitmaps.move_to_end(code_hash)
+        if len(self._bitmaps) > self.max_size:
+            self._bitmaps.popitem(last=False)
+
+    def clear(self) -> None:
+        self._bitmaps.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._bitmaps)
+
+
+# 整个进程共用的位图缓存
+JUMPDEST_BITMAPS = JumpdestBitmapCache()
+
+
+def _invalid_jump(computation: ComputationAPI) -> None:
+    # 与 py-evm 的 jump/jumpi 报同样的错: 目标不是 JUMPDEST，或者是 PUSH 立即数里的 0x5b
+    if computation.code.peek() != JUMPDEST_OPCODE:
+        raise InvalidJumpDestination("Invalid Jump Destination")
+    raise InvalidInstruction("Jump resulted in invalid instruction")
+
+
+def jump_with_bitmap(computation: ComputationAPI) -> None:
+    """JUMP: 用 computation.jumpdests 位图校验目标，其余与 py-evm 的 jump 相同。"""
+    jump_dest = computation.stack_pop1_int()
+    computation.code.program_counter = jump_dest
+    bitmap = computation.jumpdests
+    index = jump_dest >> 3
+    if index >= len(bitmap) or not bitmap[index] & (1 << (jump_dest & 7)):
+        _invalid_jump(computation)
+
+
+def jumpi_with_bitmap(computation: ComputationAPI) -> None:
+    """JUMPI: 用 computation.jumpdests 位图校验目标，其余与 py-evm 的 jumpi 相同。"""
+    jump_dest, check_value = computation.stack_pop_ints(2)
+    if check_value:
+        computation.code.program_counter = jump_dest
+        bitmap = computation.jumpdests
+        index = jump_dest >> 3
+        if index >= len(bitmap) or not bitmap[index] & (1 << (jump_dest & 7)):
+            _invalid_jump(computation)
@@ -0,0 +1,138 @@
+# keccak_cache.py
+#
+# SHA3 的 keccak 结果缓存 (configure_keccak_cache 打开)。
+#
+# OpcodeFucntionsInPyEVM/sha3.py 每次都从内存读出输入重新计算 keccak，
+# 而 mapping 的存储位置 keccak(key . slot) 这类 64 字节的输入，在一笔交易里、以及前后的交易之间反复出现。
+# 这里用输入的 bytes 作为键，把较短的输入 (默认不超过 MAX_PREIMAGE_SIZE 字节) 的结果放进 LRU 缓存，
+# 缓存占用的内存超过上限时淘汰最久未使用的条目。
+# SHA3 的 gas (静态部分、内存扩展、按字计算的部分) 照常扣除，缓存只省掉计算 keccak 的时间。
+#
+# STORAGE_MAPPING 融合的 mapping 访问另有自己的 (key, slot) 缓存 (见 storage_mapping)，这里只作用于
+# 照常执行的 SHA3 指令；AOT 模块直接调用 fork 原来的指令，不使用这个缓存。
+
+from collections import OrderedDict
+from typing import Callable, Dict
+
+from eth import constants
+from eth._utils.numeric import ceil32
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth.vm.logic.sha3 import sha3
+from eth.vm.opcode import as_opcode
+from eth_hash.auto import keccak
+
+
+SHA3_OPCODE = 0x20
+
+# 只缓存不超过这么多字节的输入
+MAX_PREIMAGE_SIZE = 128
+
+# 缓存默认最多占用的内存 (字节)
+DEFAULT_KECCAK_CACHE_BYTES = 16 * 1024 * 1024
+
+# 每个条目除输入和结果本身之外的内存开销 (两个 bytes 对象头和 OrderedDict 的条目，CPython 上的近似值)
+ENTRY_OVERHEAD = 160
+
+
+class KeccakCache:
+    """
+    输入 bytes -> keccak 结果的 LRU 缓存。
+
+    占用的内存按 “输入长度 + 32 字节结果 + ENTRY_OVERHEAD” 累计，超过 max_bytes 时淘汰最久未使用的条目。
+    超过 max_preimage_size 的输入直接计算，不进入缓存，也不计入命中率。
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_KECCAK_CACHE_BYTES, max_preimage_size: int = MAX_PREIMAGE_SIZE) -> None:
+        self.max_bytes = max_bytes
+        self.max_preimage_size = max_preimage_size
+        self._digests: "OrderedDict[bytes, bytes]" = OrderedDict()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def keccak(self, preimage: bytes) -> bytes:
+        if len(preimage) > self.max_preimage_size:
+            return keccak(preimage)
+
+        digests = self._digests
+        digest = digests.get(preimage)
+        if digest is not None:
+            digests.move_to_end(preimage)
+            self.hits += 1
+            return digest
+
+        self.misses += 1
+        digest = keccak(preimage)
+        digests[preimage] = digest
+        self.size_bytes += len(preimage) + len(digest) + ENTRY_OVERHEAD
+        while self.size_bytes > self.max_bytes and digests:
+            evicted, evicted_digest = digests.popitem(last=False)
+            self.size_bytes -= len(evicted) + len(evicted_digest) + ENTRY_OVERHEAD
+            self.evictions += 1
+        return digest
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "entries": len(self._digests),
+            "size_bytes": self.size_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hit_rate,
+        }
+
+    def clear(self) -> None:
+        self._digests.clear()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+
+def make_cached_sha3(cache: KeccakCache) -> Callable[[ComputationAPI], None]:
+    """返回与 sha3 逻辑相同、但通过 cache 计算 keccak 的 logic_fn。"""
+    cached_keccak = cache.keccak
+
+    def sha3_with_cache(computation: ComputationAPI) -> None:
+        start_position, size = computation.stack_pop_ints(2)
+
+        computation.extend_memory(start_position, size)
+
+        sha3_bytes = computation.memory_read_bytes(start_position, size)
+        word_count = ceil32(len(sha3_bytes)) // 32
+
+        gas_cost = constants.GAS_SHA3WORD * word_count
+        computation.consume_gas(gas_cost, reason="SHA3: word gas cost")
+
+        result = cached_keccak(sha3_bytes)
+
+        computation.stack_push_bytes(result)
+
+    return sha3_with_cache
+
+
+def build_keccak_opcodes(opcode_lookup: Dict[int, OpcodeAPI], cache: KeccakCache) -> Dict[int, OpcodeAPI]:
+    """
+    返回替换 SHA3 的 OpcodeAPI (gas 与助记符不变)。
+    只替换 logic_fn 确实是 py-evm 原版的 SHA3，fork 改写过的指令保持原样。
+    """
+    opcode_fn = opcode_lookup.get(SHA3_OPCODE)
+    if getattr(opcode_fn, "logic_fn", None) is not sha3:
+        return {}
+    return {
+        SHA3_OPCODE: as_opcode(
+            logic_fn=make_cached_sha3(cache),
+            mnemonic=opcode_fn.mnemonic,
+            gas_cost=opcode_fn.gas_cost,
+        )
+    }
@@ -0,0 +1,112 @@
+# rule_compiler.py
+
+from typing import Dict, Iterable, Optional, Tuple
+
+
+PUSH1_OPCODE = 0x60
+PUSH32_OPCODE = 0x7F
+JUMPDEST_OPCODE = 0x5B
+
+# 一条融合规则最少/最多覆盖多少条指令
+MIN_PATTERN_LENGTH = 2
+MAX_PATTERN_LENGTH = 8
+
+
+def push_data_size(opcode: int) -> int:
+    """返回 PUSHn 指令后面紧跟的立即数字节数，其他指令返回 0。"""
+    if PUSH1_OPCODE <= opcode <= PUSH32_OPCODE:
+        return opcode - PUSH1_OPCODE + 1
+    return 0
+
+
+def skip_instructions(code: bytes, pc: int, count: int) -> int:
+    """返回从 pc 开始跳过 count 条指令 (含 PUSH 立即数) 之后的 PC。"""
+    for _ in range(count):
+        pc += 1 + push_data_size(code[pc])
+    return pc
+
+
+class RuleTrieNode:
+    """前缀树中的一个节点: children 以 opcode 为键，rule 非空表示有规则在此结束。"""
+
+    __slots__ = ("children", "rule")
+
+    def __init__(self) -> None:
+        self.children: Dict[int, "RuleTrieNode"] = {}
+        self.rule: Optional[Dict] = None
+
+
+def rule_sequence(rule: Dict) -> Tuple[int, ...]:
+    """
+    返回规则覆盖的指令序列 (只含 opcode，不含 PUSH 的立即数)。
+
+    新规则直接给出 "sequence"；老规则由 trigger_opcode + pattern_opcodes 推导，
+    pattern_opcodes 按指令边界解码，遇到 PUSH 时跳过它的立即数。
+    """
+    if "sequence" in rule:
+        return tuple(rule["sequence"])
+
+    sequence = [rule["trigger_opcode"]]
+    pattern = rule["pattern_opcodes"]
+    i = 0
+    while i < len(pattern):
+        sequence.append(pattern[i])
+        i += 1 + push_data_size(pattern[i])
+    return tuple(sequence)
+
+
+def compile_rules(rules: Iterable[Dict]) -> RuleTrieNode:
+    """
+    把一组融合规则编译成一棵以指令为边的前缀树 (trie)。
+
+    每个 PC 都是锚定匹配 (从该条指令开始往后走)，所以不需要 Aho-Corasick 的失败指针，
+    一棵 trie 就能让匹配代价只和模式长度相关，而与规则数量无关。
+    """
+    root = RuleTrieNode()
+    for rule in rules:
+        sequence = rule_sequence(rule)
+        if not MIN_PATTERN_LENGTH <= len(sequence) <= MAX_PATTERN_LENGTH:
+            raise ValueError(
+                f"Fusion rule {rule['rule_name']} covers {len(sequence)} instructions, "
+                f"expected {MIN_PATTERN_LENGTH} to {MAX_PATTERN_LENGTH}"
+            )
+
+        node = root
+        for opcode in sequence:
+            node = node.children.setdefault(opcode, RuleTrieNode())
+        if node.rule is not None:
+            raise ValueError(
+                f"Fusion rules {node.rule['rule_name']} and {rule['rule_name']} "
+                f"share the same instruction sequence"
+            )
+        node.rule = rule
+    return root
+
+
+def match_longest(code: bytes, pc: int, root: RuleTrieNode) -> Tuple[Optional[Dict], int]:
+    """
+    从 pc 处的指令开始沿 trie 向下走，返回 (最长匹配的规则, 匹配序列结束后的 PC)。
+    没有匹配时返回 (None, pc)。PUSH 的立即数会被正确跳过，不会被当作指令匹配。
+    融合不跨过基本块边界: 序列只能以 JUMPDEST 开头，匹配走到后面的 JUMPDEST (跳转目标) 就停止。
+    """
+    code_len = len(code)
+    start_pc = pc
+    node = root
+    best_rule = None
+    best_end_pc = pc
+
+    while pc < code_len:
+        opcode = code[pc]
+        if opcode == JUMPDEST_OPCODE and pc != start_pc:
+            break
+        node = node.children.get(opcode)
+        if node is None:
+            break
+        pc += 1 + push_data_size(opcode)
+        if pc > code_len:
+            break  # 立即数被代码末尾截断，不参与融合
+        if node.rule is not None:
+            best_rule = node.rule
+            best_end_pc = pc
+
+    return best_rule, best_end_pc
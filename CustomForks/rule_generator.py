@@ -0,0 +1,310 @@
+# rule_generator.py
+#
+# 基于动态 profile 自动生成融合规则 (profile-guided superinstructions)。
+#
+# 流程:
+#   1. count_ngrams_from_traces: 从重放得到的 opcode trace (IdenticalComputation 打开 DEBUG2
+#      时输出的 "OPCODE: 0x.. (..) | pc: .." 行) 统计动态 n-gram 次数。
+#      只统计在代码中连续排列的指令序列 (pc 恰好衔接)，跨越跳转或调用帧的窗口不计入，
+#      因为它们无法在静态的融合计划表里被匹配。
+#   2. score_candidates: 按“省掉的分派次数” (次数 × (长度 - 1)) 给候选序列打分，取前 K 个。
+#   3. emit_rules_module: 生成一个 Python 模块，里面是规则表和融合逻辑函数，
+#      通过 FusedComputation.register_rules 注册后即可交给 configure_rules 使用。
+#
+# 只含纯栈运算的序列不生成函数，configure_rules 时由 fusion_synthesizer 自动合成；
+# 其余序列 (含 MLOAD、JUMPI 等) 生成的融合函数里，连续两条以上的纯栈运算直接内联 fusion_synthesizer
+# 合成的代码 (中间值放在局部变量里，静态 gas 和栈高度一次检查)，其余指令按顺序调用原 fork 的 opcode 对象，
+# 调用前把 PC 摆到它在原代码中的位置，因此 gas、栈检查、报错信息都与逐条执行一致。
+
+import glob
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from eth.vm.forks.cancun.computation import CancunComputation
+
+import fusion_config
+from fusion_synthesizer import can_synthesize, is_synthesizable_opcode, synthesize_source
+from rule_compiler import MAX_PATTERN_LENGTH, MIN_PATTERN_LENGTH, push_data_size
+
+
+JUMP_OPCODE = 0x56
+JUMPI_OPCODE = 0x57
+JUMPDEST_OPCODE = 0x5B
+
+# 不能出现在融合序列里的指令: 停机指令和会创建新调用帧的指令
+# (省下一次分派对它们毫无意义，而且它们的执行路径不适合被包在别的函数里)
+UNFUSABLE_OPCODES = frozenset([
+    0x00,  # STOP
+    0xF0, 0xF1, 0xF2, 0xF3, 0xF4, 0xF5, 0xFA,  # CREATE/CALL 系列, RETURN
+    0xFD, 0xFE, 0xFF,  # REVERT, INVALID, SELFDESTRUCT
+])
+# 只能出现在序列末尾的指令 (执行后 PC 不再顺序递增)
+TERMINAL_OPCODES = frozenset([JUMP_OPCODE, JUMPI_OPCODE])
+
+# 每条 trace 行里的 opcode 和 pc，例如 "OPCODE: 0x60 (PUSH1) | pc: 12 | stack: [...]"
+_TRACE_LINE_RE = re.compile(r"OPCODE: 0x([0-9a-fA-F]+) \(([^)]*)\) \| pc: (\d+)")
+
+# 连续这么多条以上的纯栈运算才内联合成的代码，单条的照常调用 opcode 对象
+MIN_INLINE_RUN = 2
+
+# 生成规则的默认参数
+DEFAULT_TOP_K = 20
+DEFAULT_MIN_COUNT = 100
+
+# 一次 n-gram 统计的结果: 指令序列 -> 动态出现次数
+NgramCounts = Dict[Tuple[int, ...], int]
+
+
+def parse_trace_lines(lines: Iterable[str]) -> Iterator[Tuple[int, int]]:
+    """从 trace 文本中逐条取出 (pc, opcode)，其他行忽略。"""
+    for line in lines:
+        match = _TRACE_LINE_RE.search(line)
+        if match is not None:
+            yield int(match.group(3)), int(match.group(1), 16)
+
+
+def is_fusable_sequence(sequence: Tuple[int, ...]) -> bool:
+    """
+    判断一个指令序列能否被做成一条融合指令:
+    不含停机/调用类指令，JUMP/JUMPI 只能在最后，JUMPDEST 只能在最前
+    (中间的 JUMPDEST 是跳转目标，不能被吞进另一条指令里)。
+    """
+    last_index = len(sequence) - 1
+    for index, opcode in enumerate(sequence):
+        if opcode in UNFUSABLE_OPCODES or opcode not in CancunComputation.opcodes:
+            return False
+        if opcode in TERMINAL_OPCODES and index != last_index:
+            return False
+        if opcode == JUMPDEST_OPCODE and index != 0:
+            return False
+    return True
+
+
+def count_ngrams(
+    instructions: Iterable[Tuple[int, int]],
+    max_n: int = 4,
+    counts: Optional[NgramCounts] = None,
+) -> NgramCounts:
+    """
+    统计一条执行轨迹 [(pc, opcode), ...] 中长度 2~max_n 的连续指令序列。
+
+    两条相邻指令只有在 pc 恰好衔接 (后一条的 pc == 前一条的 pc + 1 + 立即数长度) 时
+    才算“连续”；遇到跳转、调用帧切换等情况窗口会被清空重新开始。
+    """
+    if counts is None:
+        counts = defaultdict(int)
+    max_n = min(max_n, MAX_PATTERN_LENGTH)
+
+    window: List[int] = []
+    expected_pc = None
+    for pc, opcode in instructions:
+        if pc != expected_pc:
+            window = []
+        window.append(opcode)
+        if len(window) > max_n:
+            del window[0]
+        for n in range(MIN_PATTERN_LENGTH, len(window) + 1):
+            counts[tuple(window[-n:])] += 1
+        expected_pc = pc + 1 + push_data_size(opcode)
+
+    return counts
+
+
+def count_ngrams_from_traces(trace_glob: str, max_n: int = 4) -> NgramCounts:
+    """读取所有匹配 trace_glob 的 trace 文件并合并 n-gram 次数，每个文件是一段独立的轨迹。"""
+    counts: NgramCounts = defaultdict(int)
+    for file_path in sorted(glob.glob(trace_glob)):
+        with open(file_path, "r", encoding="utf-8", errors="replace") as f:
+            count_ngrams(parse_trace_lines(f), max_n, counts)
+    return counts
+
+
+def score_candidates(
+    ngram_counts: NgramCounts,
+    top_k: int = DEFAULT_TOP_K,
+    min_count: int = DEFAULT_MIN_COUNT,
+) -> List[Tuple[Tuple[int, ...], int, int]]:
+    """
+    给候选序列打分并返回前 top_k 个 [(序列, 动态次数, 分数), ...]，分数从高到低。
+
+    分数 = 次数 × (序列长度 - 1)，即整条序列被融合后省掉的分派次数。
+    """
+    scored = [
+        (sequence, count, count * (len(sequence) - 1))
+        for sequence, count in ngram_counts.items()
+        if count >= min_count and is_fusable_sequence(sequence)
+    ]
+    scored.sort(key=lambda item: (-item[2], item[0]))
+    return scored[:top_k]
+
+
+def free_fused_ids(count: int, reserved: Iterable[int] = ()) -> List[int]:
+    """
+    返回 count 个可用作生成规则的融合 ID: 从 fusion_config.REGISTERED_FUSED_OPCODE_BASE 起，
+    跳过 reserved 占用的 ID (例如另一份同时注册的生成模块)。不占用 EVM 的 opcode 空间。
+    """
+    taken = set(reserved)
+    fused_ids: List[int] = []
+    fused_id = fusion_config.REGISTERED_FUSED_OPCODE_BASE
+    while len(fused_ids) < count:
+        if fused_id not in taken:
+            fused_ids.append(fused_id)
+        fused_id += 1
+    return fused_ids
+
+
+def sequence_mnemonics(sequence: Tuple[int, ...]) -> List[str]:
+    return [CancunComputation.opcodes[opcode].mnemonic for opcode in sequence]
+
+
+def _inline_runs(sequence: Tuple[int, ...]) -> Dict[int, int]:
+    """序列里连续的纯栈运算: {起始下标: 结束下标}，只包含不短于 MIN_INLINE_RUN 的区间。"""
+    runs: Dict[int, int] = {}
+    start = 0
+    while start < len(sequence):
+        end = start
+        while end < len(sequence) and is_synthesizable_opcode(sequence[end]):
+            end += 1
+        if end - start >= MIN_INLINE_RUN:
+            runs[start] = end
+        start = max(end, start + 1)
+    return runs
+
+
+def _function_source(fn_name: str, sequence: Tuple[int, ...]) -> List[str]:
+    mnemonics = sequence_mnemonics(sequence)
+    lines = [
+        f"def {fn_name}(computation: ComputationAPI) -> None:",
+        f'    """{" ".join(mnemonics)}"""',
+    ]
+    if len(sequence) > 1:
+        lines += [
+            "    code = computation.code",
+            "    sequence_pc = code.program_counter",
+        ]
+
+    offsets = []
+    offset = 0
+    for opcode in sequence:
+        offsets.append(offset)
+        offset += 1 + push_data_size(opcode)
+
+    runs = _inline_runs(sequence)
+    index = 0
+    while index < len(sequence):
+        if index > 0:
+            # 让这条指令 (或内联代码读取立即数时) 看到的 PC 与逐条执行时一致 (指向它自己的下一个字节)
+            lines.append(f"    code.program_counter = sequence_pc + {offsets[index]}")
+        end = runs.get(index)
+        if end is None:
+            lines.append(f"    _OPCODES[0x{sequence[index]:02x}](computation)  # {mnemonics[index]}")
+            index += 1
+            continue
+        run_mnemonic = " ".join(mnemonics[index:end])
+        synthesized = synthesize_source("inline", sequence[index:end], CancunComputation.opcodes, run_mnemonic)
+        # 去掉合成函数的 def 行和 docstring，函数体直接内联
+        lines.append(f"    # {run_mnemonic}: 由 fusion_synthesizer 合成")
+        lines += synthesized.splitlines()[2:]
+        index = end
+    return lines
+
+
+def emit_rules_module(
+    candidates: List[Tuple[Tuple[int, ...], int, int]],
+    output_path: str,
+    reserved_fused_ids: Iterable[int] = (),
+) -> Dict[str, Dict]:
+    """
+    为选中的候选序列生成规则表和融合逻辑函数，写成一个可以直接 import 的 Python 模块。
+
+    模块中的 GENERATED_FUSION_RULES 与 fusion_config.ALL_FUSION_RULES 格式相同，
+    GENERATED_LOGIC_FNS 与 FusedComputation.fused_logic_fns 格式相同，
+    只包含不能被 fusion_synthesizer 自动合成的规则。返回生成的规则表。
+    """
+    fused_ids = free_fused_ids(len(candidates), reserved_fused_ids)
+
+    rules: Dict[str, Dict] = {}
+    fn_names: Dict[str, str] = {}
+    source = [
+        "# 由 rule_generator.py 自动生成，请勿手动修改",
+        "",
+        "from eth.abc import ComputationAPI",
+        "from eth.vm.forks.cancun.computation import CancunComputation",
+        "",
+        "from fusion_synthesizer import synthesis_globals",
+        "",
+        "",
+        "_OPCODES = CancunComputation.opcodes",
+        "# 内联的合成代码用到的名字 (UINT_256_MAX、InsufficientStack 等)",
+        "globals().update(synthesis_globals())",
+    ]
+    for (sequence, count, score), fused_opcode_id in zip(candidates, fused_ids):
+        rule_name = "_".join(sequence_mnemonics(sequence))
+        fn_name = f"fused_{rule_name.lower()}"
+        rules[rule_name] = {
+            "rule_name": rule_name,
+            "sequence": sequence,
+            "fused_opcode_id": fused_opcode_id,
+            "fused_mnemonic": f"FUSED_{rule_name}",
+            "is_jump": sequence[-1] in TERMINAL_OPCODES,
+            "profile_count": count,
+            "profile_score": score,
+        }
+        if not can_synthesize(sequence):
+            fn_names[rule_name] = fn_name
+            source += ["", ""] + _function_source(fn_name, sequence)
+
+    source += ["", "", "GENERATED_FUSION_RULES = {"]
+    for rule_name, rule in rules.items():
+        source.append(f"    {rule_name!r}: {{")
+        for key, value in rule.items():
+            if key == "fused_opcode_id":
+                source.append(f"        {key!r}: 0x{value:X},")
+            elif key == "sequence":
+                source.append(f"        {key!r}: ({', '.join(f'0x{op:02X}' for op in value)},),")
+            else:
+                source.append(f"        {key!r}: {value!r},")
+        source.append("    },")
+    source += ["}", "", "GENERATED_LOGIC_FNS = {"]
+    for rule_name, fn_name in fn_names.items():
+        rule = rules[rule_name]
+        source.append(f"    0x{rule['fused_opcode_id']:X}: ({fn_name}, {rule['fused_mnemonic']!r}),")
+    source += ["}", ""]
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(source))
+    return rules
+
+
+def generate_rules(
+    trace_glob: str,
+    output_path: str,
+    top_k: int = DEFAULT_TOP_K,
+    max_n: int = 4,
+    min_count: int = DEFAULT_MIN_COUNT,
+    reserved_fused_ids: Iterable[int] = (),
+) -> Dict[str, Dict]:
+    """完整流程: trace -> n-gram 次数 -> 打分取前 K 个 -> 生成规则模块。"""
+    ngram_counts = count_ngrams_from_traces(trace_glob, max_n)
+    candidates = score_candidates(ngram_counts, top_k, min_count)
+    rules = emit_rules_module(candidates, output_path, reserved_fused_ids)
+    for rule_name, rule in rules.items():
+        print(f"  {rule_name:<40} count={rule['profile_count']:<10} score={rule['profile_score']}")
+    print(f"[INFO] 生成 {len(rules)} 条融合规则，已写入 {output_path}")
+    return rules
+
+
+if __name__ == "__main__":
+    # --- 主要配置 ---
+    # IdenticalComputation 重放时打开 DEBUG2 得到的 trace 文件
+    TRACE_GLOB = "csv_benchmark_traces_output_cn/trace_控制组_*.txt"
+    OUTPUT_PATH = "generated_fusion_rules.py"
+
+    generate_rules(
+        TRACE_GLOB,
+        OUTPUT_PATH,
+        top_k=DEFAULT_TOP_K,
+        max_n=4,
+        min_count=DEFAULT_MIN_COUNT,
+    )
@@ -0,0 +1,154 @@
+# selector_dispatch.py
+#
+# Solidity 函数分派器 (selector dispatch) 的跳转表融合。
+#
+# solc 生成的合约入口先取出 calldata 的前 4 字节 (函数选择器)，再逐个比较:
+#   DUP1 PUSH4 <selector> EQ PUSH2 <dest> JUMPI
+#   DUP1 PUSH4 <selector> EQ PUSH2 <dest> JUMPI
+#   ...
+# 函数越多，每笔交易线性走过的比较就越多。SelectorDispatchMatcher 在分析阶段把整条
+# 比较链识别出来，建成 {selector: (扣费, 目标)} 的字典随计划表一起缓存 (每个 code hash 只建一次)；
+# 执行时整条链只剩一次分派: 查字典、按原链走到命中处 (或走完整条链) 为止的 gas 扣费、直接跳转。
+
+from typing import Dict, Optional, Tuple
+
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth.exceptions import FullStack, InsufficientStack
+
+from fusion_synthesizer import STACK_LIMIT
+from jumpdest_bitmap import is_jump_destination
+from rule_compiler import push_data_size
+
+
+DUP1_OPCODE = 0x80
+EQ_OPCODE = 0x14
+JUMPI_OPCODE = 0x57
+PUSH1_OPCODE = 0x60
+PUSH4_OPCODE = 0x63
+
+# 至少有这么多个比较才当作函数分派器处理
+MIN_DISPATCH_CASES = 2
+
+
+class SelectorDispatch:
+    """
+    一条分派链的分析结果，作为计划表条目的 operand。
+
+    targets: 选择器 -> (走到这个比较并跳转时累计的 gas, 跳转目标)，重复的选择器只保留第一个
+    miss_gas: 没有命中时走完整条链的 gas
+    fallthrough_pc: 没有命中时顺序执行到的下一条指令
+    """
+
+    __slots__ = ("targets", "miss_gas", "fallthrough_pc")
+
+    def __init__(self, targets: Dict[int, Tuple[int, int]], miss_gas: int, fallthrough_pc: int) -> None:
+        self.targets = targets
+        self.miss_gas = miss_gas
+        self.fallthrough_pc = fallthrough_pc
+
+
+class SelectorDispatchMatcher:
+    """
+    在一份字节码里找出所有 DUP1 PUSHn EQ PUSHm JUMPI 组成的比较链。
+
+    链上的每个跳转目标都必须是合法的 JUMPDEST，遇到不合法的目标时链在它之前结束
+    (这一段照常逐条执行，由 JUMPI 自己报错)。
+    """
+
+    def __init__(self, rule: Dict, opcode_lookup: Dict[int, OpcodeAPI]) -> None:
+        self.rule = rule
+        self.fused_opcode_id = rule["fused_opcode_id"]
+        self.rule_id = rule["rule_id"]
+        self._gas_costs = {
+            opcode: opcode_fn.gas_cost
+            for opcode, opcode_fn in opcode_lookup.items()
+            if hasattr(opcode_fn, "gas_cost")
+        }
+
+    def _match_case(self, code: bytes, pc: int) -> Optional[Tuple[int, int, int, int]]:
+        """pc 处是一个比较时返回 (选择器, 跳转目标, 这个比较的 gas, 下一条指令的 PC)。"""
+        code_len = len(code)
+        if pc >= code_len or code[pc] != DUP1_OPCODE:
+            return None
+        selector_pc = pc + 1
+        if selector_pc >= code_len or not PUSH1_OPCODE <= code[selector_pc] <= PUSH4_OPCODE:
+            return None
+        selector_size = push_data_size(code[selector_pc])
+        eq_pc = selector_pc + 1 + selector_size
+        if eq_pc >= code_len or code[eq_pc] != EQ_OPCODE:
+            return None
+        dest_pc = eq_pc + 1
+        if dest_pc >= code_len or not PUSH1_OPCODE <= code[dest_pc] <= PUSH4_OPCODE:
+            return None
+        dest_size = push_data_size(code[dest_pc])
+        jumpi_pc = dest_pc + 1 + dest_size
+        if jumpi_pc >= code_len or code[jumpi_pc] != JUMPI_OPCODE:
+            return None
+
+        selector = int.from_bytes(code[selector_pc + 1:eq_pc], "big")
+        dest = int.from_bytes(code[dest_pc + 1:jumpi_pc], "big")
+        gas = sum(
+            self._gas_costs[opcode]
+            for opcode in (DUP1_OPCODE, code[selector_pc], EQ_OPCODE, code[dest_pc], JUMPI_OPCODE)
+        )
+        return selector, dest, gas, jumpi_pc + 1
+
+    def find(self, code: bytes, jumpdests: bytearray) -> Dict[int, Tuple[int, SelectorDispatch]]:
+        """返回 {分派链起点的 PC: (fallthrough_pc, SelectorDispatch)}，jumpdests 是代码的 JUMPDEST 位图。"""
+        if not all(
+            opcode in self._gas_costs
+            for opcode in (DUP1_OPCODE, EQ_OPCODE, JUMPI_OPCODE, PUSH1_OPCODE, PUSH4_OPCODE)
+        ):
+            return {}
+
+        dispatches: Dict[int, Tuple[int, SelectorDispatch]] = {}
+        code_len = len(code)
+        pc = 0
+        while pc < code_len:
+            if code[pc] != DUP1_OPCODE:
+                pc += 1 + push_data_size(code[pc])
+                continue
+
+            start_pc = pc
+            targets: Dict[int, Tuple[int, int]] = {}
+            total_gas = 0
+            cases = 0
+            while True:
+                case = self._match_case(code, pc)
+                if case is None or not is_jump_destination(jumpdests, case[1]):
+                    break
+                selector, dest, gas, pc = case
+                total_gas += gas
+                cases += 1
+                targets.setdefault(selector, (total_gas, dest))
+
+            if cases >= MIN_DISPATCH_CASES:
+                dispatches[start_pc] = (pc, SelectorDispatch(targets, total_gas, pc))
+            elif pc == start_pc:
+                pc += 1
+        return dispatches
+
+
+def dispatch_selector(computation: ComputationAPI, dispatch: SelectorDispatch) -> None:
+    """执行一条分派链: 按栈顶的选择器查表，扣掉原链走到命中处的 gas，然后跳转或顺序执行。"""
+    values = computation._stack.values
+    target = None
+    if values:
+        selector = values[-1]
+        if selector.__class__ is bytes:
+            selector = int.from_bytes(selector, "big")
+        target = dispatch.targets.get(selector)
+
+    if target is None:
+        computation.consume_gas(dispatch.miss_gas, reason="FUSED_SELECTOR_DISPATCH")
+        next_pc = dispatch.fallthrough_pc
+    else:
+        gas, next_pc = target
+        computation.consume_gas(gas, reason="FUSED_SELECTOR_DISPATCH")
+
+    # 每个比较的中间状态都比入口多 2 个元素 (DUP1 的副本 + 一个立即数)
+    if not values:
+        raise InsufficientStack("Insufficient stack items for DUP1")
+    if len(values) + 2 > STACK_LIMIT:
+        raise FullStack("Stack limit reached")
+    computation.code.program_counter = next_pc
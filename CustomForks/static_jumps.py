@@ -0,0 +1,102 @@
+# static_jumps.py
+#
+# 目标在分析期就确定的跳转: PUSHn <dest> JUMP / PUSHn <dest> JUMPI。
+#
+# 原生的 JUMP/JUMPI 每次执行都要把目标重新对照代码的 JUMPDEST 分析校验一遍。
+# 编译器生成的跳转绝大多数是紧跟在 PUSH 后面的常量目标，StaticJumpMatcher 在生成计划表时
+# 就把目标校验好 (不合法的目标不融合，照常逐条执行并由 JUMP/JUMPI 报错)，
+# 执行时只剩扣费、检查 JUMPI 的条件、设置 PC。
+#
+# 两种跳转都是跳转类融合指令: 计划表里 next_pc 为 None，PC 由融合函数设置；
+# operand.fallthrough_pc 是不跳转时顺序执行到的 PC (JUMP 的这个值只给基本块切分使用)。
+
+from typing import Dict, List, Optional, Tuple
+
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth.exceptions import FullStack, InsufficientStack
+
+from fusion_synthesizer import PUSH0_OPCODE, STACK_LIMIT
+from jumpdest_bitmap import is_jump_destination
+from rule_compiler import PUSH32_OPCODE, push_data_size
+
+
+JUMP_OPCODE = 0x56
+JUMPI_OPCODE = 0x57
+
+
+class StaticJump:
+    """一处静态跳转的分析结果，作为计划表条目的 operand: PUSH 与跳转指令的 gas 之和、已校验的目标。"""
+
+    __slots__ = ("gas", "dest", "fallthrough_pc")
+
+    def __init__(self, gas: int, dest: int, fallthrough_pc: int) -> None:
+        self.gas = gas
+        self.dest = dest
+        self.fallthrough_pc = fallthrough_pc
+
+
+class StaticJumpMatcher:
+    """
+    识别 PUSHn <dest> JUMP/JUMPI。
+
+    rules 里每条规则用 "jump_opcode" 指明它融合的是 JUMP 还是 JUMPI，
+    两者可以单独启用。
+    """
+
+    def __init__(self, rules: List[Dict], opcode_lookup: Dict[int, OpcodeAPI]) -> None:
+        self.rules = {rule["jump_opcode"]: rule for rule in rules}
+        self._gas_costs = {
+            opcode: opcode_fn.gas_cost
+            for opcode, opcode_fn in opcode_lookup.items()
+            if hasattr(opcode_fn, "gas_cost")
+        }
+
+    def match(
+        self,
+        code: bytes,
+        pc: int,
+        jumpdests: bytearray,
+    ) -> Optional[Tuple[int, Tuple[int, None, int, StaticJump]]]:
+        """pc 处是静态跳转时返回 (跳转指令之后的 PC, 计划表条目)，否则返回 None。jumpdests 是代码的 JUMPDEST 位图。"""
+        opcode = code[pc]
+        if not PUSH0_OPCODE <= opcode <= PUSH32_OPCODE:
+            return None
+        jump_pc = pc + 1 + push_data_size(opcode)
+        if jump_pc >= len(code):
+            return None
+        rule = self.rules.get(code[jump_pc])
+        if rule is None or opcode not in self._gas_costs or code[jump_pc] not in self._gas_costs:
+            return None
+
+        dest = int.from_bytes(code[pc + 1:jump_pc], "big")
+        if not is_jump_destination(jumpdests, dest):
+            return None
+        gas = self._gas_costs[opcode] + self._gas_costs[code[jump_pc]]
+        jump = StaticJump(gas, dest, jump_pc + 1)
+        return jump_pc + 1, (rule["fused_opcode_id"], None, rule["rule_id"], jump)
+
+
+def static_jump(computation: ComputationAPI, jump: StaticJump) -> None:
+    """PUSHn <dest> JUMP: 目标已校验，直接设置 PC。"""
+    computation.consume_gas(jump.gas, reason="FUSED_STATIC_JUMP")
+    if len(computation._stack.values) >= STACK_LIMIT:
+        raise FullStack("Stack limit reached")
+    computation.code.program_counter = jump.dest
+
+
+def static_jumpi(computation: ComputationAPI, jump: StaticJump) -> None:
+    """PUSHn <dest> JUMPI: 目标已校验，只需弹出并检查条件。"""
+    computation.consume_gas(jump.gas, reason="FUSED_STATIC_JUMPI")
+    values = computation._stack.values
+    if len(values) >= STACK_LIMIT:
+        raise FullStack("Stack limit reached")
+    if not values:
+        raise InsufficientStack("Wanted 2 stack items, only had 1")
+
+    condition = values.pop()
+    if condition.__class__ is bytes:
+        condition = int.from_bytes(condition, "big")
+    if condition:
+        computation.code.program_counter = jump.dest
+    else:
+        computation.code.program_counter = jump.fallthrough_pc
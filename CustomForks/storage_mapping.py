@@ -0,0 +1,273 @@
+# storage_mapping.py
+#
+# Solidity mapping 存储访问 (balances[addr]、allowance[a][b]) 的融合。
+#
+# mapping 的存储位置是 keccak256(key . slot)，solc 生成的代码把 key 和 slot 先写进 0x00..0x40 的
+# scratch 内存，再对这 64 字节做 SHA3，紧接着 SLOAD (或 DUP1 SLOAD，留着存储位置给后面的 SSTORE)，
+# 直接赋值 (balances[addr] = v) 时紧接着的是 SSTORE:
+#   PUSH1 0x00 SWAP1 DUP2 MSTORE PUSH1 0x01 PUSH1 0x20 MSTORE PUSH1 0x40 SWAP1 SHA3 SLOAD
+# 不同 solc 版本、不同的优化设置下中间的 DUP/SWAP 各不相同，嵌套 mapping 的第二层还会直接使用
+# 栈上留下的内存位置，所以这里同样不按固定的指令序列匹配，而是找 SHA3 前面由栈上纯计算和 MSTORE
+# 组成、至少有两次 MSTORE 的一段指令 (映射段)，连同 SHA3 和紧跟着的 SLOAD / SSTORE 融合成一条指令:
+#   - 映射段由 fusion_synthesizer 合成，中间值放在 Python 局部变量里，整段的静态 gas 一次扣除
+#   - MSTORE 照常扩展内存、扣内存扩展的 gas、写入内存，SHA3 照常扣按字的 gas，gas 与逐条执行完全相同
+#   - SHA3 的输入正好是最近两次 MSTORE 写入的两个字时，直接用这两个字查 (key, slot) -> 存储位置的缓存，
+#     不再从内存读出来重新拼接；否则照常读内存计算
+#   - SLOAD / SSTORE 仍然调用 fork 原来的指令 (冷/热访问和写入的 gas 由它计算)，在 matcher 创建时取好
+# 形状完全相同的映射段共用一份合成源码和编译好的函数。
+# 磁盘缓存 (analysis_cache) 只记录融合范围和最后的存储访问指令，读出时由 rebuild 按代码重新合成。
+
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from eth.abc import ComputationAPI, OpcodeAPI
+from eth_hash.auto import keccak
+
+from fusion_synthesizer import (
+    JUMPDEST_OPCODE,
+    MSTORE_OPCODE,
+    SHA3_OPCODE,
+    compile_synthesized,
+    is_synthesizable_opcode,
+    synthesize_source,
+)
+from rule_compiler import push_data_size
+
+
+SLOAD_OPCODE = 0x54
+SSTORE_OPCODE = 0x55
+# 可以并入融合范围的存储访问
+STORAGE_ACCESS_OPCODES = (SLOAD_OPCODE, SSTORE_OPCODE)
+DUP1_OPCODE = 0x80
+
+# 映射段最多向前包含这么多条指令
+MAX_MAPPING_INSTRUCTIONS = 16
+
+# 存储位置缓存默认最多保留多少个 (key, slot)
+DEFAULT_SLOT_CACHE_SIZE = 65536
+
+# 编译好的函数和合成源码各最多保留这么多份，超过时淘汰最久未使用的
+MAPPING_CACHE_SIZE = 4096
+
+# 合成函数的函数名
+MAPPING_FN_NAME = "storage_mapping_hash"
+
+# 合成函数: fn(computation)，扣费、执行映射段和 SHA3 (以及 SLOAD 前的 DUP1)
+MappingFn = Callable[[ComputationAPI], None]
+
+
+class MappingSlotCache:
+    """(key, slot) 两个 32 字节的字 -> keccak256(key . slot) 的 LRU 缓存，超过 max_size 时淘汰最久未使用的条目。"""
+
+    def __init__(self, max_size: int = DEFAULT_SLOT_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self._slots: "OrderedDict[Tuple[bytes, bytes], bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def hash(self, key: bytes, slot: bytes) -> bytes:
+        slots = self._slots
+        pair = (key, slot)
+        hashed = slots.get(pair)
+        if hashed is not None:
+            slots.move_to_end(pair)
+            self.hits += 1
+            return hashed
+
+        self.misses += 1
+        hashed = keccak(key + slot)
+        slots[pair] = hashed
+        if len(slots) > self.max_size:
+            slots.popitem(last=False)
+        return hashed
+
+    def clear(self) -> None:
+        self._slots.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+
+# 进程内共用的存储位置缓存，合成函数通过 keccak_words 使用它
+MAPPING_SLOTS = MappingSlotCache()
+
+# 合成源码 -> 编译好的函数，所有合约共用 (LRU)
+_MAPPING_FNS: "OrderedDict[str, MappingFn]" = OrderedDict()
+
+
+def _compile_mapping(source: str) -> MappingFn:
+    mapping_fn = _MAPPING_FNS.get(source)
+    if mapping_fn is not None:
+        _MAPPING_FNS.move_to_end(source)
+        return mapping_fn
+    namespace = compile_synthesized(source, "<storage mapping>", {"keccak_words": MAPPING_SLOTS.hash})
+    mapping_fn = namespace[MAPPING_FN_NAME]
+    _MAPPING_FNS[source] = mapping_fn
+    if len(_MAPPING_FNS) > MAPPING_CACHE_SIZE:
+        _MAPPING_FNS.popitem(last=False)
+    return mapping_fn
+
+
+class StorageMapping:
+    """
+    一处 mapping 访问的分析结果，作为计划表条目的 operand。
+
+    source 是映射段 (到 SHA3 为止，以及 SLOAD 前的 DUP1) 的合成源码，mapping_fn 由 source 编译而来。
+    access 是融合范围最后的 SLOAD / SSTORE (没有时为 None)，access_fn 是 fork 里对应的指令。
+    """
+
+    __slots__ = ("source", "access", "mapping_fn", "access_fn")
+
+    def __init__(self, source: str, access: Optional[int], access_fn: Optional[OpcodeAPI]) -> None:
+        self.source = source
+        self.access = access
+        self.mapping_fn = _compile_mapping(source)
+        self.access_fn = access_fn
+
+
+class StorageMappingMatcher:
+    """在一份字节码里找出所有 “MSTORE key, MSTORE slot, SHA3 [SLOAD / SSTORE]” 形式的 mapping 访问。"""
+
+    def __init__(self, rule: Dict, opcode_lookup: Dict[int, OpcodeAPI]) -> None:
+        self.rule = rule
+        self.fused_opcode_id = rule["fused_opcode_id"]
+        self.rule_id = rule["rule_id"]
+        self._opcode_lookup = opcode_lookup
+        # 融合范围最后的存储访问直接调用 fork 原来的指令，在这里取好，执行时不再查 opcode 表
+        self._access_fns = {
+            opcode: opcode_lookup[opcode]
+            for opcode in STORAGE_ACCESS_OPCODES
+            if opcode in opcode_lookup
+        }
+        # (映射段的指令, 立即数) -> 合成源码 (LRU)
+        self._sources: "OrderedDict[Tuple[Tuple[int, ...], Tuple[Optional[bytes], ...]], str]" = OrderedDict()
+
+    def _source(self, sequence: Tuple[int, ...], immediates: Tuple[Optional[bytes], ...]) -> str:
+        key = (sequence, immediates)
+        source = self._sources.get(key)
+        if source is not None:
+            self._sources.move_to_end(key)
+            return source
+        source = synthesize_source(
+            MAPPING_FN_NAME,
+            sequence,
+            self._opcode_lookup,
+            self.rule["fused_mnemonic"],
+            immediates,
+        )
+        self._sources[key] = source
+        if len(self._sources) > MAPPING_CACHE_SIZE:
+            self._sources.popitem(last=False)
+        return source
+
+    def _mapping(self, code: bytes, segment: List[int], access: Optional[int]) -> Optional[StorageMapping]:
+        sequence = tuple(code[pc] for pc in segment)
+        if any(opcode not in self._opcode_lookup for opcode in sequence):
+            return None
+        if any(pc + 1 + push_data_size(code[pc]) > len(code) for pc in segment):
+            # 被代码末尾截断的 PUSH 照常执行
+            return None
+
+        immediates = tuple(
+            code[pc + 1:pc + 1 + push_data_size(code[pc])] if push_data_size(code[pc]) else None
+            for pc in segment
+        )
+        return StorageMapping(self._source(sequence, immediates), access, self._access_fns.get(access))
+
+    def rebuild(self, code: bytes, pc: int, end_pc: int, access: Optional[int]) -> StorageMapping:
+        """
+        按代码重新取得 pc 处映射段的 StorageMapping (磁盘缓存读出时使用)。
+        pc 到 end_pc 之间不是一段 “MSTORE ... SHA3 [DUP1 SLOAD | SLOAD | SSTORE]” 形式的映射段时抛出 ValueError。
+        """
+        if end_pc > len(code) or (access is not None and access not in self._access_fns):
+            raise ValueError("storage mapping segment does not match the code")
+        segment = []
+        while pc < end_pc:
+            segment.append(pc)
+            pc += 1 + push_data_size(code[pc])
+        if access is not None:
+            if pc != end_pc or not segment or code[segment.pop()] != access:
+                raise ValueError("storage mapping segment does not match the code")
+            if access == SLOAD_OPCODE and segment and code[segment[-1]] == DUP1_OPCODE:
+                sha3_index = len(segment) - 2
+            else:
+                sha3_index = len(segment) - 1
+        else:
+            sha3_index = len(segment) - 1
+        mapping = None
+        if (
+            pc == end_pc
+            and sha3_index > 0
+            and code[segment[sha3_index]] == SHA3_OPCODE
+            and sha3_index <= MAX_MAPPING_INSTRUCTIONS
+            and sum(1 for start in segment if code[start] == MSTORE_OPCODE) >= 2
+            and JUMPDEST_OPCODE not in (code[start] for start in segment[1:])
+            and all(
+                is_synthesizable_opcode(code[start]) or code[start] == MSTORE_OPCODE
+                for start in segment[:sha3_index]
+            )
+        ):
+            mapping = self._mapping(code, segment, access)
+        if mapping is None:
+            raise ValueError("storage mapping segment does not match the code")
+        return mapping
+
+    def find(self, code: bytes) -> Dict[int, Tuple[int, StorageMapping]]:
+        """返回 {映射段起点的 PC: (融合范围结束后的 PC, StorageMapping)}。"""
+        if SHA3_OPCODE not in self._opcode_lookup or MSTORE_OPCODE not in self._opcode_lookup:
+            return {}
+
+        starts = []
+        pc = 0
+        code_len = len(code)
+        while pc < code_len:
+            starts.append(pc)
+            pc += 1 + push_data_size(code[pc])
+
+        mappings: Dict[int, Tuple[int, StorageMapping]] = {}
+        for index, sha3_pc in enumerate(starts):
+            if code[sha3_pc] != SHA3_OPCODE:
+                continue
+
+            # 向前收集栈上纯计算和 MSTORE，遇到 JUMPDEST 时把它作为映射段的第一条指令
+            first = index
+            while first > 0 and index - first < MAX_MAPPING_INSTRUCTIONS:
+                opcode = code[starts[first - 1]]
+                if not is_synthesizable_opcode(opcode) and opcode != MSTORE_OPCODE:
+                    break
+                first -= 1
+                if opcode == JUMPDEST_OPCODE:
+                    break
+            segment = starts[first:index + 1]
+            if sum(1 for pc in segment if code[pc] == MSTORE_OPCODE) < 2:
+                continue
+
+            # SHA3 后面紧跟的 SLOAD / DUP1 SLOAD / SSTORE 一起融合
+            access = None
+            following = starts[index + 1:index + 3]
+            if following and code[following[0]] in STORAGE_ACCESS_OPCODES:
+                access = code[following[0]]
+                end_pc = following[0] + 1
+            elif len(following) == 2 and code[following[0]] == DUP1_OPCODE and code[following[1]] == SLOAD_OPCODE:
+                segment.append(following[0])
+                access = SLOAD_OPCODE
+                end_pc = following[1] + 1
+            else:
+                end_pc = sha3_pc + 1
+            if access is not None and access not in self._access_fns:
+                continue
+
+            mapping = self._mapping(code, segment, access)
+            if mapping is not None:
+                mappings[segment[0]] = (end_pc, mapping)
+        return mappings
+
+
+def storage_mapping(computation: ComputationAPI, mapping: StorageMapping) -> None:
+    """执行一处 mapping 访问: 合成函数算出存储位置，需要时再用 fork 原来的 SLOAD / SSTORE 读写存储。"""
+    mapping.mapping_fn(computation)
+    access_fn = mapping.access_fn
+    if access_fn is not None:
+        access_fn(computation)
@@ -0,0 +1,13 @@
+# conftest.py
+#
+# CustomForks 里的模块互相用平铺的 import (import fusion_config ...)，测试时把目录加进 sys.path。
+
+import os
+import sys
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+CUSTOM_FORKS_DIR = os.path.dirname(TESTS_DIR)
+
+for path in (CUSTOM_FORKS_DIR, TESTS_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
@@ -0,0 +1,255 @@
+# evm_diff.py
+#
+# 差分测试的辅助函数: 同一批交易分别交给原版 CancunComputation 和按某种执行方式配置好的
+# FusedComputation 执行，比较 gas、是否出错、返回值、日志和状态根。
+# 出错时只比较是否出错，不比较异常的文字 (融合指令按整段扣费，OutOfGas 的 reason 可能不同)。
+
+import contextlib
+import io
+import logging
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from eth import constants
+from eth.chains.base import Chain
+from eth.db.atomic import AtomicDB
+from eth.vm.forks.cancun import CancunVM
+from eth.vm.forks.cancun.computation import CancunComputation
+from eth.vm.forks.cancun.state import CancunState
+from eth_keys import keys
+from eth_utils.logging import DEBUG2_LEVEL_NUM
+
+import fusion_config
+from aot_transpiler import write_module
+from custom_computation import FusedComputation
+
+
+SENDER_KEY = keys.PrivateKey(b"\x01" * 32)
+SENDER = SENDER_KEY.public_key.to_canonical_address()
+
+# 测试合约部署在 CONTRACT_BASE_ADDRESS 起的连续地址上
+CONTRACT_BASE_ADDRESS = 0x1000
+
+# 足够执行完任何测试代码的 gas (不含交易的固有 gas)
+AMPLE_GAS = 1_000_000
+
+ALL_RULES = list(fusion_config.ALL_FUSION_RULES)
+
+# 与原版 gas 完全相同的规则。SUB_MUL 和 PUSH1_DUP1 的融合函数 (fused_logic) 有意少扣 gas
+# (研究用的折扣)，执行结果和 gas 都会与原版不同，差分测试里不用它们
+GAS_DISCOUNT_RULES = ["SUB_MUL", "PUSH1_DUP1"]
+EQUIVALENT_RULES = [rule_name for rule_name in ALL_RULES if rule_name not in GAS_DISCOUNT_RULES]
+
+# Cancun 交易的固有 gas: 基础部分，以及 calldata 每个零字节 / 非零字节
+TX_GAS = 21000
+TX_DATA_ZERO_GAS = 4
+TX_DATA_NONZERO_GAS = 16
+
+# 一笔交易: (合约地址, calldata, 执行用的 gas，不含固有 gas)
+Transaction = Tuple[bytes, bytes, int]
+# 一笔交易的结果: (gas_used, is_error, output, logs, 状态根)
+Outcome = Tuple[int, bool, bytes, Tuple, bytes]
+
+
+def contract_address(index: int) -> bytes:
+    return (CONTRACT_BASE_ADDRESS + index).to_bytes(20, "big")
+
+
+def intrinsic_gas(data: bytes) -> int:
+    return TX_GAS + sum(TX_DATA_NONZERO_GAS if byte else TX_DATA_ZERO_GAS for byte in data)
+
+
+# 签好名的交易类 -> 直接给出发送者、不再校验签名的子类。
+# 执行时从签名恢复公钥占了测试的大部分时间，而测试交易的签名本来就是这里生成的
+_KNOWN_SENDER_CLASSES: Dict[type, type] = {}
+
+# (nonce, 地址, calldata, gas) -> 交易。原版和融合版执行同一批交易，每笔只签名一次
+_TRANSACTIONS: Dict[Tuple[int, bytes, bytes, int], Any] = {}
+
+
+def _known_sender_transaction(vm, nonce: int, to: bytes, data: bytes, gas: int) -> Any:
+    key = (nonce, to, data, gas)
+    transaction = _TRANSACTIONS.get(key)
+    if transaction is None:
+        signed = vm.create_unsigned_transaction(
+            nonce=nonce,
+            gas_price=10**10,
+            gas=intrinsic_gas(data) + gas,
+            to=to,
+            value=0,
+            data=data,
+        ).as_signed_transaction(SENDER_KEY)
+        signed_class = type(signed)
+        known_sender_class = _KNOWN_SENDER_CLASSES.get(signed_class)
+        if known_sender_class is None:
+            known_sender_class = type(
+                "KnownSender" + signed_class.__name__,
+                (signed_class,),
+                {"sender": SENDER, "check_signature_validity": lambda self: None},
+            )
+            _KNOWN_SENDER_CLASSES[signed_class] = known_sender_class
+        transaction = known_sender_class(*signed)
+        _TRANSACTIONS[key] = transaction
+    return transaction
+
+
+def run_transactions(
+    computation_class: type,
+    codes: Sequence[bytes],
+    transactions: Sequence[Transaction],
+    computations: Optional[List[Any]] = None,
+    rounds: int = 1,
+) -> List[Outcome]:
+    """
+    codes[i] 部署在 contract_address(i)，按顺序执行 transactions rounds 轮，返回每笔交易的结果。
+    给出 computations 时，把每笔交易的 origin computation 依次追加进去。
+    每一轮之间丢弃 FusedComputation 内存里的分析结果: 打开磁盘缓存时下一轮从磁盘读取，
+    分层执行时下一轮的执行次数更多、进入更高的层级。
+    """
+    state_class = type("DiffState", (CancunState,), {"computation_class": computation_class})
+    vm_class = type("DiffVM", (CancunVM,), {"_state_class": state_class})
+    chain_class = Chain.configure(
+        __name__="DiffChain",
+        vm_configuration=((constants.GENESIS_BLOCK_NUMBER, vm_class),),
+    )
+    genesis_state = {SENDER: {"balance": 10**24, "nonce": 0, "code": b"", "storage": {}}}
+    for index, code in enumerate(codes):
+        genesis_state[contract_address(index)] = {"balance": 0, "nonce": 1, "code": code, "storage": {}}
+    genesis_params = {
+        "difficulty": 0,
+        "mix_hash": b"\x00" * 32,
+        "gas_limit": 30_000_000,
+        "timestamp": 1700000000,
+    }
+    chain = chain_class.from_genesis(AtomicDB(), genesis_params, genesis_state)
+    vm = chain.get_vm()
+    header = chain.get_block().header
+
+    outcomes: List[Outcome] = []
+    for round_index in range(rounds):
+        if round_index and hasattr(computation_class, "_reset_plan_cache"):
+            with contextlib.redirect_stdout(io.StringIO()):
+                computation_class._reset_plan_cache()
+        for to, data, gas in transactions:
+            transaction = _known_sender_transaction(vm, vm.state.get_nonce(SENDER), to, data, gas)
+            receipt, computation = vm.apply_transaction(header, transaction)
+            if computations is not None:
+                computations.append(computation)
+            outcomes.append((
+                receipt.gas_used,
+                computation.is_error,
+                computation.output,
+                tuple(computation.get_log_entries()),
+                vm.state.make_state_root(),
+            ))
+    return outcomes
+
+
+def _configure_aot(computation_class: type, cache_dir: str, codes: Sequence[bytes]) -> None:
+    for code in codes:
+        write_module(cache_dir, code, CancunComputation.opcodes)
+    computation_class.configure_aot(cache_dir)
+
+
+# 执行方式 -> (配置函数 fn(computation_class, cache_dir, codes), 执行几轮)。
+# 在 configure_rules 之后调用；"debug" 另外在执行时打开 DEBUG2 日志 (见 debug_logging)。
+ENGINE_MODES: Dict[str, Tuple[Callable[[type, str, Sequence[bytes]], None], int]] = {
+    "main": (lambda cls, cache_dir, codes: None, 1),
+    "predecode": (lambda cls, cache_dir, codes: cls.configure_engine(predecode_push=True), 1),
+    "int_stack": (lambda cls, cache_dir, codes: cls.configure_engine(predecode_push=True, int_stack=True), 1),
+    "local_gas": (lambda cls, cache_dir, codes: cls.configure_engine(predecode_push=True, local_gas=True), 1),
+    "block": (lambda cls, cache_dir, codes: cls.configure_engine(block_gas_precharge=True), 1),
+    "unchecked": (
+        lambda cls, cache_dir, codes: cls.configure_engine(
+            block_gas_precharge=True, unchecked_stack=True, predecode_push=True
+        ),
+        1,
+    ),
+    "translate": (lambda cls, cache_dir, codes: cls.configure_engine(translate_blocks=True), 1),
+    "traces": (lambda cls, cache_dir, codes: cls.configure_traces(1), 1),
+    # 第一轮原生解释器，第二轮计划表，第三轮翻译执行
+    "tiers": (lambda cls, cache_dir, codes: cls.configure_tiers(1, 2), 3),
+    "aot": (_configure_aot, 1),
+    # 第一轮分析并写入磁盘缓存，第二轮从磁盘读取
+    "analysis_cache": (lambda cls, cache_dir, codes: cls.configure_analysis_cache(cache_dir), 2),
+    # 第二轮的 SHA3 从 keccak 缓存取结果
+    "keccak_cache": (lambda cls, cache_dir, codes: cls.configure_keccak_cache(), 2),
+    "debug": (lambda cls, cache_dir, codes: None, 1),
+}
+
+
+def fused_class(
+    mode: str,
+    rule_names: List[str],
+    cache_dir: str,
+    codes: Sequence[bytes],
+    setup: Optional[Callable[[type], None]] = None,
+) -> type:
+    """
+    返回按 mode 配置好的 FusedComputation 子类。配置都是类属性，每个测试用自己的子类，互不影响。
+    setup(cls) 在 configure_rules 之前调用 (例如 register_rules)。
+    """
+    computation_class = type("DiffFusedComputation", (FusedComputation,), {})
+    configure, _ = ENGINE_MODES[mode]
+    with contextlib.redirect_stdout(io.StringIO()):
+        if setup is not None:
+            setup(computation_class)
+        computation_class.configure_rules(rule_names)
+        configure(computation_class, cache_dir, codes)
+    return computation_class
+
+
+@contextlib.contextmanager
+def debug_logging(enabled: bool, handler: Optional[logging.Handler] = None) -> Iterator[None]:
+    """
+    enabled 时把 computation logger 调到 DEBUG2，让 FusedComputation 走 _debug_loop。
+    日志交给 handler，不给出时丢弃。
+    """
+    if not enabled:
+        yield
+        return
+    logger = logging.getLogger(CancunComputation.logger.name)
+    level, propagate = logger.level, logger.propagate
+    if handler is None:
+        handler = logging.NullHandler()
+    logger.setLevel(DEBUG2_LEVEL_NUM)
+    logger.addHandler(handler)
+    logger.propagate = False
+    # ExtendedDebugLogger 把 show_debug2 (以及关闭时的 debug2) 缓存在实例上，级别变了要丢掉
+    _forget_debug2(logger)
+    try:
+        yield
+    finally:
+        logger.removeHandler(handler)
+        logger.setLevel(level)
+        logger.propagate = propagate
+        _forget_debug2(logger)
+
+
+def _forget_debug2(logger: logging.Logger) -> None:
+    logger.__dict__.pop("show_debug2", None)
+    logger.__dict__.pop("debug2", None)
+
+
+# (代码, 交易, 轮数) -> 原版 Cancun 的结果。不同执行方式的测试执行同一批交易，原版只需执行一次
+_EXPECTED: Dict[Tuple[Tuple[bytes, ...], Tuple[Transaction, ...], int], List[Outcome]] = {}
+
+
+def run_both(
+    mode: str,
+    rule_names: List[str],
+    cache_dir: str,
+    codes: Sequence[bytes],
+    transactions: Sequence[Transaction],
+    setup: Optional[Callable[[type], None]] = None,
+) -> Tuple[List[Outcome], List[Outcome]]:
+    """同一批交易分别在原版 Cancun 和按 mode 配置的 FusedComputation 上执行，返回 (原版结果, 融合结果)。"""
+    _, rounds = ENGINE_MODES[mode]
+    key = (tuple(codes), tuple(transactions), rounds)
+    expected = _EXPECTED.get(key)
+    if expected is None:
+        expected = run_transactions(CancunComputation, codes, transactions, rounds=rounds)
+        _EXPECTED[key] = expected
+    computation_class = fused_class(mode, rule_names, cache_dir, codes, setup)
+    with debug_logging(mode == "debug"):
+        actual = run_transactions(computation_class, codes, transactions, rounds=rounds)
+    return expected, actual
@@ -0,0 +1,196 @@
+# test_analysis_cache.py
+#
+# 分析结果的磁盘缓存: 计划表 (每一种 operand)、JUMPDEST 位图和基本块表写进去再读出来完全一样，
+# 从缓存读出的分析结果执行起来与原版 Cancun 相同；损坏、过期或与代码对不上的文件一律当作没有缓存，
+# 文件内容永远不会被执行。
+
+import contextlib
+import io
+import os
+import pickle
+
+import pytest
+
+import analysis_cache
+from analysis_cache import AnalysisDiskCache, analysis_fingerprint, encode_analysis
+from basic_blocks import BlockTable, build_block_table
+from evm_diff import AMPLE_GAS, contract_address, fused_class, run_transactions
+from eth.vm.forks.cancun.computation import CancunComputation
+from jumpdest_bitmap import JUMPDEST_BITMAPS
+from static_jumps import StaticJump
+
+
+RULES = ["SWAP1_POP", "PUSH1_ADD", "CONST_FOLD", "SELECTOR_DISPATCH", "STATIC_JUMP", "STATIC_JUMPI"]
+
+# 一份 solc 风格的合约，计划表里有每一种 operand:
+#   0x00 选择器分派 aaaaaaaa -> 0x1d, bbbbbbbb -> 0x34
+#   0x1d SWAP1 POP、PUSH1 ADD 和常量折叠，结果写进内存，静态跳转到 0x41
+#   0x34 常量折叠 3 * 4 写入内存，静态跳转到 0x41
+#   0x41 返回 0x00..0x40
+CODE = bytes.fromhex(
+    "60003560e01c"
+    "8063aaaaaaaa1461001d57" "8063bbbbbbbb1461003457" "00"
+    "5b60059050600301600052600160020160205261004156"
+    "5b600360040260005261004156"
+    "5b60406000f3"
+)
+
+CALLDATA = [bytes.fromhex("aaaaaaaa"), bytes.fromhex("bbbbbbbb"), bytes.fromhex("cccccccc"), b""]
+
+ENGINES = [
+    {"predecode_push": True},
+    {"block_gas_precharge": True, "predecode_push": True},
+    {"block_gas_precharge": True, "unchecked_stack": True},
+    {"translate_blocks": True},
+]
+
+
+def _cached_class(cache_dir, engine):
+    computation_class = fused_class("analysis_cache", RULES, cache_dir, [CODE])
+    with contextlib.redirect_stdout(io.StringIO()):
+        computation_class.configure_engine(**engine)
+    return computation_class
+
+
+def _analyze(computation_class):
+    return computation_class._plan_cache.get_analysis(
+        CODE,
+        computation_class._rule_trie,
+        computation_class._constant_folder,
+        computation_class.predecode_push,
+        computation_class._selector_dispatcher,
+        computation_class._static_jumps,
+    )
+
+
+def _entry_state(entry):
+    # operand 的对象没有 __eq__，按数据字段比较
+    opcode, next_pc, rule_id, operand = entry
+    if hasattr(operand, "__slots__"):
+        operand = tuple(getattr(operand, name) for name in operand.__slots__)
+    return opcode, next_pc, rule_id, operand
+
+
+def _stored_analysis(tmp_path):
+    computation_class = _cached_class(str(tmp_path), {"block_gas_precharge": True, "predecode_push": True})
+    analysis = _analyze(computation_class)
+    analysis.blocks = build_block_table(
+        analysis.code, analysis.plan, computation_class.opcodes, computation_class._rule_lengths
+    )
+    computation_class._plan_cache.persist(analysis)
+    return computation_class, analysis
+
+
+def _load(computation_class, code=CODE):
+    disk_cache = computation_class._plan_cache.disk_cache
+    return disk_cache.load(_analyze(computation_class).code_hash, code)
+
+
+def test_analysis_round_trips(tmp_path):
+    computation_class, stored = _stored_analysis(tmp_path)
+    computation_class._reset_plan_cache()
+    JUMPDEST_BITMAPS.clear()
+    loaded = _analyze(computation_class)
+
+    assert computation_class._plan_cache.disk_cache.loads == 1
+    assert [_entry_state(entry) for entry in loaded.plan] == [_entry_state(entry) for entry in stored.plan]
+    assert loaded.blocks.entries == stored.blocks.entries
+    # 读出的位图放进进程内的位图缓存，不再重新扫描代码
+    assert loaded.jumpdests == stored.jumpdests
+    assert JUMPDEST_BITMAPS.get(CODE) is loaded.jumpdests
+    assert JUMPDEST_BITMAPS.misses == 0
+    operand_types = {type(entry[3]).__name__ for entry in loaded.plan if entry[3] is not None}
+    assert operand_types == {"SelectorDispatch", "StaticJump", "tuple", "int"}
+
+
+@pytest.mark.parametrize("engine", ENGINES, ids=lambda engine: ",".join(engine))
+def test_cached_analysis_matches_cancun(engine, tmp_path):
+    transactions = [(contract_address(0), data, AMPLE_GAS) for data in CALLDATA]
+    # 第一个函数从 0 gas 起逐个 gas 执行，在每个融合条目上 OutOfGas
+    transactions += [(contract_address(0), CALLDATA[0], gas) for gas in range(0, 160)]
+    expected = run_transactions(CancunComputation, [CODE], transactions, rounds=2)
+    computation_class = _cached_class(str(tmp_path), engine)
+    actual = run_transactions(computation_class, [CODE], transactions, rounds=2)
+
+    assert not expected[0][1]
+    assert {outcome[1] for outcome in expected[len(CALLDATA):len(transactions)]} == {True, False}
+    assert computation_class._plan_cache.disk_cache.loads == 1
+    assert actual == expected
+
+
+def test_damaged_files_are_misses(tmp_path):
+    computation_class, analysis = _stored_analysis(tmp_path)
+    path = computation_class._plan_cache.disk_cache.path(analysis.code_hash)
+    with open(path, "rb") as f:
+        content = f.read()
+
+    def load(data):
+        with open(path, "wb") as f:
+            f.write(data)
+        return _load(computation_class)
+
+    assert load(content) is not None
+    for size in range(0, len(content), 7):
+        assert load(content[:size]) is None
+    assert load(content + b"\x00") is None
+    assert load(b"XXXX" + content[4:]) is None
+    # 版本与代码长度
+    assert load(content[:4] + b"\xff" + content[5:]) is None
+    assert load(content[:8] + b"\x00" + content[9:]) is None
+
+
+def test_mismatched_contents_are_misses(tmp_path):
+    computation_class, analysis = _stored_analysis(tmp_path)
+    path = computation_class._plan_cache.disk_cache.path(analysis.code_hash)
+
+    # 同一个文件对不上另一份代码
+    assert _load(computation_class, CODE + b"\x00") is None
+
+    # 跳转目标不是 JUMPDEST
+    plan = list(analysis.plan)
+    jump_pc = next(pc for pc, entry in enumerate(plan) if isinstance(entry[3], StaticJump))
+    opcode, next_pc, rule_id, jump = plan[jump_pc]
+    plan[jump_pc] = (opcode, next_pc, rule_id, StaticJump(jump.gas, jump.dest + 1, jump.fallthrough_pc))
+    with open(path, "wb") as f:
+        f.write(encode_analysis(CODE, plan, analysis.jumpdests, analysis.blocks))
+    assert _load(computation_class) is None
+
+    # 规则 ID 与融合操作码 ID 对不上
+    plan = list(analysis.plan)
+    plan[jump_pc] = (opcode + 1, next_pc, rule_id, jump)
+    with open(path, "wb") as f:
+        f.write(encode_analysis(CODE, plan, analysis.jumpdests, analysis.blocks))
+    assert _load(computation_class) is None
+
+
+def test_pickled_files_are_not_executed(tmp_path):
+    computation_class, analysis = _stored_analysis(tmp_path)
+    marker = tmp_path / "executed"
+
+    class Payload:
+        def __reduce__(self):
+            return (open, (str(marker), "w"))
+
+    with open(computation_class._plan_cache.disk_cache.path(analysis.code_hash), "wb") as f:
+        pickle.dump(Payload(), f)
+    computation_class._reset_plan_cache()
+    reanalyzed = _analyze(computation_class)
+
+    assert not marker.exists()
+    assert computation_class._plan_cache.disk_cache.loads == 0
+    assert [_entry_state(entry) for entry in reanalyzed.plan] == [_entry_state(entry) for entry in analysis.plan]
+
+
+def test_fingerprint_covers_rules_and_sources(tmp_path, monkeypatch):
+    computation_class = _cached_class(str(tmp_path), {})
+    rules, lookup = computation_class._active_rules, CancunComputation.opcodes
+    fingerprint = analysis_fingerprint(rules, False, lookup)
+
+    assert analysis_fingerprint(rules, False, lookup) == fingerprint
+    assert analysis_fingerprint(rules, True, lookup) != fingerprint
+    assert analysis_fingerprint(rules[:-1], False, lookup) != fingerprint
+    monkeypatch.setattr(analysis_cache, "_source_hash", "0" * 64)
+    assert analysis_fingerprint(rules, False, lookup) != fingerprint
+
+    cache = AnalysisDiskCache(str(tmp_path), fingerprint, rules, BlockTable)
+    assert os.path.basename(cache.directory).endswith(fingerprint)
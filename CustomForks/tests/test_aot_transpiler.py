@@ -0,0 +1,83 @@
+# test_aot_transpiler.py
+#
+# aot_transpiler 把字节码的翻译布局写进缓存目录；FusedComputation 加载时生成按基本块划分的模块，
+# 执行结果与原版 Cancun 相同，gas 不够整段或遇到未定义指令时交给解释器，缓存里没有布局的代码照常解释执行。
+
+import json
+
+from eth.vm.forks.cancun.computation import CancunComputation
+from eth_hash.auto import keccak
+
+from aot_transpiler import AotModuleCache, cache_path, opcode_fingerprint, write_module
+from evm_diff import AMPLE_GAS, contract_address, run_both
+
+
+CODES = [
+    # PUSH1 1 PUSH1 2 ADD PUSH1 3 MUL PUSH1 0x0e JUMP | STOP STOP STOP | JUMPDEST MSTORE 返回 0..0x20
+    bytes.fromhex("60016002016003" "02600e56" "000000" "5b" "600052" "60206000f3"),
+    # PUSH1 1 PUSH1 0x0b JUMPI 两个分支各返回一个常量
+    bytes.fromhex("6001600b57" "6001600052" "00" "5b" "6002600052" "60206000f3"),
+    # 纯栈运算之后是未定义字节 0x0c
+    bytes.fromhex("6001600201" "0c"),
+]
+
+
+def test_module_has_one_function_per_block(tmp_path):
+    path = write_module(str(tmp_path), CODES[0], CancunComputation.opcodes)
+    assert path == cache_path(str(tmp_path), keccak(CODES[0]), opcode_fingerprint(CancunComputation.opcodes))
+
+    cache = AotModuleCache(str(tmp_path), CancunComputation.opcodes)
+    blocks = cache.load(CODES[0])
+    # 入口和 JUMPDEST (pc 14) 各一个块；缓存里没有模块的代码记为 None
+    assert sorted(blocks) == [0, 14]
+    assert cache.load(CODES[1]) is None
+
+
+def test_transpiled_code_matches_cancun(tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    # 第一份代码从 0 gas 起逐个 gas 执行，覆盖块内每一段的 OutOfGas 回退
+    transactions += [(contract_address(0), b"", gas) for gas in range(0, 60)]
+    expected, actual = run_both("aot", [], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:3]] == [False, False, True]
+    assert actual == expected
+
+
+def test_cache_file_is_data_only(tmp_path):
+    path = write_module(str(tmp_path), CODES[0], CancunComputation.opcodes)
+    with open(path, "r", encoding="utf-8") as f:
+        layout = json.load(f)
+    # 缓存里只有静态跳转和代码段的起止 PC，没有源码；目录里也没有留下临时文件
+    assert layout["static_jumps"] == [[8, 14]]
+    assert layout["runs"] == [[0, 8], [14, 17], [18, 22]]
+    assert sorted(p.name for p in tmp_path.iterdir()) == [path.rsplit("/", 1)[-1]]
+
+
+def test_tampered_cache_file_is_ignored(tmp_path):
+    path = write_module(str(tmp_path), CODES[0], CancunComputation.opcodes)
+    with open(path, "r", encoding="utf-8") as f:
+        layout = json.load(f)
+    # 静态跳转指向非 JUMPDEST、代码段里有不能翻译的指令 (JUMP) 的文件都当作没有缓存
+    for static_jumps, runs in [([[8, 13]], layout["runs"]), (layout["static_jumps"], [[0, 11]])]:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dict(layout, static_jumps=static_jumps, runs=runs), f)
+        assert AotModuleCache(str(tmp_path), CancunComputation.opcodes).load(CODES[0]) is None
+
+
+def test_cache_path_depends_on_gas_table(tmp_path):
+    opcodes = dict(CancunComputation.opcodes)
+    opcodes[0x01] = opcodes[0x01].__class__.as_opcode(opcodes[0x01].logic_fn, "ADD", 5)
+    write_module(str(tmp_path), CODES[0], CancunComputation.opcodes)
+
+    assert opcode_fingerprint(opcodes) != opcode_fingerprint(CancunComputation.opcodes)
+    assert AotModuleCache(str(tmp_path), opcodes).load(CODES[0]) is None
+
+
+def test_module_cache_is_bounded(tmp_path):
+    for code in CODES:
+        write_module(str(tmp_path), code, CancunComputation.opcodes)
+    cache = AotModuleCache(str(tmp_path), CancunComputation.opcodes, max_size=2)
+    for code in CODES:
+        assert cache.load(code) is not None
+
+    assert len(cache) == 2
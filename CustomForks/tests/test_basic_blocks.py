@@ -0,0 +1,47 @@
+# test_basic_blocks.py
+#
+# 基本块表按 JUMPDEST、跳转、停机和动态 gas 指令切分，块入口记录整块的静态 gas；
+# 按块预扣 gas 执行时，每个 gas 边界上的 OutOfGas 都与逐条扣费的原版 Cancun 相同。
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+
+from basic_blocks import build_block_table
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+from fusion_plan import build_fusion_plan
+from rule_compiler import compile_rules
+
+
+def test_blocks_split_at_jumpdests_and_dynamic_gas():
+    # PUSH1 1 PUSH1 2 ADD | JUMPDEST PUSH1 0 MSTORE | STOP
+    code = bytes.fromhex("6001600201" "5b600052" "00")
+    plan = build_fusion_plan(code, compile_rules([]))
+
+    table = build_block_table(code, plan, CancunComputation.opcodes, [])
+
+    # MSTORE 结束第二个块，只有它的静态部分 (3) 计入预扣费
+    assert [entry and entry[0] for entry in table.entries] == [9, None, None, None, None, 7, None, None, None, 0]
+
+
+CODES = [
+    # 常量运算、SWAP1 POP、内存、SHA3、倒数 10 次的循环，返回 GAS 和内存
+    bytes.fromhex(
+        "60016002016003028060005260206000206020526005600490039050600a"
+        "5b6001900380601e5750" "5a604052" "60606000f3"
+    ),
+    # SSTORE/SLOAD、LOG2，GAS 写进存储
+    bytes.fromhex("602a600155" "600154600101600255" "60bb60aa60406000a2" "5a600355" "60206000f3"),
+]
+
+# 第一份代码从 0 gas 起逐个 gas 执行到成功为止，每个块入口和块内每条指令上都会 OutOfGas 一次
+TRANSACTIONS = [(contract_address(0), b"", gas) for gas in range(0, 380)]
+TRANSACTIONS += [(contract_address(1), b"", gas) for gas in range(0, 50000, 997)]
+TRANSACTIONS += [(contract_address(1), b"", AMPLE_GAS)]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_block_precharge_matches_cancun(mode, tmp_path):
+    expected, actual = run_both(mode, [], str(tmp_path), CODES, TRANSACTIONS)
+
+    assert not expected[379][1] and expected[378][1]
+    assert actual == expected
@@ -0,0 +1,66 @@
+# test_block_translator.py
+#
+# translate_blocks 把纯栈运算组成的直线代码段翻译成一个 Python 函数: 段在 JUMPDEST 和不能翻译的指令处断开，
+# 剩余 gas 不够整段的静态 gas 时退回逐条执行，结果与原版 Cancun 相同。
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+
+from block_translator import find_straight_line_runs
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+from fusion_plan import build_fusion_plan
+from rule_compiler import compile_rules
+
+
+def test_runs_split_at_jumpdests_and_other_opcodes():
+    # PUSH1 1 PUSH1 2 ADD | MSTORE | PUSH1 3 (JUMPDEST 前只剩一条，不翻译) | JUMPDEST DUP1 NOT | 截断的 PUSH2
+    code = bytes.fromhex("6001600201" "52" "6003" "5b" "8019" "61ff")
+    plan = build_fusion_plan(code, compile_rules([]))
+
+    runs = find_straight_line_runs(code, plan, CancunComputation.opcodes)
+
+    assert [(start, sequence, end) for start, sequence, _, end in runs] == [
+        (0, (0x60, 0x60, 0x01), 5),
+        (8, (0x5B, 0x80, 0x19), 11),
+    ]
+    assert runs[0][2] == (b"\x01", b"\x02", None)
+
+
+def test_runs_skip_whole_jump_rules():
+    # 以 JUMPI 结尾的融合规则没有 operand，扫描时按规则的指令条数跳过它覆盖的 PUSH1 0 PUSH1 0x0d，不从中间开始一段
+    rule = {
+        "rule_name": "DUP1_PUSH1_PUSH1_JUMPI",
+        "sequence": (0x80, 0x60, 0x60, 0x57),
+        "fused_opcode_id": 0xB3,
+        "rule_id": 0,
+        "is_jump": True,
+    }
+    code = bytes.fromhex("6001" "80" "6000" "600d" "57" "6002600301" "5b" "00")
+    plan = build_fusion_plan(code, compile_rules([rule]))
+    assert plan[2][:3] == (0xB3, None, 0)
+
+    runs = find_straight_line_runs(code, plan, CancunComputation.opcodes, [4])
+
+    assert [(start, sequence, end) for start, sequence, _, end in runs] == [(8, (0x60, 0x60, 0x01), 13)]
+
+
+CODES = [
+    # 常量运算、DUP/SWAP、比较和位运算，结果写进内存返回
+    bytes.fromhex("6003600560078082029190031060ff16801b1c60005260206000f3"),
+    # 栈上元素不够: 段在执行到一半时下溢
+    bytes.fromhex("6001" "5b" "01010100"),
+    # 栈上已有 1023 个元素，段在执行到一半时上溢
+    bytes.fromhex("5f" * 1023 + "600160020100"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_translated_runs_match_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    # 每个 gas 上都会 OutOfGas 一次，覆盖退回逐条执行的情况
+    transactions += [(contract_address(0), b"", gas) for gas in range(0, 80)]
+    expected, actual = run_both(mode, [], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:3]] == [False, True, True]
+    assert not expected[-1][1]
+    assert actual == expected
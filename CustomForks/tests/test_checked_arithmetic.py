@@ -0,0 +1,128 @@
+# test_checked_arithmetic.py
+#
+# CHECKED_ARITHMETIC 只融合不跳转时进入 Panic(0x11) 的 PUSHn <ok> JUMPI 及其前面的检查段，
+# 检查段随分析结果写进磁盘缓存 (只记录跳转目标，读出时按代码重新合成)；
+# 溢出和不溢出、每个 gas 上的 OutOfGas 的执行结果都与原版 Cancun 相同。
+
+import contextlib
+import io
+from collections import OrderedDict
+
+import pytest
+
+from analysis_cache import encode_analysis
+import checked_arithmetic
+from checked_arithmetic import CHECK_FN_NAME, CheckedArithmetic
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, fused_class, run_both
+from fusion_plan import build_fusion_plan
+from jumpdest_bitmap import JUMPDEST_BITMAPS
+
+
+CHECK_RULES = ["CHECKED_ARITHMETIC"]
+
+
+def _panic(code: int) -> str:
+    # Panic(code): 选择器写进内存，错误码放在 0x04，revert 0x00..0x24
+    return "634e487b7160e01b600052" f"60{code:02x}" "60045260246000fd"
+
+
+def _add_one(panic_code: int) -> bytes:
+    """
+    calldata 的第一个字加一，按 solc 0.8.16 起的写法检查溢出，返回结果:
+    PUSH1 0 CALLDATALOAD | DUP1 PUSH1 1 ADD DUP1 SWAP2 SWAP1 LT ISZERO PUSH2 <ok> JUMPI | panic | JUMPDEST 返回
+    """
+    ok = 3 + 13 + len(_panic(panic_code)) // 2
+    return bytes.fromhex("600035" "80600101809190101561" f"{ok:04x}" "57" + _panic(panic_code) + "5b60005260206000f3")
+
+
+CODE = _add_one(0x11)
+
+
+def test_only_overflow_guards_are_fused(tmp_path):
+    computation_class = fused_class("main", CHECK_RULES, str(tmp_path), [])
+    matcher = computation_class._checked_arithmetic
+
+    plan = build_fusion_plan(CODE, computation_class._rule_trie, checked_arithmetic=matcher)
+    fused = {pc: entry for pc, entry in enumerate(plan) if entry[2] is not None}
+    assert sorted(fused) == [3]
+    check = fused[3][3]
+    assert (check.dest, check.fallthrough_pc) == (len(CODE) - 9, 16)
+    # 从磁盘缓存读出时按代码重新取得同一份合成源码；记录与代码对不上 (目标不同、检查段里有 CALLDATALOAD) 时报错
+    assert matcher.rebuild(CODE, 3, check.dest, check.fallthrough_pc).source == check.source
+    with pytest.raises(ValueError):
+        matcher.rebuild(CODE, 3, check.dest + 1, check.fallthrough_pc)
+    with pytest.raises(ValueError):
+        matcher.rebuild(CODE, 2, check.dest, check.fallthrough_pc)
+
+    # 不溢出时进入的是 Panic(0x12) (除以零)，不是溢出检查
+    plan = build_fusion_plan(_add_one(0x12), computation_class._rule_trie, checked_arithmetic=matcher)
+    assert all(entry[2] is None for entry in plan)
+
+
+def _cached_class(cache_dir):
+    computation_class = fused_class("analysis_cache", CHECK_RULES, cache_dir, [CODE])
+    with contextlib.redirect_stdout(io.StringIO()):
+        computation_class.configure_engine(predecode_push=True)
+    return computation_class
+
+
+def _analyze(computation_class):
+    return computation_class._plan_cache.get_analysis(
+        CODE,
+        computation_class._rule_trie,
+        predecode_push=computation_class.predecode_push,
+        checked_arithmetic=computation_class._checked_arithmetic,
+    )
+
+
+def test_checks_round_trip_through_the_disk_cache(tmp_path):
+    computation_class = _cached_class(str(tmp_path))
+    stored = _analyze(computation_class)
+    computation_class._reset_plan_cache()
+    JUMPDEST_BITMAPS.clear()
+    loaded = _analyze(computation_class)
+
+    assert computation_class._plan_cache.disk_cache.loads == 1
+    stored_check, loaded_check = stored.plan[3][3], loaded.plan[3][3]
+    assert isinstance(loaded_check, CheckedArithmetic)
+    assert (loaded_check.source, loaded_check.dest, loaded_check.fallthrough_pc) == (
+        stored_check.source, stored_check.dest, stored_check.fallthrough_pc
+    )
+    # 编译好的函数所有合约共用
+    assert loaded_check.check_fn is stored_check.check_fn
+
+    # 记录的检查段与代码对不上时当作没有缓存
+    plan = list(stored.plan)
+    opcode, next_pc, rule_id, check = plan[3]
+    plan[3] = (opcode, next_pc, rule_id, CheckedArithmetic(check.source, check.dest, check.fallthrough_pc - 1))
+    disk_cache = computation_class._plan_cache.disk_cache
+    with open(disk_cache.path(stored.code_hash), "wb") as f:
+        f.write(encode_analysis(CODE, plan, stored.jumpdests, None))
+    assert disk_cache.load(stored.code_hash, CODE) is None
+
+
+CALLDATA = [(5).to_bytes(32, "big"), (2 ** 256 - 1).to_bytes(32, "big")]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_checked_arithmetic_matches_cancun(mode, tmp_path):
+    transactions = [(contract_address(0), data, AMPLE_GAS) for data in CALLDATA]
+    # 不溢出和溢出两条路径上逐个 gas 出现 OutOfGas
+    transactions += [(contract_address(0), data, gas) for data in CALLDATA for gas in range(0, 80)]
+    expected, actual = run_both(mode, CHECK_RULES, str(tmp_path), [CODE], transactions)
+
+    assert [outcome[1] for outcome in expected[:2]] == [False, True]
+    assert actual == expected
+
+
+def test_compiled_checks_are_bounded(monkeypatch):
+    monkeypatch.setattr(checked_arithmetic, "_CHECK_FNS", OrderedDict())
+    monkeypatch.setattr(checked_arithmetic, "CHECK_CACHE_SIZE", 2)
+    checks = [
+        CheckedArithmetic(f"def {CHECK_FN_NAME}(computation):\n    return {value}\n", 0, 0)
+        for value in range(3)
+    ]
+    # 同一份源码共用编译好的函数，最久未使用的被淘汰，已经建好的 operand 不受影响
+    assert CheckedArithmetic(checks[2].source, 0, 0).check_fn is checks[2].check_fn
+    assert list(checked_arithmetic._CHECK_FNS) == [checks[1].source, checks[2].source]
+    assert [check.check_fn(None) for check in checks] == [0, 1, 2]
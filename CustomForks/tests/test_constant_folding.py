@@ -0,0 +1,47 @@
+# test_constant_folding.py
+#
+# CONST_FOLD 在分析阶段把只依赖立即数的 PUSH/运算序列折叠成一个条目: gas 是原序列之和，
+# 压栈的常量保持逐条执行时的表示 (运算结果是 int，剩下的 PUSH 是 bytes)。
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+
+import fusion_config
+from constant_folding import ConstantFolder
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+
+
+FOLDER = ConstantFolder({**fusion_config.ALL_FUSION_RULES["CONST_FOLD"], "rule_id": 0}, CancunComputation.opcodes)
+
+
+def test_fold_keeps_the_longest_computed_region():
+    # PUSH1 1 PUSH1 2 ADD PUSH1 0x1f NOT | MSTORE
+    code = bytes.fromhex("6001600201601f19" "52")
+    assert FOLDER.fold(code, 0) == (8, (15, (3, 2 ** 256 - 1 - 0x1F), 2))
+    # PUSH1 1 PUSH1 4 后面没有运算，不折叠
+    assert FOLDER.fold(bytes.fromhex("6001600452"), 0) is None
+
+
+def test_fold_stops_at_outside_stack_inputs():
+    # ADD 要用到进入区间之前的栈元素: 只有 PUSH1 1 PUSH1 1 SHL 被折叠
+    assert FOLDER.fold(bytes.fromhex("600160011b" "01"), 0) == (5, (9, (2,), 2))
+    # 区间末尾没有被用掉的 PUSH 仍然是 bytes
+    assert FOLDER.fold(bytes.fromhex("60016002016005" "52"), 0) == (7, (12, (3, b"\x05"), 2))
+
+
+CODES = [
+    # (1 + 2) * 3，~0x1f 写进内存后返回
+    bytes.fromhex("600160020160030260005260" "1f19602052" "60406000f3"),
+    # 栈上已有 1023 个元素，折叠区间执行到一半时上溢
+    bytes.fromhex("5f" * 1023 + "600160020100"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_folded_code_matches_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    transactions += [(contract_address(0), b"", gas) for gas in range(0, 60)]
+    expected, actual = run_both(mode, ["CONST_FOLD"], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:2]] == [False, True]
+    assert actual == expected
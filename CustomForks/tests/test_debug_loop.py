@@ -0,0 +1,46 @@
+# test_debug_loop.py
+#
+# computation logger 打开 DEBUG 时走 _debug_loop: 记录每次融合命中和每条指令；
+# 否则走不做任何日志的生产循环。两种循环的执行结果相同。
+
+import logging
+
+import pytest
+
+from evm_diff import AMPLE_GAS, contract_address, debug_logging, fused_class, run_transactions
+
+
+# PUSH1 5 DUP1 ADD，结果写进内存返回
+CODE = bytes.fromhex("6005800160005260206000f3")
+
+
+class _Records(logging.Handler):
+    def __init__(self) -> None:
+        super().__init__(logging.NOTSET)
+        self.messages = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.messages.append(record.getMessage())
+
+
+@pytest.mark.parametrize("mode", ["main", "block"])
+def test_only_the_debug_loop_logs(mode, tmp_path):
+    computation_class = fused_class(mode, ["PUSH1_DUP1"], str(tmp_path), [CODE])
+    transactions = [(contract_address(0), b"", AMPLE_GAS)]
+    records = _Records()
+    logger = logging.getLogger(computation_class.logger.name)
+
+    logger.addHandler(records)
+    try:
+        quiet = run_transactions(computation_class, [CODE], transactions)
+    finally:
+        logger.removeHandler(records)
+    assert records.messages == []
+
+    with debug_logging(True, records):
+        logged = run_transactions(computation_class, [CODE], transactions)
+
+    assert logged == quiet
+    assert "FUSION HIT: PUSH1_DUP1 at PC 0" in records.messages
+    assert "OPCODE: 0xb1 (FUSED_PUSH1_DUP1) | pc: 0 | stack: []" in records.messages
+    assert any(message.startswith("OPCODE: 0x1 (ADD) | pc: 3") for message in records.messages)
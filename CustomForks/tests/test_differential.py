@@ -0,0 +1,148 @@
+# test_differential.py
+#
+# 每种执行方式 (evm_diff.ENGINE_MODES) 在不启用规则和启用全部 gas 等价规则时，都必须与原版 Cancun
+# 给出相同的 gas、是否出错、返回值、日志和状态根: 正常执行、每个 gas 边界上的 OutOfGas、
+# 栈下溢/上溢、非法跳转。代码里的未定义字节见 test_undefined_opcodes。
+
+import pytest
+
+from evm_diff import AMPLE_GAS, ENGINE_MODES, EQUIVALENT_RULES, contract_address, run_both
+
+
+RULE_SETS = {"no_rules": [], "equivalent_rules": EQUIVALENT_RULES}
+
+PANIC = "634e487b7160e01b600052601160045260246000fd"
+
+
+def _address(index: int) -> str:
+    return contract_address(index).hex()
+
+
+# 正常执行的合约 (下标即部署位置，calls 调用 3 和 4)
+NORMAL_CODES = [
+    # 0 compute: 常量运算、SWAP1 POP、内存、SHA3、倒数 10 次的循环 (0x1e)，返回 GAS 和内存
+    bytes.fromhex(
+        "60016002016003028060005260206000206020526005600490039050600a"
+        "5b6001900380601e5750" "5a604052" "60606000f3"
+    ),
+    # 1 storage: SSTORE/SLOAD、balances[CALLER] += 1 (mapping 访问)、LOG2、TSTORE/TLOAD，GAS 写进存储
+    bytes.fromhex(
+        "602a600155" "600154600101600255"
+        "336000526007602052604060002080546001019055"
+        "60bb60aa60406000a2" "600560035d60035c600052" "5a600355" "60206000f3"
+    ),
+    # 2 calls: CALL 成功的合约、CALL 会 revert 的合约、STATICCALL，返回值与 RETURNDATASIZE 累加后写进存储
+    bytes.fromhex(
+        "6020600060006000600073" + _address(3) + "5af1" "60005101" "3d01"
+        "6020600060006000600073" + _address(4) + "5af1" "01"
+        "60206000600060007" "3" + _address(3) + "5afa" "01" "600055" "60206000f3"
+    ),
+    # 3 返回 0x42
+    bytes.fromhex("604260005260206000f3"),
+    # 4 revert
+    bytes.fromhex("60006000fd"),
+    # 5 solc 风格的合约: 选择器分派 (aaaaaaaa -> 0x1d, bbbbbbbb -> 0x66)、mapping 访问、带溢出检查的加一、
+    #   常量折叠、LOG1、静态跳转
+    bytes.fromhex(
+        "60003560e01c"
+        "8063aaaaaaaa1461001d57" "8063bbbbbbbb1461006657" "00"
+        "5b33600052600160205260406000208054"
+        "80600101809190101561005057" + PANIC +
+        "5b90556001600201600052607760206000a1610073565b"
+        "6003600402600052610073565b"
+        "60206000f3"
+    ),
+    # 6 溢出检查失败: 2**256 - 1 加一，进入 Panic(0x11) 的 revert
+    bytes.fromhex("7f" + "ff" * 32 + "80600101809190101561004357" + PANIC + "5b60005500"),
+    # 7 CREATE 空合约，ADDRESS BALANCE EXTCODESIZE
+    bytes.fromhex("600060006000f0600055" "3031303b01600155" "00"),
+]
+
+SELECTORS = [bytes.fromhex("aaaaaaaa"), bytes.fromhex("bbbbbbbb"), bytes.fromhex("cccccccc"), b""]
+
+NORMAL_TRANSACTIONS = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(NORMAL_CODES))]
+NORMAL_TRANSACTIONS += [(contract_address(5), data, AMPLE_GAS) for data in SELECTORS]
+
+
+@pytest.mark.parametrize("rules", list(RULE_SETS))
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_normal_execution(mode, rules, tmp_path):
+    expected, actual = run_both(mode, RULE_SETS[rules], str(tmp_path), NORMAL_CODES, NORMAL_TRANSACTIONS)
+
+    assert [outcome[1] for outcome in expected[:len(NORMAL_CODES)]] == [False] * 4 + [True, False, True, False]
+    assert actual == expected
+
+
+# compute 从 0 gas 起逐个 gas 执行到成功为止，每条指令 (和每个融合条目、基本块入口) 上都会 OutOfGas 一次；
+# 其余合约每隔一段 gas 执行一次，覆盖 SSTORE、CALL、CREATE 和 LOG 的边界
+OUT_OF_GAS_TRANSACTIONS = [(contract_address(0), b"", gas) for gas in range(0, 380)]
+OUT_OF_GAS_TRANSACTIONS += [(contract_address(5), SELECTORS[0], gas) for gas in range(0, 520)]
+OUT_OF_GAS_TRANSACTIONS += [(contract_address(5), SELECTORS[0], gas) for gas in range(520, 30000, 331)]
+OUT_OF_GAS_TRANSACTIONS += [(contract_address(index), b"", gas) for index in (1, 2, 7) for gas in range(0, 92000, 1499)]
+
+
+@pytest.mark.parametrize("rules", list(RULE_SETS))
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_out_of_gas(mode, rules, tmp_path):
+    expected, actual = run_both(mode, RULE_SETS[rules], str(tmp_path), NORMAL_CODES, OUT_OF_GAS_TRANSACTIONS)
+
+    assert not expected[379][1] and expected[378][1]
+    assert actual == expected
+
+
+# 栈下溢和上溢，包括融合条目、分派链、检查段和 mapping 访问在栈不够或栈满时的情况
+STACK_CODES = [
+    bytes.fromhex("01"),
+    bytes.fromhex("600101"),
+    bytes.fromhex("60019050"),
+    bytes.fromhex("6001600201010100"),
+    bytes.fromhex("8063aaaaaaaa1461001757" "8063bbbbbbbb1461001757" "00" "5b00"),
+    bytes.fromhex("80600101809190101561002257" + PANIC + "5b00"),
+    bytes.fromhex("600052600160205260406000208054"),
+    bytes.fromhex("5f" * 1025),
+    bytes.fromhex("5f" * 1024 + "80"),
+    bytes.fromhex("5f" * 1023 + "6001600201"),
+    bytes.fromhex("5f" * 1022 + "600160020100"),
+    bytes.fromhex("5f" * 1022 + "60019050" "600200"),
+    bytes.fromhex("5f" * 1023 + "8063aaaaaaaa1461041557" "8063bbbbbbbb1461041557" "5b00"),
+    # 每次循环压入一个元素，第 1025 个元素上溢
+    bytes.fromhex("5b5f600056"),
+]
+
+
+@pytest.mark.parametrize("rules", list(RULE_SETS))
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_stack_underflow_and_overflow(mode, rules, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(STACK_CODES))]
+    expected, actual = run_both(mode, RULE_SETS[rules], str(tmp_path), STACK_CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:len(STACK_CODES)]] == [True] * 10 + [False, False, True, True]
+    assert actual == expected
+
+
+# 非法跳转: PUSH 立即数里的 0x5b、代码结尾之外、不是 JUMPDEST 的指令、超过 2**32 的目标，
+# JUMP 与 JUMPI (跳与不跳)，静态与计算出的目标，目标不合法的分派链
+JUMP_CODES = [
+    bytes.fromhex("600456605b00"),
+    bytes.fromhex("61ffff56"),
+    bytes.fromhex("600056"),
+    bytes.fromhex("600356"),
+    bytes.fromhex("7f" + "ff" * 32 + "56"),
+    bytes.fromhex("6001600057"),
+    bytes.fromhex("600160075700605b00"),
+    bytes.fromhex("6000600057" "600160005500"),
+    bytes.fromhex("600360030156" "5b600160005500"),
+    bytes.fromhex("600360040156" "5b00"),
+    bytes.fromhex("60003560e01c" "8063aaaaaaaa146100ff57" "8063bbbbbbbb146100ff57" "00"),
+]
+
+
+@pytest.mark.parametrize("rules", list(RULE_SETS))
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_invalid_jumps(mode, rules, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(JUMP_CODES))]
+    transactions.append((contract_address(len(JUMP_CODES) - 1), SELECTORS[0], AMPLE_GAS))
+    expected, actual = run_both(mode, RULE_SETS[rules], str(tmp_path), JUMP_CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:len(transactions)]] == [True] * 7 + [False, False, True, False, True]
+    assert actual == expected
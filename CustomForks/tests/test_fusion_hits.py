@@ -0,0 +1,43 @@
+# test_fusion_hits.py
+#
+# 融合命中按规则 ID 计数，子调用帧与 origin computation 共用同一个计数列表，
+# origin 上的 fusion_hit_counts 包含所有子调用里的命中。
+
+import pytest
+
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, fused_class, run_transactions
+
+
+def _call(index: int) -> str:
+    return "6000600060006000600073" + contract_address(index).hex() + "5af150"
+
+
+CODES = [
+    # 0: PUSH1 5 DUP1 ADD POP，调用 1 两次
+    bytes.fromhex("6005800150" + _call(1) + _call(1) + "00"),
+    # 1: PUSH1 5 DUP1 ADD POP，调用 2
+    bytes.fromhex("6005800150" + _call(2) + "00"),
+    # 2: PUSH1 7 DUP1 MSTORE
+    bytes.fromhex("60078052" "00"),
+]
+
+# 0 命中一次，两次调用 1 各命中一次，1 的两次调用 2 各命中一次
+ALL_HITS = 5
+# 命中次数不同的执行方式:
+#   translate / aot 把整段纯栈运算 (包括其中的 PUSH1 DUP1) 翻译成一个函数执行，不经过融合条目
+#   tiers 每份代码第一次执行用原生解释器，只有 1 和 2 的第二次执行经过融合条目
+MODE_HITS = {"translate": 0, "aot": 0, "tiers": 2}
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_child_frames_count_into_the_origin(mode, tmp_path):
+    computation_class = fused_class(mode, ["SUB_MUL", "PUSH1_DUP1"], str(tmp_path), CODES)
+    computations = []
+
+    run_transactions(computation_class, CODES, [(contract_address(0), b"", AMPLE_GAS)], computations)
+
+    origin = computations[0]
+    assert not origin.is_error
+    hits = MODE_HITS.get(mode, ALL_HITS)
+    assert origin.fusion_hit_counts == ({"PUSH1_DUP1": hits} if hits else {})
+    assert origin.fusion_hits == [0, hits]
@@ -0,0 +1,56 @@
+# test_halting_ops.py
+#
+# STOP / RETURN 换成不抛出 Halt 的版本后 gas 和助记符不变，只替换 py-evm 原版的 logic_fn。
+# 代码中间的 STOP / RETURN、子调用里的 RETURN、REVERT 和 INVALID 的执行结果都与原版 Cancun 相同。
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+from eth.vm.opcode import as_opcode
+
+from evm_diff import AMPLE_GAS, ENGINE_MODES, EQUIVALENT_RULES, contract_address, run_both
+from halting_ops import RETURN_OPCODE, STOP_OPCODE, build_halting_opcodes, return_without_halt, stop_without_halt
+
+
+def test_replacements_keep_gas_and_mnemonic():
+    halting_opcodes = build_halting_opcodes(CancunComputation.opcodes)
+
+    assert set(halting_opcodes) == {STOP_OPCODE, RETURN_OPCODE}
+    assert halting_opcodes[STOP_OPCODE].logic_fn is stop_without_halt
+    assert halting_opcodes[RETURN_OPCODE].logic_fn is return_without_halt
+    for opcode, opcode_fn in halting_opcodes.items():
+        assert opcode_fn.mnemonic == CancunComputation.opcodes[opcode].mnemonic
+        assert opcode_fn.gas_cost == CancunComputation.opcodes[opcode].gas_cost
+
+
+def test_rewritten_opcodes_are_kept():
+    rewritten = as_opcode(logic_fn=lambda computation: None, mnemonic="STOP", gas_cost=0)
+
+    assert build_halting_opcodes({STOP_OPCODE: rewritten}) == {}
+
+
+CODES = [
+    # 代码中间的 STOP，后面的 SSTORE 不能执行
+    bytes.fromhex("6001600055" "00" "6002600155"),
+    # RETURN 扩展内存到 0x400，后面的代码不能执行
+    bytes.fromhex("602a610200" "52" "6020610200" "f3" "6001600055"),
+    # 子调用 (代码 1) RETURN 之后，调用者继续执行并返回子调用的结果
+    bytes.fromhex(
+        "6020600060006000600073" + contract_address(1).hex() + "5af1" "50" "60206000f3"
+    ),
+    # REVERT 带返回数据
+    bytes.fromhex("6001600055" "602a600052" "60206000fd"),
+    # INVALID
+    bytes.fromhex("6001600055" "fe"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_halting_matches_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    # RETURN 的内存扩展上逐个 gas 出现 OutOfGas
+    transactions += [(contract_address(1), b"", gas) for gas in range(0, 80)]
+    expected, actual = run_both(mode, EQUIVALENT_RULES, str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:len(CODES)]] == [False, False, False, True, True]
+    assert {outcome[1] for outcome in expected[len(CODES):]} == {True, False}
+    assert actual == expected
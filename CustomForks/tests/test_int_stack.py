@@ -0,0 +1,62 @@
+# test_int_stack.py
+#
+# IntStack 压栈时把 bytes 转成 int，按 bytes 取值时再转回去；
+# 用整数栈执行的结果与原版 Cancun 相同，手写的融合函数在整数栈上照常工作。
+
+import pytest
+from eth.exceptions import FullStack, InsufficientStack
+
+from evm_diff import AMPLE_GAS, EQUIVALENT_RULES, contract_address, run_both
+from int_stack import IntStack, pop_ints
+
+
+def test_bytes_are_stored_as_ints():
+    stack = IntStack()
+    stack.push_bytes(b"\x01\x00")
+    stack.push_int(7)
+
+    assert stack.values == [256, 7]
+    assert stack.pop1_bytes() == b"\x07"
+    assert stack.pop1_int() == 256
+    with pytest.raises(InsufficientStack):
+        stack.pop1_int()
+
+
+def test_pop_ints_accepts_raw_bytes():
+    # 快速路径可能照旧压入 bytes
+    values = [3, b"\x02", 1]
+
+    assert pop_ints(values, 2) == (1, 2)
+    assert values == [3]
+    with pytest.raises(InsufficientStack):
+        pop_ints(values, 2)
+
+
+def test_stack_limit():
+    stack = IntStack()
+    for _ in range(1024):
+        stack.push_bytes(b"\x01")
+
+    with pytest.raises(FullStack):
+        stack.push_bytes(b"\x01")
+    with pytest.raises(FullStack):
+        stack.push_int(1)
+
+
+CODES = [
+    # CALLDATALOAD 和 MLOAD 压入 bytes，再做运算、MSTORE、BALANCE(ADDRESS) 之后返回
+    bytes.fromhex("60003560205260205160010160005230316020526040" "6000f3"),
+    # PUSH32 的值经过 SHR、BYTE、SIGNEXTEND
+    bytes.fromhex("7f" + "ff" * 31 + "80" "60081c" "601f1a" "60000b" "60005260206000f3"),
+    # 栈下溢
+    bytes.fromhex("6001" "01"),
+]
+
+
+@pytest.mark.parametrize("rule_names", [[], EQUIVALENT_RULES], ids=["no_rules", "equivalent_rules"])
+def test_int_stack_matches_cancun(rule_names, tmp_path):
+    transactions = [(contract_address(index), bytes(range(32)), AMPLE_GAS) for index in range(len(CODES))]
+    expected, actual = run_both("int_stack", rule_names, str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected] == [False, False, True]
+    assert actual == expected
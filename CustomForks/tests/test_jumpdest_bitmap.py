@@ -0,0 +1,63 @@
+# test_jumpdest_bitmap.py
+#
+# JUMPDEST 位图只标记不在 PUSH 立即数里的 0x5b，按 code hash 缓存且有上限；
+# JUMP/JUMPI 查位图校验目标，报错与原版 Cancun 相同；融合规则不会跨过 JUMPDEST。
+
+import pytest
+
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+from jumpdest_bitmap import JumpdestBitmapCache, build_jumpdest_bitmap, is_jump_destination
+from rule_compiler import compile_rules, match_longest
+
+
+def test_bitmap_skips_push_immediates():
+    # JUMPDEST PUSH1 0x5b JUMPDEST PUSH2 0x5b (立即数被截断)
+    code = bytes.fromhex("5b605b5b615b")
+    bitmap = build_jumpdest_bitmap(code)
+
+    assert [pc for pc in range(len(code) + 8) if is_jump_destination(bitmap, pc)] == [0, 3]
+
+
+def test_cache_is_bounded_by_code_hash():
+    cache = JumpdestBitmapCache(max_size=2)
+    codes = [bytes([0x5B] * size) for size in (1, 2, 3)]
+
+    first = cache.get(codes[0])
+    assert cache.get(codes[0]) is first
+    cache.get(codes[1])
+    cache.get(codes[2])
+
+    assert len(cache) == 2
+    assert (cache.hits, cache.misses) == (1, 3)
+    # 最久未使用的 codes[0] 已被淘汰
+    assert cache.get(codes[0]) is not first
+
+
+def test_rules_do_not_span_a_jumpdest():
+    rule = {"rule_name": "POP_JUMPDEST_POP", "sequence": (0x50, 0x5B, 0x50), "fused_opcode_id": 0x100, "rule_id": 0}
+    trie = compile_rules([rule])
+
+    assert match_longest(bytes.fromhex("505b50"), 0, trie) == (None, 0)
+
+
+CODES = [
+    # PUSH1 4 JUMP 越过 STOP 到 JUMPDEST，返回 0..0x20
+    bytes.fromhex("600456" "00" "5b60206000f3"),
+    # 跳到 PUSH1 立即数里的 0x5b
+    bytes.fromhex("600456605b00"),
+    # 跳到普通指令和越过代码末尾
+    bytes.fromhex("60015600"),
+    bytes.fromhex("61ffff56"),
+    # JUMPI 条件为真、目标不合法；条件为假时不校验目标
+    bytes.fromhex("6001600357" "00"),
+    bytes.fromhex("6000600357" "60206000f3"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_jumps_match_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    expected, actual = run_both(mode, [], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:len(CODES)]] == [False, True, True, True, True, False]
+    assert actual == expected
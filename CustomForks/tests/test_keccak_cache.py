@@ -0,0 +1,92 @@
+# test_keccak_cache.py
+#
+# keccak 缓存按输入内容缓存 SHA3 的结果，占用的内存不超过上限，超长的输入直接计算；
+# 换上缓存版 SHA3 后 gas、助记符不变，执行结果 (包括每个 gas 上的 OutOfGas) 与原版 Cancun 相同。
+
+import contextlib
+import io
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+from eth.vm.opcode import as_opcode
+from eth_hash.auto import keccak
+
+from custom_computation import FusedComputation
+from evm_diff import AMPLE_GAS, ENGINE_MODES, EQUIVALENT_RULES, contract_address, fused_class, run_both, run_transactions
+from keccak_cache import ENTRY_OVERHEAD, SHA3_OPCODE, KeccakCache, build_keccak_opcodes
+
+
+def test_cache_is_bounded_by_bytes():
+    cache = KeccakCache(max_bytes=2 * (64 + 32 + ENTRY_OVERHEAD), max_preimage_size=64)
+    words = [bytes([index]) * 64 for index in range(3)]
+
+    assert [cache.keccak(word) for word in words[:2]] == [keccak(word) for word in words[:2]]
+    assert cache.keccak(words[0]) == keccak(words[0])
+    # 第三个条目挤掉最久未使用的 words[1]
+    cache.keccak(words[2])
+    cache.keccak(words[1])
+    stats = cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 1, 4, 2)
+    assert stats["size_bytes"] <= stats["max_bytes"]
+
+    # 超过 max_preimage_size 的输入直接计算，不计入命中率
+    assert cache.keccak(b"\x01" * 65) == keccak(b"\x01" * 65)
+    assert (len(cache), cache.hits + cache.misses) == (2, 5)
+
+
+def test_replacement_keeps_gas_and_mnemonic():
+    stock = CancunComputation.opcodes[SHA3_OPCODE]
+    replaced = build_keccak_opcodes(CancunComputation.opcodes, KeccakCache())[SHA3_OPCODE]
+
+    assert (replaced.mnemonic, replaced.gas_cost) == (stock.mnemonic, stock.gas_cost)
+    rewritten = as_opcode(logic_fn=lambda computation: None, mnemonic="SHA3", gas_cost=30)
+    assert build_keccak_opcodes({SHA3_OPCODE: rewritten}, KeccakCache()) == {}
+
+
+def test_configure_validates_and_disables():
+    computation_class = type("KeccakFusedComputation", (FusedComputation,), {})
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        with pytest.raises(ValueError):
+            computation_class.configure_keccak_cache(max_bytes=0)
+        with pytest.raises(ValueError):
+            computation_class.configure_keccak_cache(max_preimage_size=-1)
+        computation_class.configure_keccak_cache()
+        assert computation_class.keccak_cache is not None
+        assert computation_class.opcodes[SHA3_OPCODE] is not CancunComputation.opcodes[SHA3_OPCODE]
+        computation_class.configure_keccak_cache(max_bytes=None)
+    assert computation_class.keccak_cache is None
+    assert computation_class.opcodes[SHA3_OPCODE] is CancunComputation.opcodes[SHA3_OPCODE]
+
+
+CODES = [
+    # 对 0..0x40、空输入、以及 0..0xc8 (超过 128 字节，不进缓存) 做 SHA3，三个结果写进存储后返回第一个
+    bytes.fromhex(
+        "602a600052600760205260406000" "20" "80600055"
+        "60006000" "20" "600155"
+        "60c86000" "20" "600255"
+        "600052" "60206000f3"
+    ),
+    # 输入的位置很大，内存扩展 OutOfGas
+    bytes.fromhex("6020630100000020" "00"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_sha3_matches_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    transactions += [(contract_address(0), b"", gas) for gas in range(0, 70000, 331)]
+    expected, actual = run_both(mode, EQUIVALENT_RULES, str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:2]] == [False, True]
+    assert {outcome[1] for outcome in expected[2:]} == {True, False}
+    assert actual == expected
+
+
+def test_repeated_preimages_hit_the_cache(tmp_path):
+    computation_class = fused_class("keccak_cache", [], str(tmp_path), CODES)
+    run_transactions(computation_class, CODES, [(contract_address(0), b"", AMPLE_GAS)] * 2)
+
+    # 两次执行: 64 字节和空输入第一次未命中、第二次命中，200 字节的输入不进缓存
+    assert computation_class.keccak_cache.stats()["hits"] == 2
+    assert computation_class.keccak_cache.stats()["misses"] == 2
@@ -0,0 +1,47 @@
+# test_local_gas.py
+#
+# local_gas 把剩余 gas 放在循环的局部变量里: 静态 gas 指令在局部变量上扣费，
+# 动态 gas 指令、GAS 和子调用前后与 GasMeter 同步。任何一条指令上 OutOfGas 时的结果都与原版 Cancun 相同。
+
+import contextlib
+import io
+
+import pytest
+
+from custom_computation import FusedComputation
+from evm_diff import AMPLE_GAS, EQUIVALENT_RULES, contract_address, run_both
+
+
+def _call(index: int) -> str:
+    # CALL(gas=GAS, to=contract_address(index), value=0, 无 calldata，返回值写到 0..0x20)
+    return "6020600060006000600073" + contract_address(index).hex() + "5af1"
+
+
+CODES = [
+    # 静态 gas 运算、内存扩展 (MSTORE 0x100)、GAS、SLOAD/SSTORE、子调用之后返回 GAS 的差值
+    bytes.fromhex(
+        "5a" "6001600201" "610100" "52" "5a" "6000" "54" "6001" "01" "6000" "55"
+        + _call(1) + "50" "5a" "90" "03" "600052" "60206000f3"
+    ),
+    # 子调用的代码: KECCAK256 的动态 gas 之后返回
+    bytes.fromhex("60406000" "20" "600052" "60206000f3"),
+]
+
+
+@pytest.mark.parametrize("rule_names", [[], EQUIVALENT_RULES], ids=["no_rules", "equivalent_rules"])
+def test_every_out_of_gas_point_matches_cancun(rule_names, tmp_path):
+    transactions = [(contract_address(0), b"", AMPLE_GAS)]
+    transactions += [(contract_address(0), b"", gas) for gas in range(0, 25000, 37)]
+    expected, actual = run_both("local_gas", rule_names, str(tmp_path), CODES, transactions)
+
+    assert not expected[0][1]
+    assert {outcome[1] for outcome in expected[1:]} == {True, False}
+    assert actual == expected
+
+
+@pytest.mark.parametrize("engine", [{"block_gas_precharge": True}, {"translate_blocks": True}])
+def test_local_gas_rejects_other_gas_strategies(engine):
+    computation_class = type("LocalGasFusedComputation", (FusedComputation,), {})
+
+    with pytest.raises(ValueError), contextlib.redirect_stdout(io.StringIO()):
+        computation_class.configure_engine(local_gas=True, **engine)
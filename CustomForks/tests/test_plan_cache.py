@@ -0,0 +1,38 @@
+# test_plan_cache.py
+#
+# 分析结果按代码内容缓存: 同一份代码的调用帧只在第一次未命中时计算 keccak，之后直接命中；
+# 分层执行的计数同样不计算 keccak。
+
+import pytest
+
+import fusion_plan
+from evm_diff import AMPLE_GAS, contract_address, fused_class, run_transactions
+
+
+CODES = [
+    # 调用 1 两次之后返回
+    bytes.fromhex(
+        ("6000600060006000600073" + contract_address(1).hex() + "5af150") * 2 + "00"
+    ),
+    bytes.fromhex("6005800150" "00"),
+]
+
+
+@pytest.mark.parametrize("mode", ["main", "tiers"])
+def test_frames_do_not_hash_cached_code(mode, tmp_path, monkeypatch):
+    computation_class = fused_class(mode, [], str(tmp_path), CODES)
+    hashed = []
+    keccak = fusion_plan.keccak
+
+    def counting_keccak(data):
+        hashed.append(data)
+        return keccak(data)
+
+    monkeypatch.setattr(fusion_plan, "keccak", counting_keccak)
+    run_transactions(computation_class, CODES, [(contract_address(0), b"", AMPLE_GAS)] * 4)
+
+    # 每份代码只在第一次分析时算一次 keccak
+    assert sorted(hashed) == sorted(CODES)
+    plan_cache = computation_class._plan_cache
+    assert plan_cache.misses == 2
+    assert plan_cache.hits > 0
@@ -0,0 +1,46 @@
+# test_predecode.py
+#
+# predecode_push 把没有被融合的 PUSH 的立即数提前解码成 int 存进计划表，执行时直接压栈。
+# 栈上的 int 与原来的 bytes 对所有指令都是等价的，结果必须与原版 Cancun 相同。
+
+import pytest
+
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+from fusion_plan import build_fusion_plan
+from rule_compiler import compile_rules
+
+
+def test_push_entries_carry_int_immediates():
+    # PUSH0 PUSH2 0x0102 ADD PUSH3 被代码末尾截断 (右侧补零)
+    code = bytes.fromhex("5f610102" "01" "62ab")
+    plan = build_fusion_plan(code, compile_rules([]), predecode_push=True)
+
+    assert plan[0] == (0x5F, 1, None, 0)
+    assert plan[1] == (0x61, 4, None, 0x0102)
+    assert plan[4] == (0x01, None, None, None)
+    assert plan[5] == (0x62, 9, None, 0xAB0000)
+    # 不打开时 PUSH 仍是普通条目
+    assert build_fusion_plan(code, compile_rules([]))[1] == (0x61, None, None, None)
+
+
+CODES = [
+    # PUSH 的值作为 bytes 使用: MSTORE、MSTORE8、BALANCE 的地址、SHA3、RETURN
+    bytes.fromhex(
+        "7f" + "11" * 32 + "600052" "61abcd601f53" "73" + "ff" * 20 + "31600155"
+        "60206000206002556000546003556020" "6000f3"
+    ),
+    # 截断的 PUSH32 在代码末尾压入补零后的值，随后越过代码末尾停止
+    bytes.fromhex("7f01"),
+    # 栈上已有 1024 个元素时的 PUSH
+    bytes.fromhex("5f" * 1024 + "6001"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_predecoded_pushes_match_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    transactions += [(contract_address(0), b"", gas) for gas in range(0, 40200, 397)]
+    expected, actual = run_both(mode, [], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:3]] == [False, False, True]
+    assert actual == expected
@@ -0,0 +1,84 @@
+# test_rule_compiler.py
+#
+# 规则编译成指令 trie 后按指令边界做最长匹配: PUSH 的立即数不参与匹配，旧写法的规则按指令解码，
+# 启用 PUSH1_DUP1 后执行结果 (不含 gas，融合函数有意少扣 gas) 与原版 Cancun 相同。
+
+import contextlib
+import io
+
+import pytest
+
+import fusion_config
+from custom_computation import FusedComputation
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+from fusion_plan import build_fusion_plan
+from rule_compiler import compile_rules, match_longest, rule_sequence
+
+
+PUSH1_DUP1 = {"rule_name": "PUSH1_DUP1", "sequence": (0x60, 0x80), "fused_opcode_id": 0xB1, "rule_id": 0}
+PUSH1_DUP1_ADD = {"rule_name": "PUSH1_DUP1_ADD", "sequence": (0x60, 0x80, 0x01), "fused_opcode_id": 0xB2, "rule_id": 1}
+PUSH2_JUMP = {"rule_name": "PUSH2_JUMP", "sequence": (0x61, 0x56), "fused_opcode_id": 0xB3, "rule_id": 2}
+
+
+def test_legacy_rules_decode_into_sequences():
+    assert rule_sequence(fusion_config.ALL_FUSION_RULES["SUB_MUL"]) == (0x03, 0x02)
+    assert rule_sequence(fusion_config.ALL_FUSION_RULES["PUSH1_DUP1"]) == (0x60, 0x80)
+    # pattern_opcodes 里的 PUSH 连同立即数算一条指令
+    legacy = {"rule_name": "ADD_PUSH1_JUMP", "trigger_opcode": 0x01, "pattern_opcodes": b"\x60\x56\x56"}
+    assert rule_sequence(legacy) == (0x01, 0x60, 0x56)
+
+
+def test_longest_match_wins():
+    trie = compile_rules([PUSH1_DUP1, PUSH1_DUP1_ADD])
+
+    assert match_longest(bytes.fromhex("60058001"), 0, trie) == (PUSH1_DUP1_ADD, 4)
+    assert match_longest(bytes.fromhex("60058002"), 0, trie) == (PUSH1_DUP1, 3)
+    assert match_longest(bytes.fromhex("600502"), 0, trie) == (None, 0)
+
+
+def test_push_immediates_are_not_instructions():
+    trie = compile_rules([PUSH1_DUP1, PUSH2_JUMP])
+
+    # 0x60 0x80 出现在 PUSH2 的立即数里，不是一条 PUSH1 DUP1
+    plan = build_fusion_plan(bytes.fromhex("6160805600"), trie)
+    assert [entry[2] for entry in plan] == [2, None, None, None, None]
+    assert plan[0][:2] == (0xB3, 4)
+    # 立即数被代码末尾截断的 PUSH 不参与融合
+    assert match_longest(bytes.fromhex("6100"), 0, compile_rules([PUSH2_JUMP])) == (None, 0)
+
+
+def test_invalid_rule_sets_are_rejected():
+    with pytest.raises(ValueError):
+        compile_rules([{"rule_name": "ADD", "sequence": (0x01,), "fused_opcode_id": 0xB4}])
+    with pytest.raises(ValueError):
+        compile_rules([PUSH1_DUP1, {**PUSH1_DUP1, "rule_name": "PUSH1_DUP1_AGAIN"}])
+
+
+def test_configure_rules_labels_each_rule():
+    computation_class = type("LabelFusedComputation", (FusedComputation,), {})
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        computation_class.configure_rules(["SUB_MUL", "CONST_FOLD", "STATIC_JUMPI", "STORAGE_MAPPING"])
+
+    assert (
+        "['SUB_MUL (SUB MUL)', 'CONST_FOLD (constant folding)', 'STATIC_JUMPI (static jump)', "
+        "'STORAGE_MAPPING (storage mapping)']"
+    ) in output.getvalue()
+
+
+CODES = [
+    # PUSH1 5 DUP1 ADD，结果写进内存返回
+    bytes.fromhex("6005800160005260206000f3"),
+    # PUSH2 的立即数恰好是 0x60 0x80 (PUSH1 DUP1)，不能被当成指令
+    bytes.fromhex("6001616080016000526020" "6000f3"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_rules_preserve_results(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    expected, actual = run_both(mode, ["PUSH1_DUP1"], str(tmp_path), CODES, transactions)
+
+    # PUSH1_DUP1 有意少扣 gas，只比较是否出错、返回值和日志
+    assert [outcome[1:4] for outcome in actual] == [outcome[1:4] for outcome in expected]
+    assert [outcome[1] for outcome in expected[:len(CODES)]] == [False, False]
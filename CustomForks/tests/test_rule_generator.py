@@ -0,0 +1,112 @@
+# test_rule_generator.py
+#
+# rule_generator 生成的规则使用 0x100 以上的融合 ID，注册后在每种执行方式下与原版 Cancun 的结果相同，
+# 代码里的未定义字节照常报错。
+
+import importlib.util
+
+import pytest
+
+import fusion_config
+from custom_computation import FusedComputation
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, fused_class, run_both
+from rule_generator import count_ngrams, emit_rules_module, free_fused_ids, score_candidates
+
+
+# (序列, 动态次数, 分数): PUSH1 MLOAD、PUSH1 JUMPI 与 PUSH1 ADD DUP1 MLOAD 生成融合函数
+# (最后一个的 PUSH1 ADD DUP1 内联合成的代码)，DUP1 ADD 由 fusion_synthesizer 合成
+CANDIDATES = [
+    ((0x60, 0x51), 1000, 1000),
+    ((0x80, 0x01), 900, 900),
+    ((0x60, 0x57), 800, 800),
+    ((0x60, 0x01, 0x80, 0x51), 700, 2100),
+]
+
+CODES = [
+    # PUSH1 0x40 MLOAD DUP1 ADD PUSH1 0 MSTORE PUSH1 1 PUSH1 0x0f JUMPI STOP STOP JUMPDEST 返回 0..0x20
+    bytes.fromhex("6040518001600052" "6001600f57" "0000" "5b60206000f3"),
+    # 未定义字节 0x0c 和 0xb0
+    bytes.fromhex("6001600201" "0c"),
+    bytes.fromhex("60016002600380" "b0"),
+    # PUSH1 1 | PUSH1 2 ADD DUP1 MLOAD | 写进内存返回；栈是空的时内联代码下溢
+    bytes.fromhex("6001" "6002018051" "600052" "60206000f3"),
+    bytes.fromhex("6002018051" "00"),
+]
+
+
+def _load_generated(tmp_path):
+    path = tmp_path / "generated_fusion_rules.py"
+    rules = emit_rules_module(CANDIDATES, str(path))
+    spec = importlib.util.spec_from_file_location("generated_fusion_rules", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return rules, module
+
+
+def test_ngrams_stop_at_jumps():
+    # PUSH1 PUSH1 JUMPI 之后跳到 pc 9 的 JUMPDEST，跨越跳转的窗口不计入
+    trace = [(0, 0x60), (2, 0x60), (4, 0x57), (9, 0x5B), (10, 0x80)]
+    counts = count_ngrams(trace, max_n=3)
+
+    assert counts[(0x60, 0x60, 0x57)] == 1
+    assert counts[(0x5B, 0x80)] == 1
+    assert (0x57, 0x5B) not in counts
+    # 停机指令不能进入融合序列
+    assert score_candidates({(0x60, 0x00): 500, (0x80, 0x01): 200}, min_count=100) == [((0x80, 0x01), 200, 200)]
+
+
+def test_pure_stack_runs_are_inlined(tmp_path):
+    _, module = _load_generated(tmp_path)
+    source = (tmp_path / "generated_fusion_rules.py").read_text(encoding="utf-8")
+
+    # PUSH1 ADD DUP1 内联合成的代码，只有 MLOAD 调用 opcode 对象；单条的 PUSH1 不内联
+    assert "# PUSH1 ADD DUP1: 由 fusion_synthesizer 合成" in source
+    assert "_OPCODES[0x01]" not in source and "_OPCODES[0x80]" not in source
+    assert source.count("_OPCODES[0x60]") == 2
+    assert module.GENERATED_LOGIC_FNS[0x103][0].__name__ == "fused_push1_add_dup1_mload"
+
+
+def test_generated_ids_are_outside_the_opcode_space(tmp_path):
+    rules, module = _load_generated(tmp_path)
+
+    fused_ids = [rule["fused_opcode_id"] for rule in rules.values()]
+    assert fused_ids == [0x100, 0x101, 0x102, 0x103]
+    assert set(module.GENERATED_LOGIC_FNS) == {0x100, 0x102, 0x103}
+    assert free_fused_ids(2, reserved=[0x100, 0x102]) == [0x101, 0x103]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_generated_rules_match_cancun(mode, tmp_path):
+    rules, module = _load_generated(tmp_path)
+
+    def register(computation_class):
+        computation_class.register_rules(module.GENERATED_FUSION_RULES, module.GENERATED_LOGIC_FNS)
+
+    # 第一份代码从 0 gas 起逐个 gas 执行到够用为止，覆盖每条指令 (和每个融合条目) 上的 OutOfGas
+    transactions = [(contract_address(0), b"", gas) for gas in range(0, 140)]
+    transactions += [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    transactions += [(contract_address(3), b"", gas) for gas in range(0, 40)]
+    expected, actual = run_both(mode, list(rules), str(tmp_path), CODES, transactions, setup=register)
+
+    assert not expected[139][1]
+    assert [outcome[1] for outcome in expected[140:145]] == [False, True, True, False, True]
+    assert actual == expected
+
+
+@pytest.mark.parametrize("fused_id", [0x0C, fusion_config.VIRTUAL_SUB_MUL_OPCODE])
+def test_register_rules_rejects_opcode_space_ids(fused_id):
+    rule = {"rule_name": "DUP1_ADD", "sequence": (0x80, 0x01), "fused_opcode_id": fused_id}
+    computation_class = type("RegisterFusedComputation", (FusedComputation,), {})
+
+    with pytest.raises(ValueError, match="opcode space"):
+        computation_class.register_rules({"DUP1_ADD": rule}, {})
+
+
+def test_register_rules_rejects_duplicate_ids(tmp_path):
+    rules, module = _load_generated(tmp_path)
+    computation_class = fused_class("main", [], str(tmp_path), [])
+    computation_class.register_rules(module.GENERATED_FUSION_RULES, module.GENERATED_LOGIC_FNS)
+    duplicate = {"rule_name": "DUP2_ADD", "sequence": (0x81, 0x01), "fused_opcode_id": 0x101}
+
+    with pytest.raises(ValueError, match="reuses"):
+        computation_class.register_rules({"DUP2_ADD": duplicate}, module.GENERATED_LOGIC_FNS)
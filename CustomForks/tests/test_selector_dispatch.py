@@ -0,0 +1,66 @@
+# test_selector_dispatch.py
+#
+# SELECTOR_DISPATCH 把 DUP1 PUSHn <selector> EQ PUSHm <dest> JUMPI 组成的比较链换成一次查表跳转，
+# 扣费与原链走到命中处 (或走完整条链) 完全一致；目标不是合法 JUMPDEST 的比较让链提前结束。
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+
+import fusion_config
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+from jumpdest_bitmap import build_jumpdest_bitmap
+from selector_dispatch import SelectorDispatchMatcher
+
+
+MATCHER = SelectorDispatchMatcher(
+    {**fusion_config.ALL_FUSION_RULES["SELECTOR_DISPATCH"], "rule_id": 0}, CancunComputation.opcodes
+)
+
+# CALLDATALOAD(0) >> 224，三个比较 (第二个选择器重复出现)，没有命中时 STOP；
+# 命中后把一个不同的值写进存储
+DISPATCH_CODE = bytes.fromhex(
+    "60003560e01c"
+    "8063aaaaaaaa14610028" "57"
+    "8063bbbbbbbb1461002f" "57"
+    "8063aaaaaaaa14610036" "57"
+    "00"
+    "5b600160005500" "5b600260005500" "5b600360005500"
+)
+
+
+def test_chain_becomes_one_lookup():
+    dispatches = MATCHER.find(DISPATCH_CODE, build_jumpdest_bitmap(DISPATCH_CODE))
+
+    assert list(dispatches) == [6]
+    fallthrough_pc, dispatch = dispatches[6]
+    assert fallthrough_pc == dispatch.fallthrough_pc == 0x27
+    # 每个比较 DUP1 PUSH4 EQ PUSH2 JUMPI = 3 + 3 + 3 + 3 + 10 gas，重复的选择器只保留第一个
+    assert dispatch.targets == {0xAAAAAAAA: (22, 0x28), 0xBBBBBBBB: (44, 0x2F)}
+    assert dispatch.miss_gas == 66
+
+
+def test_invalid_destination_ends_the_chain():
+    # 第二个比较的目标 0x0f 在 PUSH 立即数里，链只剩一个比较，不够成为分派器
+    code = bytes.fromhex("8063aaaaaaaa1461001757" "8063bbbbbbbb1461000f57" "005b00")
+    assert MATCHER.find(code, build_jumpdest_bitmap(code)) == {}
+
+
+CODES = [
+    DISPATCH_CODE,
+    # 栈是空的: 链的第一个 DUP1 下溢
+    bytes.fromhex("8063aaaaaaaa1461001757" "8063bbbbbbbb1461001757" "00" "5b00"),
+]
+
+SELECTORS = ["aaaaaaaa", "bbbbbbbb", "cccccccc", ""]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_dispatch_matches_cancun(mode, tmp_path):
+    transactions = [(contract_address(0), bytes.fromhex(data), AMPLE_GAS) for data in SELECTORS]
+    transactions.append((contract_address(1), b"", AMPLE_GAS))
+    # 每个 gas 上都会 OutOfGas 一次，包括分派链命中前后
+    transactions += [(contract_address(0), bytes.fromhex(SELECTORS[1]), gas) for gas in range(0, 120)]
+    expected, actual = run_both(mode, ["SELECTOR_DISPATCH"], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:5]] == [False, False, False, False, True]
+    assert actual == expected
@@ -0,0 +1,50 @@
+# test_static_jumps.py
+#
+# STATIC_JUMP / STATIC_JUMPI 只融合目标在分析期就合法的 PUSHn JUMP/JUMPI；目标不合法的照常逐条执行，
+# 由 JUMP/JUMPI 报错。执行结果 (包括每个 gas 上的 OutOfGas、栈下溢/上溢) 与原版 Cancun 相同。
+
+import pytest
+
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, fused_class, run_both
+from fusion_plan import build_fusion_plan
+
+JUMP_RULES = ["STATIC_JUMP", "STATIC_JUMPI"]
+
+
+def test_only_valid_targets_are_fused(tmp_path):
+    computation_class = fused_class("main", JUMP_RULES, str(tmp_path), [])
+    # PUSH1 4 JUMP | STOP | JUMPDEST PUSH1 1 PUSH1 0x0b JUMPI | 0x0b 在 PUSH 立即数里: PUSH1 0x5b PUSH0 JUMP
+    code = bytes.fromhex("600456" "00" "5b6001600b57" "605b5f56")
+    plan = build_fusion_plan(
+        code, computation_class._rule_trie, static_jumps=computation_class._static_jumps
+    )
+
+    fused = {pc: entry for pc, entry in enumerate(plan) if entry[2] is not None}
+    assert sorted(fused) == [0]
+    jump = fused[0][3]
+    assert (fused[0][1], jump.gas, jump.dest, jump.fallthrough_pc) == (None, 11, 4, 3)
+    # 目标不合法 (PUSH 立即数里的 0x5b) 的 PUSH1 0x0b JUMPI 和指向 PC 0 的 JUMP 都不融合
+    assert plan[7][2] is None and plan[12][2] is None
+
+
+CODES = [
+    # 循环 3 次: JUMPDEST 计数减一，不为零时静态 JUMPI 回到循环头，最后静态 JUMP 到结尾返回计数
+    bytes.fromhex("6003" "5b60019003" "80600257" "600f56" "00" "5b60005260206000f3"),
+    # JUMPI 的目标不合法但条件为 0 (不跳转)，以及条件不为 0 的不合法目标
+    bytes.fromhex("6000600357" "600160035700"),
+    # 栈是空的: JUMPI 的条件下溢
+    bytes.fromhex("600457" "005b00"),
+    # 栈满时 PUSH 上溢
+    bytes.fromhex("5f" * 1024 + "61040556" "5b00"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_static_jumps_match_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    transactions += [(contract_address(0), b"", gas) for gas in range(0, 160)]
+    expected, actual = run_both(mode, JUMP_RULES, str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:4]] == [False, True, True, True]
+    assert not expected[-1][1]
+    assert actual == expected
@@ -0,0 +1,151 @@
+# test_storage_mapping.py
+#
+# STORAGE_MAPPING 把 solc 的 mapping 访问 (MSTORE key、MSTORE slot、SHA3、[DUP1] SLOAD 或 SSTORE) 融合成一条指令，
+# 随分析结果写进磁盘缓存 (只记录最后的存储访问指令，读出时按代码重新合成)；
+# 读、写 mapping 和每个 gas 上的 OutOfGas 的执行结果都与原版 Cancun 相同。
+
+import contextlib
+import io
+from collections import OrderedDict
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+from eth_hash.auto import keccak
+
+from analysis_cache import encode_analysis
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, fused_class, run_both
+from fusion_plan import build_fusion_plan
+import storage_mapping
+from storage_mapping import MAPPING_FN_NAME, SLOAD_OPCODE, SSTORE_OPCODE, MappingSlotCache, StorageMapping
+
+
+MAPPING_RULES = ["STORAGE_MAPPING"]
+
+# calldata 的第一个字作为 key，算出 balances[key] 的存储位置 (slot 1):
+# PUSH1 0 CALLDATALOAD | PUSH1 0 SWAP1 DUP2 MSTORE PUSH1 1 PUSH1 0x20 MSTORE PUSH1 0x40 SWAP1 SHA3
+KEY_SLOT = "600035" "6000908152600160205260409020"
+RETURN_TOP = "60005260206000f3"
+
+CODES = [
+    # 读出 balances[key] 返回
+    bytes.fromhex(KEY_SLOT + "54" + RETURN_TOP),
+    # balances[key] += 1: DUP1 SLOAD PUSH1 1 ADD SWAP1 SSTORE
+    bytes.fromhex(KEY_SLOT + "8054600101905500"),
+    # 只有一次 MSTORE 的 SHA3 不是 mapping 访问
+    bytes.fromhex("600035600052" "60206000" "20" "54" + RETURN_TOP),
+    # balances[key] = 5: PUSH1 5 | 算出存储位置 | SSTORE
+    bytes.fromhex("6005" + KEY_SLOT + "5500"),
+]
+
+
+def test_mapping_accesses_are_fused(tmp_path):
+    computation_class = fused_class("main", MAPPING_RULES, str(tmp_path), [])
+    matcher = computation_class._storage_mapping
+
+    def fused_entries(code):
+        plan = build_fusion_plan(code, computation_class._rule_trie, storage_mapping=matcher)
+        return {pc: entry for pc, entry in enumerate(plan) if entry[2] is not None}
+
+    read, increment, assign = fused_entries(CODES[0]), fused_entries(CODES[1]), fused_entries(CODES[3])
+    assert sorted(read) == sorted(increment) == [3]
+    assert (read[3][1], read[3][3].access) == (18, SLOAD_OPCODE)
+    assert (increment[3][1], increment[3][3].access) == (19, SLOAD_OPCODE)
+    assert (sorted(assign), assign[5][1], assign[5][3].access) == ([5], 20, SSTORE_OPCODE)
+    assert fused_entries(CODES[2]) == {}
+    # 存储访问用的是 matcher 创建时取好的 fork 指令
+    assert read[3][3].access_fn is CancunComputation.opcodes[SLOAD_OPCODE]
+    assert assign[5][3].access_fn is CancunComputation.opcodes[SSTORE_OPCODE]
+
+    # 从磁盘缓存读出时按代码重新取得同一份合成源码；融合范围与代码对不上时报错
+    mapping = increment[3][3]
+    assert matcher.rebuild(CODES[1], 3, 19, SLOAD_OPCODE).source == mapping.source
+    assert matcher.rebuild(CODES[3], 5, 20, SSTORE_OPCODE).source == assign[5][3].source
+    for pc, end_pc, access in [
+        (3, 18, SLOAD_OPCODE),
+        (3, 19, None),
+        (3, 19, SSTORE_OPCODE),
+        (4, 19, SLOAD_OPCODE),
+        (3, len(CODES[1]) + 1, SLOAD_OPCODE),
+        (3, 19, 0x01),
+    ]:
+        with pytest.raises(ValueError):
+            matcher.rebuild(CODES[1], pc, end_pc, access)
+
+
+def _cached_class(cache_dir):
+    computation_class = fused_class("analysis_cache", MAPPING_RULES, cache_dir, [CODES[1]])
+    with contextlib.redirect_stdout(io.StringIO()):
+        computation_class.configure_engine(predecode_push=True)
+    return computation_class
+
+
+def _analyze(computation_class):
+    return computation_class._plan_cache.get_analysis(
+        CODES[1],
+        computation_class._rule_trie,
+        predecode_push=computation_class.predecode_push,
+        storage_mapping=computation_class._storage_mapping,
+    )
+
+
+def test_mappings_round_trip_through_the_disk_cache(tmp_path):
+    computation_class = _cached_class(str(tmp_path))
+    stored = _analyze(computation_class)
+    computation_class._reset_plan_cache()
+    loaded = _analyze(computation_class)
+
+    assert computation_class._plan_cache.disk_cache.loads == 1
+    stored_mapping, loaded_mapping = stored.plan[3][3], loaded.plan[3][3]
+    assert isinstance(loaded_mapping, StorageMapping)
+    assert loaded.plan[3][1] == stored.plan[3][1]
+    assert (loaded_mapping.source, loaded_mapping.access) == (stored_mapping.source, stored_mapping.access)
+    assert loaded_mapping.mapping_fn is stored_mapping.mapping_fn
+
+    # 记录的融合范围与代码对不上时当作没有缓存
+    plan = list(stored.plan)
+    opcode, next_pc, rule_id, mapping = plan[3]
+    plan[3] = (opcode, next_pc - 1, rule_id, mapping)
+    disk_cache = computation_class._plan_cache.disk_cache
+    with open(disk_cache.path(stored.code_hash), "wb") as f:
+        f.write(encode_analysis(CODES[1], plan, stored.jumpdests, None))
+    assert disk_cache.load(stored.code_hash, CODES[1]) is None
+
+
+def test_slot_cache_is_bounded():
+    slots = MappingSlotCache(max_size=2)
+    words = [index.to_bytes(32, "big") for index in range(3)]
+
+    assert slots.hash(words[0], words[1]) == keccak(words[0] + words[1])
+    assert slots.hash(words[0], words[1]) == keccak(words[0] + words[1])
+    slots.hash(words[1], words[1])
+    slots.hash(words[2], words[1])
+    assert (len(slots), slots.hits, slots.misses) == (2, 1, 3)
+
+
+
+def test_compiled_mappings_are_bounded(monkeypatch):
+    monkeypatch.setattr(storage_mapping, "_MAPPING_FNS", OrderedDict())
+    monkeypatch.setattr(storage_mapping, "MAPPING_CACHE_SIZE", 2)
+    sources = [f"def {MAPPING_FN_NAME}(computation):\n    return {value}\n" for value in range(3)]
+    mappings = [StorageMapping(source, None, None) for source in sources]
+
+    # 同一份源码共用编译好的函数，最久未使用的被淘汰，已经建好的 operand 不受影响
+    assert StorageMapping(sources[2], None, None).mapping_fn is mappings[2].mapping_fn
+    assert list(storage_mapping._MAPPING_FNS) == sources[1:]
+    assert [mapping.mapping_fn(None) for mapping in mappings] == [0, 1, 2]
+
+KEYS = [(7).to_bytes(32, "big"), (2 ** 160 - 1).to_bytes(32, "big")]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_mapping_accesses_match_cancun(mode, tmp_path):
+    transactions = [(contract_address(1), key, AMPLE_GAS) for key in KEYS + KEYS[:1]]
+    transactions += [(contract_address(index), key, AMPLE_GAS) for index in (0, 2, 3) for key in KEYS]
+    # 冷 SLOAD / SSTORE 上逐段出现 OutOfGas
+    transactions += [(contract_address(0), KEYS[0], gas) for gas in range(0, 2400, 25)]
+    transactions += [(contract_address(1), KEYS[1], gas) for gas in range(0, 24000, 250)]
+    transactions += [(contract_address(3), KEYS[1], gas) for gas in range(0, 24000, 250)]
+    expected, actual = run_both(mode, MAPPING_RULES, str(tmp_path), CODES, transactions)
+
+    assert not any(outcome[1] for outcome in expected[:9])
+    assert actual == expected
@@ -0,0 +1,68 @@
+# test_tiers.py
+#
+# 分层执行按 code hash 计数: 前几次用原生解释器，之后用计划表，再之后翻译执行；
+# 每一层的执行结果都与原版 Cancun 相同，层级切换记进 tier_metrics。
+
+import contextlib
+import io
+
+import pytest
+
+from custom_computation import FusedComputation
+from evm_diff import AMPLE_GAS, contract_address, fused_class, run_both, run_transactions
+
+
+CODES = [
+    # PUSH1 1 PUSH1 2 ADD PUSH1 3 MUL 写进内存返回
+    bytes.fromhex("6001600201600302" "600052" "60206000f3"),
+    # 没有调用过的代码
+    bytes.fromhex("00"),
+]
+
+
+def test_executions_climb_the_tiers(tmp_path):
+    computation_class = fused_class("tiers", [], str(tmp_path), CODES)
+
+    run_transactions(computation_class, CODES, [(contract_address(0), b"", AMPLE_GAS)] * 4)
+
+    assert computation_class.tier_metrics == {
+        "interpreter": 1,
+        "fused": 1,
+        "compiled": 2,
+        "interpreter->fused": 1,
+        "fused->compiled": 1,
+    }
+
+
+def test_every_tier_matches_cancun(tmp_path):
+    # 同一份代码从 0 gas 起逐个 gas 执行，依次经过三个层级
+    transactions = [(contract_address(0), b"", gas) for gas in range(0, 40)]
+    expected, actual = run_both("tiers", [], str(tmp_path), CODES, transactions)
+
+    assert not expected[-1][1]
+    assert actual == expected
+
+
+@pytest.mark.parametrize("thresholds", [(None, 2), (-1, None), (3, 2)])
+def test_invalid_thresholds_are_rejected(thresholds):
+    computation_class = type("TierFusedComputation", (FusedComputation,), {})
+
+    with pytest.raises(ValueError):
+        computation_class.configure_tiers(*thresholds)
+
+
+def test_loops_are_chosen_at_configure_time(tmp_path):
+    computation_class = fused_class("tiers", [], str(tmp_path), CODES)
+    assert (computation_class._loop, computation_class._fused_loop) == ("_main_loop", "_main_loop")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        computation_class.configure_engine(translate_blocks=True)
+        computation_class.configure_traces(2)
+    # 第二层按 trace 执行，不分层时翻译执行优先
+    assert (computation_class._loop, computation_class._fused_loop) == ("_translated_loop", "_trace_loop")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        computation_class.configure_engine(block_gas_precharge=True)
+    assert (computation_class._loop, computation_class._fused_loop) == ("_block_loop", "_block_loop")
+    # 父类的选择不受子类配置影响
+    assert FusedComputation._loop == "_main_loop"
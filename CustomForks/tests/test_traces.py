@@ -0,0 +1,41 @@
+# test_traces.py
+#
+# configure_traces 打开后，向后跳转到同一目标达到阈值的循环被记录并编译成 trace；
+# trace 执行的结果与原版 Cancun 相同，循环条件变化、gas 不够时交给解释器继续执行。
+
+from evm_diff import AMPLE_GAS, contract_address, fused_class, run_both, run_transactions
+
+
+def _sum_loop(count: int) -> bytes:
+    # acc = 0; i = count; while i: acc += i; i -= 1，结果写进内存返回。循环头是 pc 4 的 JUMPDEST
+    return bytes.fromhex(
+        "6000" f"60{count:02x}"
+        "5b" "80" "15" "6015" "57" "90" "81" "01" "90" "6001" "90" "03" "6004" "56"
+        "5b" "50" "600052" "60206000f3"
+    )
+
+
+CODES = [_sum_loop(20), _sum_loop(3)]
+
+
+def test_hot_loop_is_compiled(tmp_path):
+    computation_class = fused_class("traces", [], str(tmp_path), CODES)
+    computations = []
+
+    run_transactions(computation_class, CODES, [(contract_address(0), b"", AMPLE_GAS)], computations)
+
+    assert int.from_bytes(computations[0].output, "big") == sum(range(21))
+    analysis = computation_class._plan_cache._analyses[CODES[0]]
+    assert analysis.loop_counts == {4: 1}
+    assert analysis.traces[4] is not None
+
+
+def test_traced_loops_match_cancun(tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    # 循环执行到一半时 gas 用完: trace 把 PC 交还给解释器，在原来的那条指令上报错
+    transactions += [(contract_address(1), b"", gas) for gas in range(0, 210)]
+    expected, actual = run_both("traces", [], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:2]] == [False, False]
+    assert not expected[-1][1]
+    assert actual == expected
@@ -0,0 +1,51 @@
+# test_unchecked_stack.py
+#
+# 基本块记录入口处需要的最小栈深度和块内的最大栈增长；块入口检查一次栈高度后改用免检查的栈操作，
+# 栈不够或栈满的块照常逐条检查，下溢/上溢仍在原来的那条指令上报错，结果与原版 Cancun 相同。
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+
+from basic_blocks import build_block_table
+from evm_diff import AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+from fusion_plan import build_fusion_plan
+from rule_compiler import compile_rules
+
+
+def test_blocks_record_stack_bounds():
+    # ADD DUP2 SWAP1 POP PUSH1 1 PUSH1 2 | JUMPDEST POP POP POP STOP
+    code = bytes.fromhex("0181905060016002" "5b50505000")
+    plan = build_fusion_plan(code, compile_rules([]))
+
+    entries = build_block_table(code, plan, CancunComputation.opcodes, []).entries
+
+    # ADD 之后 DUP2 还要再往下读一个元素，所以入口需要三个；两条 PUSH 之后比入口多一个
+    assert entries[0][1:] == (3, 1)
+    # 三个 POP 需要三个元素，栈不增长
+    assert entries[8][1:] == (3, 0)
+
+
+CODES = [
+    bytes.fromhex("01"),
+    bytes.fromhex("600101"),
+    bytes.fromhex("60019050"),
+    bytes.fromhex("6001600201010100"),
+    bytes.fromhex("5f" * 1025),
+    bytes.fromhex("5f" * 1024 + "80"),
+    bytes.fromhex("5f" * 1023 + "6001600201"),
+    bytes.fromhex("5f" * 1022 + "600160020100"),
+    bytes.fromhex("5f" * 1022 + "60019050" "600200"),
+    # 每次循环压入一个元素，第 1025 个元素上溢
+    bytes.fromhex("5b5f600056"),
+    # 块内正常执行的栈操作: DUP、SWAP、算术和比较，结果写进内存返回
+    bytes.fromhex("600560038181900302811060005260206000f3"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_stack_errors_match_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    expected, actual = run_both(mode, [], str(tmp_path), CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:len(CODES)]] == [True] * 7 + [False, False, True, False]
+    assert actual == expected
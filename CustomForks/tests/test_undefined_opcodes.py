@@ -0,0 +1,54 @@
+# test_undefined_opcodes.py
+#
+# 代码里的未定义字节 (包括与融合操作码 ID 相同的 0xb0..0xb9) 在每种执行方式下都必须像原版一样
+# 抛出 InvalidInstruction、耗尽 gas，不能执行到融合逻辑。
+
+import pytest
+from eth.vm.forks.cancun.computation import CancunComputation
+
+from evm_diff import ALL_RULES, AMPLE_GAS, ENGINE_MODES, contract_address, run_both
+
+
+# 与内置融合操作码 ID 相同的 0xb0..0xbf，以及其余几段未定义区间里各取一个
+UNDEFINED_OPCODES = [opcode for opcode in range(0xB0, 0xC0)] + [0x0C, 0x1E, 0x21, 0x4B, 0xA5, 0xEF, 0xF6, 0xFC]
+
+
+def _undefined_opcode_codes(opcode: int):
+    return [
+        # 栈上有三个值，融合的 SUB_MUL 能够执行
+        bytes([0x60, 0x01, 0x60, 0x02, 0x60, 0x03, opcode]) + bytes.fromhex("60005260206000f3"),
+        # 静态跳转到 JUMPDEST，块的第一条指令就是未定义字节
+        bytes([0x60, 0x04, 0x56, 0x00, 0x5B, opcode, 0x00]),
+    ]
+
+
+CODES = [code for opcode in UNDEFINED_OPCODES for code in _undefined_opcode_codes(opcode)]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_undefined_opcodes_match_cancun(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(CODES))]
+    expected, actual = run_both(mode, ALL_RULES, str(tmp_path), CODES, transactions)
+
+    assert all(opcode not in CancunComputation.opcodes for opcode in UNDEFINED_OPCODES)
+    assert all(outcome[1] for outcome in expected)
+    for code, expected_outcome, actual_outcome in zip(CODES, expected, actual):
+        assert actual_outcome == expected_outcome, code.hex()
+
+
+# 合成规则 SWAP1_POP / PUSH1_ADD 的融合 ID (0xb2 / 0xb3) 出现在代码里，以及两条规则真正命中的代码
+SYNTHESIZED_RULES = ["SWAP1_POP", "PUSH1_ADD"]
+SYNTHESIZED_CODES = [
+    bytes.fromhex("60016002b260005260206000f3"),
+    bytes.fromhex("60016002b360005260206000f3"),
+    bytes.fromhex("6001600290506005016000526020" "6000f3"),
+]
+
+
+@pytest.mark.parametrize("mode", list(ENGINE_MODES))
+def test_synthesized_fused_ids_are_not_opcodes(mode, tmp_path):
+    transactions = [(contract_address(index), b"", AMPLE_GAS) for index in range(len(SYNTHESIZED_CODES))]
+    expected, actual = run_both(mode, SYNTHESIZED_RULES, str(tmp_path), SYNTHESIZED_CODES, transactions)
+
+    assert [outcome[1] for outcome in expected[:3]] == [True, True, False]
+    assert actual == expected
@@ -0,0 +1,198 @@
+# trace_compiler.py
+#
+# 热点循环的 trace 编译 (configure_traces 打开时由 FusedComputation._trace_loop 使用)。
+#
+# 像 DeployContract/main.py 里 AddMulti 那样的循环，同一条向后跳转要执行上万次。
+# FusedComputation 按 (code hash, 跳转目标 PC) 统计向后跳转的次数，达到阈值后:
+#   1. record_trace 逐条执行一遍循环体，记下从循环头回到循环头实际走过的指令 PC
+#   2. compile_trace 把这条 trace 翻译成一个 Python 函数，函数里用 while True 反复执行循环体:
+#      - 只做栈上纯计算的连续指令用 fusion_synthesizer 合成，中间值放在局部变量里，立即数写成常量
+#      - 每个跳转都带一个守卫 (guard): 实际走向与记录时不同 (条件变了、动态目标变了) 时，
+#        把 PC 摆到实际的下一条指令并返回，交给解释器继续执行
+#      - 剩余 gas 不够一整段、栈高度不满足静态跳转的要求时，把 PC 摆到这一段的开头并返回，
+#        由解释器逐条执行并在原来的那条指令上报错
+# trace 随 CodeAnalysis 按 code hash 缓存，同一个合约的后续交易直接使用。
+
+from typing import Callable, Dict, List, Optional
+
+from eth.abc import ComputationAPI, OpcodeAPI
+
+from aot_transpiler import HALTING_OPCODES, JUMP_OPCODE, JUMPI_OPCODE, PC_OPCODE
+from block_translator import MIN_TRANSLATED_LENGTH
+from fusion_synthesizer import PUSH0_OPCODE, compile_synthesized, is_synthesizable_opcode, synthesize_source
+from rule_compiler import PUSH32_OPCODE, push_data_size
+from jumpdest_bitmap import JUMPDEST_BITMAPS, is_jump_destination
+
+
+# 向后跳转到同一个目标的次数达到这个值时开始记录 trace
+DEFAULT_TRACE_THRESHOLD = 50
+
+# 一条 trace 最多这么多条指令，超过时放弃 (例如循环体里还套着循环)
+MAX_TRACE_LENGTH = 2000
+
+# OutOfGas 等报错里显示的名字
+TRACE_MNEMONIC = "TRACE"
+
+# 编译好的 trace: fn(computation)，返回时 code.program_counter 是解释器接着执行的位置
+TraceFn = Callable[[ComputationAPI], None]
+
+
+def record_trace(computation: ComputationAPI, head_pc: int, opcode_lookup: Dict[int, OpcodeAPI]) -> Optional[List[int]]:
+    """
+    从循环头 head_pc 起逐条执行，直到再次回到 head_pc，返回走过的指令 PC (第一项是 head_pc)。
+
+    遇到停机指令、未定义的指令、越过代码末尾或 trace 太长时返回 None，
+    这时还没执行的指令留在 code.program_counter 处，由调用方照常继续执行。
+    """
+    code = computation.code
+    raw_code = code._raw_code_bytes
+    code_len = len(raw_code)
+    trace: List[int] = []
+    while len(trace) < MAX_TRACE_LENGTH:
+        pc = code.program_counter
+        if pc >= code_len:
+            return None
+        if trace and pc == head_pc:
+            return trace
+        opcode = raw_code[pc]
+        if opcode in HALTING_OPCODES or opcode not in opcode_lookup:
+            return None
+        trace.append(pc)
+        code.program_counter = pc + 1
+        opcode_lookup[opcode](computation)
+    return None
+
+
+def _static_jump_pcs(code: bytes, trace: List[int]) -> Dict[int, int]:
+    """trace 里 PUSHn <dest> JUMP/JUMPI 的 PUSH 在 trace 中的下标 -> 跳转目标。"""
+    static_jumps: Dict[int, int] = {}
+    for index in range(len(trace) - 1):
+        pc = trace[index]
+        opcode = code[pc]
+        jump_pc = pc + 1 + push_data_size(opcode)
+        if (
+            PUSH0_OPCODE <= opcode <= PUSH32_OPCODE
+            and trace[index + 1] == jump_pc
+            and code[jump_pc] in (JUMP_OPCODE, JUMPI_OPCODE)
+        ):
+            static_jumps[index] = int.from_bytes(code[pc + 1:jump_pc], "big")
+    return static_jumps
+
+
+def trace_source(code: bytes, trace: List[int], opcode_lookup: Dict[int, OpcodeAPI]) -> str:
+    """生成 trace 函数的源码 (包括它用到的合成函数)，函数名为 trace_<循环头 PC>。"""
+    head_pc = trace[0]
+    jumpdests = JUMPDEST_BITMAPS.get(code)
+    static_jumps = _static_jump_pcs(code, trace)
+    # 下标 i 处指令执行完之后实际走到的 PC；最后一条指令回到循环头
+    successors = trace[1:] + [head_pc]
+
+    run_sources: List[str] = []
+    body: List[str] = []
+
+    def bail(pc: int, indent: str = "        ") -> None:
+        # 退出 trace: 把 PC 摆到解释器接着执行的位置
+        body.extend([f"{indent}    code.program_counter = {pc}", f"{indent}    return"])
+
+    index = 0
+    trace_len = len(trace)
+    while index < trace_len:
+        pc = trace[index]
+        opcode = code[pc]
+        data_size = push_data_size(opcode)
+
+        # 连续的纯计算指令 (不包括静态跳转前面的 PUSH) 合成一个 run
+        run_end = index
+        while (
+            run_end < trace_len
+            and run_end not in static_jumps
+            and is_synthesizable_opcode(code[trace[run_end]])
+            and trace[run_end] + 1 + push_data_size(code[trace[run_end]]) <= len(code)
+        ):
+            run_end += 1
+        if run_end - index >= MIN_TRANSLATED_LENGTH:
+            sequence = tuple(code[run_pc] for run_pc in trace[index:run_end])
+            immediates = tuple(
+                code[run_pc + 1:run_pc + 1 + push_data_size(code[run_pc])] if push_data_size(code[run_pc]) else None
+                for run_pc in trace[index:run_end]
+            )
+            run_gas = sum(opcode_lookup[run_opcode].gas_cost for run_opcode in sequence)
+            run_sources.append(synthesize_source(f"run_{index}", sequence, opcode_lookup, TRACE_MNEMONIC, immediates))
+            body.append(f"        if gas_meter.gas_remaining < {run_gas}:")
+            bail(pc)
+            body.append(f"        run_{index}(computation)")
+            index = run_end
+            continue
+
+        if index in static_jumps:
+            # PUSHn <dest> JUMP/JUMPI: 目标固定，JUMPI 只需要检查条件是否与记录时相同
+            dest = static_jumps[index]
+            jump_pc = pc + 1 + data_size
+            jump_opcode = code[jump_pc]
+            jump_gas = opcode_lookup[opcode].gas_cost + opcode_lookup[jump_opcode].gas_cost
+            successor = successors[index + 1]
+            # 记录时没有跳转的 JUMPI，目标可能并不合法，这种情况交给原指令校验
+            if jump_opcode == JUMP_OPCODE or is_jump_destination(jumpdests, dest):
+                body.append("        values = computation._stack.values")
+                if jump_opcode == JUMP_OPCODE:
+                    body.append(f"        if gas_meter.gas_remaining < {jump_gas} or len(values) >= STACK_LIMIT:")
+                else:
+                    body.append(
+                        f"        if gas_meter.gas_remaining < {jump_gas} or not values or len(values) >= STACK_LIMIT:"
+                    )
+                bail(pc)
+                body.append(f"        gas_meter.consume_gas({jump_gas}, reason={opcode_lookup[jump_opcode].mnemonic!r})")
+                if jump_opcode == JUMPI_OPCODE:
+                    body += [
+                        "        condition = values.pop()",
+                        "        if condition.__class__ is bytes:",
+                        "            condition = int.from_bytes(condition, 'big')",
+                    ]
+                    if successor == dest:
+                        body.append("        if not condition:")
+                        bail(jump_pc + 1, "            ")
+                    else:
+                        body.append("        if condition:")
+                        bail(dest, "            ")
+                index += 2
+                continue
+
+        if opcode in (JUMP_OPCODE, JUMPI_OPCODE):
+            # 动态跳转: 由原指令校验目标并设置 PC，走向与记录时不同就退出
+            body += [
+                f"        code.program_counter = {pc + 1}",
+                f"        op_{opcode:02x}(computation)",
+                f"        if code.program_counter != {successors[index]}:",
+                "            return",
+            ]
+            index += 1
+            continue
+
+        if data_size or opcode == PC_OPCODE:
+            # 需要从代码流读取立即数或当前 PC 的指令
+            body.append(f"        code.program_counter = {pc + 1}")
+        body.append(f"        op_{opcode:02x}(computation)  # {opcode_lookup[opcode].mnemonic}")
+        index += 1
+
+    lines = []
+    for run_source in run_sources:
+        lines += [run_source, ""]
+    lines += [
+        f"def trace_{head_pc}(computation):",
+        "    code = computation.code",
+        "    gas_meter = computation._gas_meter",
+        "    while True:",
+    ]
+    lines += body
+    return "\n".join(lines) + "\n"
+
+
+def compile_trace(code: bytes, trace: List[int], opcode_lookup: Dict[int, OpcodeAPI]) -> TraceFn:
+    """把 record_trace 记录的 trace 编译成函数。"""
+    head_pc = trace[0]
+    source = trace_source(code, trace, opcode_lookup)
+    op_globals = {f"op_{opcode:02x}": opcode_fn for opcode, opcode_fn in opcode_lookup.items()}
+    namespace = compile_synthesized(source, f"<trace {head_pc}>", op_globals)
+    trace_fn = namespace[f"trace_{head_pc}"]
+    trace_fn.source = source
+    return trace_fn
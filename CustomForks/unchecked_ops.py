@@ -0,0 +1,233 @@
+# unchecked_ops.py
+#
+# 免检查的栈操作版本，只能在“基本块入口已经校验过栈高度、并且已经预扣过静态 gas”
+# 的情况下使用。
+#
+# 与 OpcodeFucntionsInPyEVM 中的原版逻辑相比，这里的函数:
+#   - 直接操作 Stack.values 列表，不做下溢/上溢检查，也没有 try/except
+#   - 不扣 gas (静态 gas 已经在块入口一次性扣过)
+#   - 保持与原版完全相同的栈元素表示 (PUSH 压入 bytes，运算结果压入 int)
+# 签名统一为 fn(computation, values)，values 即 computation._stack.values。
+
+from typing import Callable, Dict, List, Union
+
+from eth import constants
+from eth.abc import ComputationAPI
+
+
+UINT_256_MAX = constants.UINT_256_MAX
+
+StackValues = List[Union[int, bytes]]
+UncheckedOp = Callable[[ComputationAPI, StackValues], None]
+
+
+def _push_fn(size: int) -> UncheckedOp:
+    def push(computation: ComputationAPI, values: StackValues) -> None:
+        raw_value = computation.code.read(size)
+        if len(raw_value) == size:
+            values.append(raw_value)
+        else:
+            values.append(raw_value.ljust(size, b"\x00"))
+
+    return push
+
+
+def push0(computation: ComputationAPI, values: StackValues) -> None:
+    values.append(b"")
+
+
+def _dup_fn(position: int) -> UncheckedOp:
+    def dup(computation: ComputationAPI, values: StackValues) -> None:
+        values.append(values[-position])
+
+    return dup
+
+
+def _swap_fn(position: int) -> UncheckedOp:
+    idx = -position - 1
+
+    def swap(computation: ComputationAPI, values: StackValues) -> None:
+        values[-1], values[idx] = values[idx], values[-1]
+
+    return swap
+
+
+def pop(computation: ComputationAPI, values: StackValues) -> None:
+    del values[-1]
+
+
+def jumpdest(computation: ComputationAPI, values: StackValues) -> None:
+    pass
+
+
+#
+# 二元运算: 栈顶是左操作数 (与 stack_pop_ints(2) 的返回顺序一致)，
+# 结果写回原来第二个元素的位置，省掉一次 pop + append。
+#
+def add(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = (left + right) & UINT_256_MAX
+
+
+def sub(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = (left - right) & UINT_256_MAX
+
+
+def mul(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = (left * right) & UINT_256_MAX
+
+
+def div(computation: ComputationAPI, values: StackValues) -> None:
+    numerator = values.pop()
+    denominator = values[-1]
+    if numerator.__class__ is bytes:
+        numerator = int.from_bytes(numerator, "big")
+    if denominator.__class__ is bytes:
+        denominator = int.from_bytes(denominator, "big")
+    values[-1] = 0 if denominator == 0 else numerator // denominator
+
+
+def mod(computation: ComputationAPI, values: StackValues) -> None:
+    value = values.pop()
+    modulus = values[-1]
+    if value.__class__ is bytes:
+        value = int.from_bytes(value, "big")
+    if modulus.__class__ is bytes:
+        modulus = int.from_bytes(modulus, "big")
+    values[-1] = 0 if modulus == 0 else value % modulus
+
+
+def lt(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = 1 if left < right else 0
+
+
+def gt(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = 1 if left > right else 0
+
+
+def eq(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = 1 if left == right else 0
+
+
+def iszero(computation: ComputationAPI, values: StackValues) -> None:
+    value = values[-1]
+    if value.__class__ is bytes:
+        value = int.from_bytes(value, "big")
+    values[-1] = 1 if value == 0 else 0
+
+
+def and_op(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = left & right
+
+
+def or_op(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = left | right
+
+
+def xor(computation: ComputationAPI, values: StackValues) -> None:
+    left = values.pop()
+    right = values[-1]
+    if left.__class__ is bytes:
+        left = int.from_bytes(left, "big")
+    if right.__class__ is bytes:
+        right = int.from_bytes(right, "big")
+    values[-1] = left ^ right
+
+
+def not_op(computation: ComputationAPI, values: StackValues) -> None:
+    value = values[-1]
+    if value.__class__ is bytes:
+        value = int.from_bytes(value, "big")
+    values[-1] = UINT_256_MAX - value
+
+
+def shl(computation: ComputationAPI, values: StackValues) -> None:
+    shift_length = values.pop()
+    value = values[-1]
+    if shift_length.__class__ is bytes:
+        shift_length = int.from_bytes(shift_length, "big")
+    if value.__class__ is bytes:
+        value = int.from_bytes(value, "big")
+    values[-1] = 0 if shift_length >= 256 else (value << shift_length) & UINT_256_MAX
+
+
+def shr(computation: ComputationAPI, values: StackValues) -> None:
+    shift_length = values.pop()
+    value = values[-1]
+    if shift_length.__class__ is bytes:
+        shift_length = int.from_bytes(shift_length, "big")
+    if value.__class__ is bytes:
+        value = int.from_bytes(value, "big")
+    values[-1] = 0 if shift_length >= 256 else value >> shift_length
+
+
+UNCHECKED_OPS: Dict[int, UncheckedOp] = {
+    0x01: add,
+    0x02: mul,
+    0x03: sub,
+    0x04: div,
+    0x06: mod,
+    0x10: lt,
+    0x11: gt,
+    0x14: eq,
+    0x15: iszero,
+    0x16: and_op,
+    0x17: or_op,
+    0x18: xor,
+    0x19: not_op,
+    0x1B: shl,
+    0x1C: shr,
+    0x50: pop,
+    0x5B: jumpdest,
+    0x5F: push0,
+}
+UNCHECKED_OPS.update({0x60 + i: _push_fn(i + 1) for i in range(32)})
+UNCHECKED_OPS.update({0x80 + i: _dup_fn(i + 1) for i in range(16)})
+UNCHECKED_OPS.update({0x90 + i: _swap_fn(i + 1) for i in range(16)})